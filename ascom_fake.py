@@ -2,9 +2,9 @@
 Simulatore di driver ASCOM per linux
 """
 from threading import Thread
-import time
 
 import astro
+import simclock
 
 RESOLUTION = 0.4
 TIMESTEP = 0.02
@@ -32,7 +32,8 @@ class Dispatch(Thread):
         self.start()
 
     def run(self):
-        print("Simulatore cupola attivo")
+        print("Simulatore cupola attivo -", simclock.CLOCK)
+        simclock.CLOCK.attach()
         while True:
             if self.stop:
                 break
@@ -53,7 +54,8 @@ class Dispatch(Thread):
                 print("AZ: ", self.Azimuth, "-", status)
             self._counter = (self._counter+1)%PRINT_COUNT
 
-            time.sleep(TIMESTEP)
+            simclock.sleep(TIMESTEP)
+        simclock.CLOCK.detach()
         print("Simulatore cupola terminato")
 
     def AbortSlew(self):
@@ -28,6 +28,14 @@ from __future__ import print_function
 import time
 from math import sin, cos, sqrt, asin, atan2, pi, fmod
 
+import simclock
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 DEG_TO_RAD = 0.017453292519943295   # PI/180.
 RAD_TO_DEG = 57.29577951308232      # 180./PI
 
@@ -82,12 +90,66 @@ def loc_st(year, mon, day, hour, mins, secs, utc_offset=0, lon_rad=0.0):
     return locst
 
 def loc_st_now(lon_rad=OPC.lon_rad):
-    "Calcolo tempo sidereo locale qui e ora"
-    loct = time.localtime()
+    "Calcolo tempo sidereo locale qui e ora (ora dell'orologio simulato, vedi simclock.py)"
+    loct = simclock.localtime()
     utc_offset = -time.timezone/3600.+loct.tm_isdst
     return loc_st(loct[0], loct[1], loct[2], loct[3],
                   loct[4], loct[5], utc_offset, lon_rad)
 
+REANCHOR = 600.    # Intervallo di ricalcolo completo del tempo sidereo (sec)
+
+class SiderealClock:
+    """
+Tempo sidereo locale a basso costo
+
+Il tempo sidereo medio di Greenwich viene calcolato (data giuliana completa)
+all'istante di riferimento, ricavato dal tempo UTC (indipendente da fuso
+orario e ora legale), e poi fatto avanzare dal tempo monotono moltiplicato
+per TCIV_TO_TSID. Il calcolo completo viene ripetuto ogni reanchor secondi
+e quando cambia la configurazione dell'orologio simulato (vedi simclock.py).
+
+A differenza di loc_st_now() usa anche la frazione di secondo.
+
+lon_rad:  longitudine (radianti, positiva a est)
+reanchor: intervallo di ricalcolo completo (sec)
+"""
+    def __init__(self, lon_rad=OPC.lon_rad, reanchor=REANCHOR):
+        self.lon_rad = lon_rad
+        self.reanchor = reanchor
+        self._anchor = None
+        self.anchor()
+
+    def anchor(self):
+        "Ricalcola il tempo sidereo di riferimento"
+        clock = simclock.CLOCK
+        generation = clock.generation
+        tmono = clock.monotonic()
+        tnow = clock.time()
+        utc = time.gmtime(tnow)
+        secs = utc.tm_sec+(tnow-int(tnow))
+        gmst = tsid_grnw(utc.tm_year, utc.tm_mon, utc.tm_mday, utc.tm_hour, utc.tm_min, secs)
+        self._anchor = (tmono, gmst, generation)
+
+    def gmst(self):
+        "Tempo sidereo medio di Greenwich (ore)"
+        tmono, gmst, generation = self._anchor
+        clock = simclock.CLOCK
+        elapsed = clock.monotonic()-tmono
+        if elapsed < 0 or elapsed > self.reanchor or generation != clock.generation:
+            self.anchor()
+            tmono, gmst = self._anchor[:2]
+            elapsed = clock.monotonic()-tmono
+        return fmod(gmst+elapsed*TCIV_TO_TSID/3600., 24.)
+
+    def lst(self, lon_rad=None):
+        "Tempo sidereo locale (ore) per la longitudine data (default: self.lon_rad)"
+        if lon_rad is None:
+            lon_rad = self.lon_rad
+        locst = fmod(self.gmst()+lon_rad*RAD_TO_HOUR, 24.)
+        if locst < 0:
+            locst += 24.
+        return locst
+
 # sin(ALT) = sin(DEC)*sin(LAT)+cos(DEC)*cos(LAT)*cos(HA)
 # ALT = asin(ALT)
 # cos(ALT) = sqrt(1.-sin(ALT)**2)
@@ -130,6 +192,94 @@ def eq_coords(az_rad, el_rad):
     de_rad = asin(sin_de)
     return ha_rad, de_rad
 
+# Versioni vettoriali (richiedono numpy)
+#
+# Accettano array (o scalari, combinati secondo le regole di broadcast di numpy)
+# e riportano array. Le formule e l'ordine delle operazioni sono gli stessi
+# delle versioni scalari: le differenze sono dovute solo alle implementazioni
+# delle funzioni trigonometriche (dell'ordine di 1e-15). Dove la versione scalare
+# genera un'eccezione (es: telescopio allo zenit) il risultato è NaN.
+# Per il confronto dei tempi di calcolo usare: vectortest.py
+
+def _check_numpy(name):
+    "Verifica disponibilità di numpy"
+    if not HAS_NUMPY:
+        raise ImportError("%s richiede numpy"%name)
+
+def jul_date_many(year, mon, day, hour, mins, secs, utc_offset=0):
+    "Calcolo data giuliana per array di tempi civili (vedi jul_date)"
+    _check_numpy("jul_date_many")
+    year = np.asarray(year, dtype=np.float64)
+    mon = np.asarray(mon, dtype=np.float64)
+    early = mon <= 2
+    year = np.where(early, year-1, year)
+    mon = np.where(early, mon+12, mon)
+    aaa = np.trunc(year/100)
+    bbb = 2-aaa+np.trunc(aaa/4)
+    jd0 = np.trunc(365.25*(year+4716))+np.trunc(30.6*(mon+1))+day+bbb-1524.5
+    hoff = (hour+mins/60.+secs/3600.-utc_offset)/24.
+    return jd0+hoff
+
+def tsid_grnw_many(year, mon, day, hour, mins, secs, utc_offset=0):
+    "Calcolo tempo sidereo medio di Greenwhich per array di tempi (vedi tsid_grnw)"
+    jd2000 = jul_date_many(year, mon, day, hour, mins, secs, utc_offset)-2451545.0
+    gmst = np.fmod(18.697374558+24.06570982441908*jd2000, 24.)
+    return np.where(gmst < 0, gmst+24., gmst)
+
+def loc_st_many(year, mon, day, hour, mins, secs, utc_offset=0, lon_rad=0.0):
+    "Calcolo tempo sidereo locale per array di tempi (vedi loc_st)"
+    gmst = tsid_grnw_many(year, mon, day, hour, mins, secs, utc_offset)
+    locst = np.fmod(gmst+lon_rad*RAD_TO_HOUR, 24.)
+    return np.where(locst < 0, locst+24., locst)
+
+def time_fields(tstamps):
+    """
+Converte array di tempi (secondi dall'epoca, come time.time()) in componenti
+di tempo civile locale (year, mon, day, hour, mins, secs, utc_offset), come
+usate da loc_st_now(), da passare a jul_date_many() e loc_st_many()"""
+    _check_numpy("time_fields")
+    fields = [time.localtime(tstamp) for tstamp in np.ravel(tstamps)]
+    shape = np.shape(tstamps)
+    ret = [np.array([fld[idx] for fld in fields], dtype=np.float64).reshape(shape)
+           for idx in range(6)]
+    ret.append(np.array([-time.timezone/3600.+fld.tm_isdst for fld in fields],
+                        dtype=np.float64).reshape(shape))
+    return ret
+
+def az_coords_many(ha_rad, de_rad):
+    "Converte array di coordinate equatoriali in altoazimutali (vedi az_coords)"
+    _check_numpy("az_coords_many")
+    ha_rad = np.asarray(ha_rad, dtype=np.float64)
+    de_rad = np.asarray(de_rad, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sin_de = np.sin(de_rad)
+        sin_el = sin_de*OPC.sin_lat+np.cos(de_rad)*OPC.cos_lat*np.cos(ha_rad)
+        cos_el = np.sqrt(1.-sin_el*sin_el)
+        sin_ha = np.sin(ha_rad)
+        sin_az = -np.cos(de_rad)*sin_ha/cos_el
+        cos_az = (sin_de-OPC.sin_lat*sin_el)/(OPC.cos_lat*cos_el)
+        el_rad = np.arcsin(sin_el)
+        az_rad = np.mod(np.arctan2(sin_az, cos_az), PI2)
+        az_rad = np.where(cos_el == 0., np.nan, az_rad)
+    return az_rad, el_rad
+
+def eq_coords_many(az_rad, el_rad):
+    "Converte array di coordinate altoazimutali in equatoriali (vedi eq_coords)"
+    _check_numpy("eq_coords_many")
+    az_rad = np.asarray(az_rad, dtype=np.float64)
+    el_rad = np.asarray(el_rad, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_el = np.cos(el_rad)
+        sin_el = np.sin(el_rad)
+        sin_de = sin_el*OPC.sin_lat+cos_el*OPC.cos_lat*np.cos(az_rad)
+        cos_de = np.sqrt(1.-sin_de*sin_de)
+        sin_ha = -np.sin(az_rad)*cos_el/cos_de
+        cos_ha = (sin_el-sin_de*OPC.sin_lat)/(cos_de*OPC.cos_lat)
+        ha_rad = np.arctan2(sin_ha, cos_ha)
+        ha_rad = np.where(cos_de == 0., np.nan, ha_rad)
+        de_rad = np.arcsin(sin_de)
+    return ha_rad, de_rad
+
 def normalize_angle(angle, pi2):
     "Porta angolo in [0 - pi2)"
     angle = fmod(angle, pi2)
@@ -0,0 +1,108 @@
+"""
+Composizione veloce dei comandi LX200 di impostazione
+
+I comandi :Sr (ascensione retta), :Sd (declinazione), :Sa (altezza) e
+:Sz (azimut) vengono composti direttamente come bytes, concatenando con
+un'unica join() frammenti precalcolati (tabelle dei campi numerici,
+costruite alla prima istanza di CommandEncoder), senza float2ums,
+formattazione con % e conversione in bytes.
+
+I valori vengono arrotondati alla risoluzione del formato (1e-4 sec per
+ascensione retta e declinazione, 1 secondo per l'altezza, 1 minuto per
+l'azimut): la scomposizione in campi avviene su interi, senza errori di
+troncamento.
+
+Usato da telecomm.TeleCommunicator (set_ra, set_de, set_alt, set_az,
+set_target_many)
+"""
+
+__version__ = "1.0"
+__author__ = "Luca Fini"
+__date__ = "Gennaio 2021"
+
+                                     # Formati dei comandi (stessi codice e lunghezza
+RA_LAYOUT = ":Sr00:00:00.0000#"      # dei comandi composti: usati per le statistiche
+DE_LAYOUT = ":Sd+00*00:00.0000#"     # e per la suddivisione di più comandi; i campi
+MOVE_LAYOUT = ":MS#"                 # sono cifre perché telestats.command_code()
+ALT_LAYOUT = ":Sa+00*00'00#"         # riporti il solo codice)
+AZ_LAYOUT = ":Sz000*00#"
+
+_TSEC_UNITS = 10000                  # Unità di 1e-4 secondi
+_HOUR_UNITS = 3600*_TSEC_UNITS
+_DAY_UNITS = 24*_HOUR_UNITS
+
+_SET_RA = b":Sr"
+_SET_DE = b":Sd"
+_SET_ALT = b":Sa"
+_SET_AZ = b":Sz"
+MOVE = b":MS#"
+_PLUS = b"+"
+_MINUS = b"-"
+
+def _make_tables():
+    "Costruisce le tabelle dei campi: DD, DDD, ssss, MM:SS"
+    return ([b"%02d"%num for num in range(100)],
+            [b"%03d"%num for num in range(1000)],
+            [b".%04d#"%num for num in range(_TSEC_UNITS)],
+            [b"%02d:%02d"%divmod(num, 60) for num in range(3600)])
+
+class CommandEncoder:
+    "Composizione dei comandi di impostazione target come bytes"
+    _tables = None
+
+    def __init__(self):
+        if CommandEncoder._tables is None:
+            CommandEncoder._tables = _make_tables()
+        self._d2, self._d3, self._frac, self._mmss = CommandEncoder._tables
+
+    def _ra_parts(self, hours):
+        "Frammenti del comando :Sr"
+        units = int(round(hours*_HOUR_UNITS))%_DAY_UNITS
+        secs, frac = divmod(units, _TSEC_UNITS)
+        hrs, rest = divmod(secs, 3600)
+        return (_SET_RA, self._d2[hrs], b":", self._mmss[rest], self._frac[frac])
+
+    def _de_parts(self, deg):
+        "Frammenti del comando :Sd"
+        if deg < 0:
+            sign = _MINUS
+            deg = -deg
+        else:
+            sign = _PLUS
+        secs, frac = divmod(int(round(deg*_HOUR_UNITS)), _TSEC_UNITS)
+        degs, rest = divmod(secs, 3600)
+        mins, secs = divmod(rest, 60)
+        return (_SET_DE, sign, self._d2[degs], b"*", self._d2[mins], b":", self._d2[secs],
+                self._frac[frac])
+
+    def ra(self, hours):                       # pylint: disable=C0103
+        "Comando :Sr per ascensione retta (ore, 0..24)"
+        return b"".join(self._ra_parts(hours))
+
+    def de(self, deg):                         # pylint: disable=C0103
+        "Comando :Sd per declinazione (gradi, -90..90)"
+        return b"".join(self._de_parts(deg))
+
+    def target(self, hours, deg, move=False):
+        "Comandi :Sr e :Sd consecutivi (seguiti da :MS se move è True)"
+        parts = self._ra_parts(hours)+self._de_parts(deg)
+        if move:
+            parts += (MOVE,)
+        return b"".join(parts)
+
+    def alt(self, deg):
+        "Comando :Sa per altezza (gradi, -90..90)"
+        if deg < 0:
+            sign = _MINUS
+            deg = -deg
+        else:
+            sign = _PLUS
+        degs, rest = divmod(int(round(deg*3600.)), 3600)
+        mins, secs = divmod(rest, 60)
+        return b"".join((_SET_ALT, sign, self._d2[degs], b"*", self._d2[mins], b"'",
+                         self._d2[secs], b"#"))
+
+    def az(self, deg):                         # pylint: disable=C0103
+        "Comando :Sz per azimut (gradi, 0..360)"
+        degs, mins = divmod(int(round(deg*60.))%(360*60), 60)
+        return b"".join((_SET_AZ, self._d3[degs], b"*", self._d2[mins], b"#"))
@@ -0,0 +1,123 @@
+"""
+configdata.py
+
+Gestione dati di configurazione (lettura e scrittura file, valori di default)
+
+Non dipende da tkinter: può essere usato da procedure senza GUI
+"""
+
+import json
+import os
+import re
+import astro
+
+__version__ = "1.0"
+__date__ = "Gennaio 2021"
+__author__ = "Luca Fini"
+
+SHOW_CONFIG = """
+  File configurazione - {filename}
+             Versione - {version}
+
+           Latitudine Osservatorio: {lat} radianti
+          Longitudine Osservatorio: {lon} radianti
+
+    Indirizzo IP server telescopio: {tel_ip}
+            Port server telescopio: {tel_port}
+
+       Identificatore ASCOM cupola: {dome_ascom}
+          Posizione di park cupola: {park_position} gradi
+    Errore max inseguimento cupola: {dome_maxerr} gradi
+      Ampiezza zona critica cupola: {dome_critical} gradi
+Periodo di aggiornamento posizione: {repeat} secondi
+"""
+
+NOTA = """
+NOTA: la configurazione ha effetto dopo un restart
+"""
+
+HOMEDIR = os.path.expanduser("~")
+CONFIG_FILE = ".opc_config"
+
+#  Valori di default dei parametri di configurazione
+
+LAT_OPC_RAD = astro.OPC.lat_rad
+LON_OPC_RAD = astro.OPC.lon_rad
+TEL_IP = "192.168.0.67"
+TEL_PORT = 9999
+
+DEF_PARK_POS = 1
+DOME_ASCOM = "OCS.Dome"
+DOME_MAXERR = 0.5
+DOME_CRITICAL = 4.0
+REPEAT = 2.0
+
+VERSION = 3
+
+CONFIG_PATH = os.path.join(HOMEDIR, CONFIG_FILE)
+
+SIMUL_CONFIG = {"lat": LAT_OPC_RAD,
+                "lon": LON_OPC_RAD,
+                "dome_ascom": DOME_ASCOM,
+                "tel_ip": "127.0.0.1",
+                "tel_port": 9753,
+                "filename": CONFIG_PATH,
+                "park_position": 1,
+                "dome_maxerr": DOME_MAXERR,
+                "dome_critical": DOME_CRITICAL,
+                "repeat": REPEAT,
+                "version": 0
+               }
+
+DEFAULT_CONFIG = {"lat": LAT_OPC_RAD,
+                  "lon": LON_OPC_RAD,
+                  "dome_ascom": DOME_ASCOM,
+                  "tel_ip": TEL_IP,
+                  "tel_port": TEL_PORT,
+                  "filename": CONFIG_PATH,
+                  "park_position": 1,
+                  "dome_maxerr": DOME_MAXERR,
+                  "dome_critical": DOME_CRITICAL,
+                  "repeat": REPEAT,
+                  "version": VERSION
+                 }
+
+def as_string(config):
+    "riporta configurazione come stringa stampabile"
+    return SHOW_CONFIG.format_map(config)
+
+
+def store_config(config=None):
+    "Salva configurazione"
+    if not config:
+        config = DEFAULT_CONFIG
+    try:
+        with open(CONFIG_PATH, "w") as fpt:
+            json.dump(config, fpt, indent=2)
+    except Exception as excp:
+        msg_text = "\nErrore configurazione:\n\n   "+str(excp)+"\n"
+    else:
+        msg_text = as_string(config)
+        msg_text += NOTA
+    return msg_text
+
+def get_config(required_version=VERSION):
+    "Legge il file di configurazione"
+    if required_version == 0:
+        return SIMUL_CONFIG
+    fname = os.path.join(HOMEDIR, CONFIG_FILE)
+    try:
+        with open(fname) as fpt:
+            config = json.load(fpt)
+    except FileNotFoundError:
+        config = {}
+    if config.get("version", 0) < required_version:
+        return {}
+    return config
+
+PUNCT = re.compile("[^0-9.]+")
+def str2rad(line):
+    "Converte tre numeri (g,m,s) in radianti"
+    three = [float(x) for x in PUNCT.split(line)]
+    rad = astro.dms2rad(*three)
+    return rad
@@ -0,0 +1,198 @@
+"""
+Modello geometrico cupola-telescopio
+
+Calcola l'azimut della cupola come intersezione dell'asse ottico del
+telescopio (montatura equatoriale alla tedesca) con la sfera della cupola.
+Può essere usato in alternativa alle tabelle di interpolazione e per
+generare le tabelle stesse con qualunque risoluzione.
+
+Geometria (sistema di riferimento con origine nel centro della cupola,
+assi: nord, est, alto; unità di misura arbitrarie purché omogenee):
+
+    radius:      raggio della cupola
+    mount_n:     posizione dell'intersezione degli assi AR e DEC: nord
+    mount_e:        "           "          "         "      "     est
+    mount_u:        "           "          "         "      "     alto
+    dec_offset:  distanza dell'asse ottico dall'asse polare (lungo l'asse DEC)
+
+I valori di default sono ottenuti per best fit delle tabelle dometab_e.p
+e dometab_w.p (raggio cupola unitario; differenza rispetto all'interpolazione
+bilineare delle tabelle inferiore a 0.15 gradi nel 99% dei punti)
+
+Uso:
+      python domemodel.py [-h] [-w] [-t dir] [-a ha_step] [-d de_step] [-f]
+
+dove:
+      -a  Passo in angolo orario delle tabelle (minuti, default: 4)
+      -d  Passo in declinazione delle tabelle (gradi, default: 0.5)
+      -f  Tabelle con valori float32 (default: float64)
+      -t  Genera le tabelle dometab_e.tab e dometab_w.tab nella directory dir
+      -w  Calcolo interattivo per telescopio ad ovest (default: est)
+
+Senza l'opzione -t esegue il calcolo interattivo
+"""
+
+import sys
+import os
+from math import sin, cos, sqrt, atan2
+
+from astro import az_coords, OPC, HOUR_TO_RAD, DEG_TO_RAD, RAD_TO_DEG
+from interpolator import write_table, table_name
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+__version__ = "1.0"
+__author__ = "Luca Fini"
+__date__ = "Gennaio 2021"
+
+DOME_RADIUS = 1.0
+MOUNT_N = 0.1402
+MOUNT_E = 0.0
+MOUNT_U = 0.2749
+DEC_OFFSET = 0.3077
+
+MIN_ELEVATION = 1.0          # Altezza minima telescopio (gradi). Al di sotto: NaN
+
+HA_STEP = 4.0                # Passo tabelle in angolo orario (minuti)
+DE_0 = -45.0                 # Declinazione minima tabelle (gradi)
+DE_1 = 90.0                  # Declinazione massima tabelle (gradi)
+DE_STEP = 0.5                # Passo tabelle in declinazione (gradi)
+
+FLOAT_NAN = float("nan")
+
+class DomeModel:
+    """
+Calcolo azimut cupola con modello geometrico
+
+Stessa interfaccia di interpolator.Interpolator (interpolate) e, se è
+installato numpy, di interpolator.ArrayInterpolator (interpolate_many)
+
+side:   e=est / w=ovest (lato del telescopio rispetto al pilastro)
+altri argomenti: geometria (vedi descrizione del modulo)
+"""
+    def __init__(self, side="e", radius=DOME_RADIUS, mount_n=MOUNT_N,       # pylint: disable=R0913
+                 mount_e=MOUNT_E, mount_u=MOUNT_U, dec_offset=DEC_OFFSET):
+        side = side.lower()
+        if side not in "ew" or len(side) != 1:
+            raise ValueError("Lato errato: %s"%side)
+        self.side = side
+        self.radius = radius
+        self.mount = (mount_n, mount_e, mount_u)
+        self.offset = dec_offset if side == "e" else -dec_offset
+        self.sin_min_el = sin(MIN_ELEVATION*DEG_TO_RAD)
+
+    def _dome_az(self, ha_rad, dirn, dire, diru):
+        "Azimut (gradi) dell'intersezione con la cupola della direzione data"
+        sin_ha = sin(ha_rad)
+        # posizione asse ottico: intersezione assi + offset lungo asse DEC
+        pos_n = self.mount[0]-self.offset*sin_ha*OPC.sin_lat
+        pos_e = self.mount[1]+self.offset*cos(ha_rad)
+        pos_u = self.mount[2]+self.offset*sin_ha*OPC.cos_lat
+        bbb = pos_n*dirn+pos_e*dire+pos_u*diru
+        ccc = pos_n*pos_n+pos_e*pos_e+pos_u*pos_u-self.radius*self.radius
+        dist = -bbb+sqrt(bbb*bbb-ccc)
+        return (atan2(pos_e+dist*dire, pos_n+dist*dirn)*RAD_TO_DEG)%360.
+
+    def interpolate(self, ha, de):           # pylint: disable=C0103
+        "Calcola azimut cupola (gradi) da angolo orario (ore) e declinazione (gradi)"
+        ha_rad = ha*HOUR_TO_RAD
+        try:
+            az_rad, el_rad = az_coords(ha_rad, de*DEG_TO_RAD)
+        except ZeroDivisionError:               # Telescopio allo zenit
+            az_rad, el_rad = 0., 1.5707963267948966
+        diru = sin(el_rad)
+        if diru < self.sin_min_el:
+            return FLOAT_NAN
+        cos_el = cos(el_rad)
+        return self._dome_az(ha_rad, cos_el*cos(az_rad), cos_el*sin(az_rad), diru)
+
+    def interpolate_many(self, ha, de):           # pylint: disable=C0103
+        """
+Calcola azimut cupola su array di coordinate (richiede numpy)
+
+ha, de: angolo orario (ore) e declinazione (gradi), array o scalari
+
+Riporta array di azimut (gradi); NaN per telescopio sotto l'altezza minima"""
+        if not HAS_NUMPY:
+            raise ImportError("interpolate_many richiede numpy")
+        ha_rad = np.asarray(ha, dtype=np.float64)*HOUR_TO_RAD
+        de_rad = np.asarray(de, dtype=np.float64)*DEG_TO_RAD
+        sin_ha = np.sin(ha_rad)
+        cos_ha = np.cos(ha_rad)
+        sin_de = np.sin(de_rad)
+        cos_de = np.cos(de_rad)
+        # direzione di puntamento: stesse formule di astro.az_coords
+        # in coordinate cartesiane (nord, est, alto)
+        dirn = -OPC.sin_lat*cos_de*cos_ha+OPC.cos_lat*sin_de
+        dire = -cos_de*sin_ha
+        diru = OPC.cos_lat*cos_de*cos_ha+OPC.sin_lat*sin_de
+        pos_n = self.mount[0]-self.offset*sin_ha*OPC.sin_lat
+        pos_e = self.mount[1]+self.offset*cos_ha
+        pos_u = self.mount[2]+self.offset*sin_ha*OPC.cos_lat
+        bbb = pos_n*dirn+pos_e*dire+pos_u*diru
+        ccc = pos_n*pos_n+pos_e*pos_e+pos_u*pos_u-self.radius*self.radius
+        dist = -bbb+np.sqrt(bbb*bbb-ccc)
+        azm = np.mod(np.arctan2(pos_e+dist*dire, pos_n+dist*dirn)*RAD_TO_DEG, 360.)
+        return np.where(diru < self.sin_min_el, np.nan, azm)
+
+def make_table(model, ha_step=HA_STEP, de_step=DE_STEP, de_0=DE_0, de_1=DE_1):
+    """
+Genera tabella di interpolazione dal modello
+
+ha_step: passo in angolo orario (minuti); de_step: passo in declinazione (gradi)
+
+Riporta dizionario nello stesso formato dei file pickle"""
+    ha_step_h = ha_step/60.
+    n_ha = int(round(24./ha_step_h))+1
+    n_de = int(round((de_1-de_0)/de_step))+1
+    data = [[model.interpolate(nha*ha_step_h, de_0+nde*de_step) for nha in range(n_ha)]
+            for nde in range(n_de)]
+    return {"DATA": data, "SIDE": model.side, "HA_STEP": ha_step_h, "DE_0": de_0,
+            "DE_1": de_0+(n_de-1)*de_step, "DE_STEP": de_step}
+
+def make_tables(tabdir, ha_step=HA_STEP, de_step=DE_STEP, dtype="d", **geometry):
+    "Genera le tabelle in formato binario per i due lati. Riporta lista dei nomi"
+    names = []
+    for side in "ew":
+        table = make_table(DomeModel(side, **geometry), ha_step, de_step)
+        fname = table_name(tabdir, side, True)
+        write_table(fname, table, dtype)
+        names.append(fname)
+    return names
+
+def get_arg(flag, default):
+    "Legge valore di un'opzione"
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag)+1]
+    return default
+
+def main():
+    "Generazione tabelle o calcolo interattivo"
+    if "-h" in sys.argv:
+        print(__doc__)
+        sys.exit()
+    if "-t" in sys.argv:
+        tabdir = get_arg("-t", ".")
+        if not os.path.isdir(tabdir):
+            print("Directory inesistente:", tabdir)
+            sys.exit(1)
+        dtype = "f" if "-f" in sys.argv else "d"
+        for fname in make_tables(tabdir, float(get_arg("-a", HA_STEP)),
+                                 float(get_arg("-d", DE_STEP)), dtype):
+            print("Generato:", fname)
+        sys.exit()
+
+    model = DomeModel(side="w" if "-w" in sys.argv else "e")
+    while True:
+        answ = input("ha(ore) de(gradi)? ").strip()
+        if not answ:
+            break
+        ha_h, de_d = (float(x) for x in answ.split())
+        print("Azimuth(gradi):", model.interpolate(ha_h, de_d))
+
+if __name__ == "__main__":
+    main()
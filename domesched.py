@@ -0,0 +1,85 @@
+"""
+Pianificazione dei movimenti della cupola
+
+Dato il percorso previsto della posizione obiettivo della cupola
+(sequenza di azimut a tempi successivi), sceglie le posizioni della cupola
+in modo che ciascuna posizione mantenga l'obiettivo entro la tolleranza
+per il tempo più lungo possibile, riducendo così il numero di comandi
+SlewToAzimuth (la scelta "greedy" del segmento più lungo ad ogni passo
+è ottima per il numero di movimenti).
+
+Usato da trackcore.TrackerCore (config["dome_schedule"]) e da
+tracksim.py per il rapporto di simulazione
+"""
+
+from interpolator import az_delta
+
+__version__ = "1.0"
+__author__ = "Luca Fini"
+__date__ = "Gennaio 2021"
+
+HORIZON = 3600.     # Orizzonte di pianificazione (sec)
+STEP = 10.          # Passo di campionamento del percorso (sec)
+
+def segment(path, tolerance, start=0):
+    """
+Trova il segmento più lungo del percorso a partire da path[start] tale che
+tutti gli azimut siano entro tolerance da un'unica posizione della cupola
+
+path:  sequenza di (tempo, azimut); azimut None: non definito
+Riporta (indice dell'ultimo punto, azimut della cupola) oppure None
+se path[start] non è definito"""
+    az0 = path[start][1]
+    if az0 is None:
+        return None
+    lower = upper = rel = 0.
+    prev = az0
+    last = start
+    for idx in range(start+1, len(path)):
+        azm = path[idx][1]
+        if azm is None:
+            break
+        rel += az_delta(prev, azm)
+        prev = azm
+        if max(upper, rel)-min(lower, rel) > 2*tolerance:
+            break
+        lower = min(lower, rel)
+        upper = max(upper, rel)
+        last = idx
+    return last, (az0+(lower+upper)/2.)%360.
+
+def plan_moves(path, tolerance):
+    """
+Pianifica i movimenti della cupola lungo il percorso
+
+path:      sequenza di (tempo, azimut) a tempi crescenti (azimut None: non definito)
+tolerance: errore massimo ammesso (gradi)
+
+Riporta lista di (tempo inizio, tempo fine, azimut cupola)"""
+    moves = []
+    idx = 0
+    while idx < len(path):
+        found = segment(path, tolerance, idx)
+        if found is None:
+            idx += 1
+            continue
+        last, azm = found
+        moves.append((path[idx][0], path[last][0], azm))
+        idx = last+1
+    return moves
+
+def sample_path(azfunc, tstart, horizon=HORIZON, step=STEP):
+    "Campiona azfunc(t) (azimut o None) fra tstart e tstart+horizon"
+    nstep = int(horizon/step)
+    return [(tstart+n*step, azfunc(tstart+n*step)) for n in range(nstep+1)]
+
+def duty_cycle(moves, start_az, speed, duration):
+    "Frazione di tempo con cupola in movimento per la lista di movimenti data"
+    if duration <= 0:
+        return 0.
+    azm = start_az
+    moving = 0.
+    for move in moves:
+        moving += abs(az_delta(azm, move[2]))/speed
+        azm = move[2]
+    return min(1., moving/duration)
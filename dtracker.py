@@ -3,17 +3,17 @@
 OPC - Asservimento cupola [%s]
 
 Uso:
-        python dtracker.py [-s] [-h] [-v]
+        python dtracker.py [-s] [-k] [-h] [-v]
 
 Dove:
        -h  Mostra questa pagina ed esce
+       -k  Mantiene aperta la connessione con il telescopio (keep-alive)
        -s  Si connette al simulatore con IP: 127.0.0.1, Port: 9752
        -v  Scrive numero di versione
 """
 import sys
 import os.path
 import time
-import math
 
 from tkinter import Tk, Button, Entry, Frame, Label, Checkbutton
 from tkinter import IntVar, PhotoImage, Toplevel
@@ -21,37 +21,22 @@ from tkinter import DISABLED, E, END, LEFT, NORMAL, RIDGE, W, X
 from widgets import WarningMsg, Field, Number, Coord, Led, ToolTip
 from widgets import YesNo, HSpacer, Controller, MyToplevel, BD_FONT, H3_FONT
 
-from telecomm import TeleCommunicator
 import configure
-from interpolator import Interpolator
+from trackcore import TrackerCore, SIMULATED_ASCOM
 
 __author__ = "Luca Fini"
 __version__ = "1.3"
 __date__ = "Gennaio 2021"
 
-try:
-    import win32com.client as wcl
-    from pywintypes import com_error as COM_ERROR
-    SIMULATED_ASCOM = False
-except ModuleNotFoundError:
-    import ascom_fake as wcl
-    COM_ERROR = Exception("Fake exception")
-    print("Using ASCOM_FAKE !!!", file=sys.stderr)
-    SIMULATED_ASCOM = True
-
-UPDATE_TRACKER = 2000   # Periodo aggiornamento in modo tracker (ms)
+CHECK_READINGS = 100    # Periodo controllo nuovi stati (ms)
 
 BG_SUSPEND = "cyan"
 BG_SUSPEND_ACT = "cyan3"
 BG_RESUME = "yellow"
 BG_RESUME_ACT = "yellow3"
 
-BR_EAST = "E"
-BR_WEST = "W"
 SIDES = "EW"
 
-FLOAT_NAN = float("nan")
-
 NO_CONFIG = """
   File di configurazione mancante o incompleto
 
@@ -59,9 +44,6 @@ NO_CONFIG = """
   al prossimo restart
 """
 
-INTERP_E = Interpolator(side="e")
-INTERP_W = Interpolator(side="w")
-
 LEFT_ARROW_DATA = """
 R0lGODdhFAAUAOeeAAAAAAABAQEBAAABBQABBgMEBgAFDAMFCAUHCAEJFAYJDgcLEgMMGQsNEAEQ
 IgoPFgoQGQITKAUTJwQUKA4WHg8YJAoZLRIcKBUcJRQdJw0fNxAlQRgmORsmMx4qOiAtPiUwPR0y
@@ -86,44 +68,9 @@ HOMEDIR = os.path.expanduser("~")
 class GLOB:           # pylint: disable=R0903
     "globals senza usare global"
     config = {}
-    goon = False
-    error = ""
-    dome = None
     root = None
-    dome_pos_error = None
-    dome_crit = None
-
-def get_tel(telcom):
-    "Legge posizione telescopio"
-    ha_h = telcom.get_current_ha()
-    de_d = telcom.get_current_de()
-    side = telcom.get_pside()
-    if ha_h is None or de_d is None or side is None:
-        time.sleep(0.3)
-        if ha_h is None:
-            ha_h = telcom.get_current_ha()
-        elif de_d is None:
-            de_d = telcom.get_current_de()
-        elif side is None:
-            side = telcom.get_pside()
-    if ha_h is None or de_d is None or side is None:
-        return None
-    return ha_h, de_d, side[0]
-
-def dome_azimuth(ha_h, de_d, side):
-    "Calcola azimuth cupola da coordinate telescopio"
-    GLOB.error = ""
-    if side == BR_EAST:
-        az_deg = INTERP_E.interpolate(ha_h, de_d)
-    elif side == BR_WEST:
-        az_deg = INTERP_W.interpolate(ha_h, de_d)
-    else:
-        GLOB.error = "ERR: Pier side (%s)"%side
-        return None
-    if math.isnan(az_deg):
-        GLOB.error = "ERR: Interpolazione (ha:%.2f, de:%.2f)"%(ha_h, de_d)
-        az_deg = None
-    return az_deg
+    core = None
+    keepalive = False
 
 THREEMONTHS = 2678400  # numero di secondi in tre mesi
 
@@ -185,8 +132,6 @@ class DTracker(Frame):            # pylint: disable=R0901,R0902
     def __init__(self, parent, logging=False):
         super().__init__(parent)
         self._leftarrow = PhotoImage(data=LEFT_ARROW_DATA)
-        self.tel = TeleCommunicator(GLOB.config["tel_ip"], GLOB.config["tel_port"])
-        self.logname = os.path.join(HOMEDIR, time.strftime("%Y-%m-%d-dtracker.log"))
         top_fr = Frame(self, pady=4)
         Label(top_fr, text="  Telescopio ", font=H3_FONT).grid(row=1, column=1)
         tel_fr = Frame(top_fr)
@@ -204,11 +149,10 @@ class DTracker(Frame):            # pylint: disable=R0901,R0902
         HSpacer(tel_fr, 3).pack(side=LEFT)
         ins_fr = Frame(tel_fr, border=2, relief=RIDGE)
         Label(ins_fr, text=" Insegui: ", font=BD_FONT).pack(side=LEFT)
-        self._slave = IntVar(self)
-        Checkbutton(ins_fr, variable=self._slave, command=self.tog_slave).pack(side=LEFT)
+        self.slave_stat = IntVar(self)
+        Checkbutton(ins_fr, variable=self.slave_stat, command=self.tog_slave).pack(side=LEFT)
         ins_fr.pack(side=LEFT)
         ToolTip(ins_fr, text="Seleziona per attivare inseguimento")
-        self._slave = 0
         HSpacer(tel_fr, 1).pack(side=LEFT)
         tel_fr.grid(row=1, column=2, ipady=4, sticky=W)
         self.tel_led = Led(top_fr, size=20)
@@ -265,7 +209,7 @@ class DTracker(Frame):            # pylint: disable=R0901,R0902
         confb.pack(side=LEFT)
         ToolTip(confb, text="Mofica configurazione")
         HSpacer(bot_fr, 2).pack(side=LEFT)
-        aboutb = Button(bot_fr, text="?", padx=5, pady=2, font=BD_FONT, command=lambda x=self.logname: about(x))
+        aboutb = Button(bot_fr, text="?", padx=5, pady=2, font=BD_FONT, command=lambda x=GLOB.core.logname: about(x))
         aboutb.pack(side=LEFT)
         ToolTip(aboutb, text="Informazioni sul programma")
         HSpacer(bot_fr).pack(side=LEFT)
@@ -280,84 +224,33 @@ class DTracker(Frame):            # pylint: disable=R0901,R0902
         self.sync_val.pack(side=LEFT)
         HSpacer(bot_fr, 1).pack(side=LEFT)
         bot_fr.pack(expand=1, fill=X, ipady=4)
-        self.target_az = None
-        self.at_target = False
-        self.logfile = None
+        self._slave = False
+        self._offset = 0.0
+        self._info = None
         self.set_manual_butts(True)
-        if logging:
-            self.start_logger()
-        else:
-            self.stop_logger()
+        self.log_stat.set(1 if logging else 0)
+        GLOB.core.set_logger(logging)
         self.update()
         self.after(1000, check_logfiles)
 
-    def move_dome(self, target):
-        "Movimento cupola"
-        azm = GLOB.dome.Azimuth
-        slw = GLOB.dome.Slewing
-        if (target is None) or slw:
-            return azm, slw
-        dist = target-azm
-        if dist > 180.:
-            dist -= 360.
-        elif dist < -180.:
-            dist += 360.
-        adist = abs(dist)
-        self.at_target = False
-        if adist > GLOB.dome_maxerr:
-            if adist < GLOB.dome_crit:
-                mod_target = (target-adist/2) if dist > 0 else (target+adist/2)
-                mod_target %= 360
-            else:
-                mod_target = target
-            self.log_mark("CMD SlewToAzimuth(%.2f)"%mod_target)
-            GLOB.dome.SlewToAzimuth(mod_target)
-        else:
-            self.at_target = True
-        return azm, slw
-
     def set_target(self):
         "Imposta posizione target"
         fld = self.val_target.get()
         self.offset.set(0)
         if fld:
-            self.log_mark("GOTO "+fld)
-            self.target_az = float(fld)
+            try:
+                azimuth = float(fld)
+            except ValueError:
+                self.setinfo("Devi specificare il valore in gradi!!")
+                return
+            GLOB.core.goto(azimuth)
         else:
-            self.target_az = None
-            self.log_mark("Annulla goto")
+            GLOB.core.goto(None)
         self.val_target.delete(0, END)
 
-    def log_mark(self, text):
-        "Inserisce un commento nel logfile"
-        if self.logfile is None:
-            return
-        print("# %.2f -"%time.time(), text, file=self.logfile)
-
     def tog_logger(self):
         "Server per bottone logon/logoff"
-        if self.logfile:
-            self.stop_logger()
-        else:
-            self.start_logger()
-
-    def start_logger(self):
-        "Abilita logging dei dati"
-        self.logfile = open(self.logname, "a")
-        self.log_mark("Log attivato - "+time.strftime("%Y-%m-%d %H:%M:%S"))
-        self.log_mark("Periodo aggiornamento: %d (ms)"%UPDATE_TRACKER)
-        self.log_mark("Max errore di tracking: %.2f (gradi)"%GLOB.dome_maxerr)
-        self.log_mark("Zona critica tracking %.2f (gradi)"%GLOB.dome_crit)
-        self.log_mark("tempo slewing posizione obiettivo   HA    DEC   lato")
-        self.log_stat.set(1)
-
-    def stop_logger(self):
-        "disabilita logging dei dati"
-        if self.logfile is not None:
-            self.log_mark("Log disattivato - "+time.strftime("%Y-%m-%d %H:%M:%S"))
-            self.logfile.close()
-        self.logfile = None
-        self.log_stat.set(0)
+        GLOB.core.set_logger(bool(self.log_stat.get()))
 
     def set_manual_butts(self, enable):
         "Abilita/disabilita comandi manuali"
@@ -374,91 +267,55 @@ class DTracker(Frame):            # pylint: disable=R0901,R0902
             self.syncb.config(state=DISABLED)
             self.offset.config(state=NORMAL)
 
-    def set_slave(self, enable):
-        "Attiva/disattiva inseguimento telescopio"
-        self.target_az = None
-        if enable:
-            self.log_mark("START inseguimento")
-            self._slave = 1
-            self.setinfo("Inseguimento attivo")
-            self.set_manual_butts(False)
-        else:
-            self.log_mark("STOP inseguimento")
-            self._slave = 0
-            self.log_mark("CMD AbortSlew")
-            GLOB.dome.AbortSlew()
-            self.setinfo("Inseguimento sospeso")
-            self.set_manual_butts(True)
-
-    def _log(self, slw, azm, tgtz, telrep):
-        "data logger"
-        if self.logfile is None:
-            return
-        sslw = 1 if slw else 0
-        if telrep is None:
-            telrep = (FLOAT_NAN, FLOAT_NAN, "_")
-        hang, dec, side = telrep
-        try:
-            print("%.2f %d %.2f %.2f %f %f %s"%(time.time(), sslw, azm,
-                                                tgtz, hang, dec, side), file=self.logfile)
-        except TypeError as excp:
-            self.log_mark("ERROR: "+str(excp))
-
     def tog_slave(self):
         "Sospende/riattiva inseguimento telescopio"
-        if self._slave:
-            self.set_slave(False)
-        else:
-            self.set_slave(True)
+        GLOB.core.set_slave(bool(self.slave_stat.get()))
 
     def park(self):
         "Ritorna in posizione park"
         if self._slave:
             return
-        self.target_az = None
-        self.trgt_az.set(None)
-        self.log_mark("CMD AbortSlew")
-        GLOB.dome.AbortSlew()
-        self.target_az = GLOB.config["park_position"]
-        self.trgt_az.set(self.target_az)
-        self.log_mark("CMD Park at %d"%self.target_az)
+        GLOB.core.park()
 
     def sync(self):
         "Sincronizza posizione cupola"
         if self._slave:
             return
-        self.target_az = None
-        self.trgt_az.set(None)
-        self.log_mark("CMD AbortSlew")
-        GLOB.dome.AbortSlew()
         val = self.sync_val.get()
         try:
             syncv = float(val)
-        except ValueError as excp:
-            self.log_mark("ERR: comando Sync - "+str(excp))
+        except ValueError:
             self.setinfo("Devi specificare il valore in gradi!!")
         else:
-            self.log_mark("CMD SyncToAzimuth(%.2f)"%syncv)
-            GLOB.dome.SyncToAzimuth(syncv)
+            GLOB.core.sync(syncv)
 
     def termina(self):
         "Termina procedura"
-        self.log_mark("CMD AbortSlew")
-        GLOB.dome.AbortSlew()
-        if SIMULATED_ASCOM:
-            GLOB.dome.Dispose()
+        GLOB.core.terminate(dispose=SIMULATED_ASCOM)
+        GLOB.core.join(2)
         self.setinfo("Termina applicazione")
-        self.stop_logger()
         GLOB.root.destroy()
 
     def update(self):
-        "Aggiornamento stato del widget"
-        telrep = get_tel(self.tel)
+        "Aggiornamento del widget con l'ultimo stato pubblicato dal thread di controllo"
+        offset = self.offset.get()
+        if offset != self._offset:
+            self._offset = offset
+            GLOB.core.set_offset(offset)
+        state = GLOB.core.latest()
+        if state is None:
+            self.after(CHECK_READINGS, self.update)
+            return
+        if state.slave != self._slave:
+            self._slave = state.slave
+            self.slave_stat.set(1 if state.slave else 0)
+            self.set_manual_butts(not state.slave)
+        self.log_stat.set(1 if state.logging else 0)
+        telrep = state.tel
         if telrep is None:
             self.tel_led.set("gray")
             self.tel_ha.clear()
             self.tel_de.clear()
-            self.setinfo("Attesa comunicazione con telescopio")
             self.tside.config(text="")
         else:
             self.tel_led.set("green")
@@ -466,38 +323,27 @@ class DTracker(Frame):            # pylint: disable=R0901,R0902
             self.tel_de.set(telrep[1])
             fgc = "lightgreen" if telrep[2] in SIDES else "hotpink"
             self.tside.configure(text=telrep[2], fg=fgc)
-            if self._slave:
-                self.target_az = dome_azimuth(*telrep)
-                if self.target_az is None:
-                    self.setinfo(GLOB.error)
-                    self.log_mark(GLOB.error)
-                else:
-                    self.target_az += self.offset.get()
-                    self.setinfo("")
-        self.trgt_az.set(self.target_az)
-        try:
-            azm, slw = self.move_dome(self.target_az)
-        except COM_ERROR:                   # pylint: disable=W0703
-            msg = "ERR: comunicazione con cupola interrotta"
-            self.setinfo(msg)
-            self.log_mark(msg)
+        self.trgt_az.set(state.target_az)
+        if state.dome is None:
             self.dome_mov.clear()
             self.dome_az.clear()
             self.dome_led.set("gray")
         else:
+            azm, slw = state.dome
             self.dome_led.set("green")
             self.dome_az.set(azm)
             if slw:
                 self.dome_mov.set("SLEW", fg="yellow")
             else:
                 self.dome_mov.set("IDLE", fg="lightgreen")
-        if self.at_target:
+        if state.at_target:
             self.attgt_led.set("green")
         else:
             self.attgt_led.set("gray")
-        if self.target_az is not None:
-            self._log(slw, azm, self.target_az, telrep)
-        self.after(GLOB.repeat, self.update)
+        if state.info != self._info:
+            self._info = state.info
+            self.setinfo(state.info)
+        self.after(CHECK_READINGS, self.update)
 
     def setinfo(self, info):
         "Scrive in linea di stato"
@@ -519,6 +365,8 @@ def main():
     if SIMULATED_ASCOM:
         mode += " [No WIN]"
 
+    GLOB.keepalive = "-k" in sys.argv
+
     GLOB.root = Tk()
 
     if "-h" in sys.argv:
@@ -526,15 +374,13 @@ def main():
         msg = __doc__%vinfo
         wdg = WarningMsg(GLOB.root, msg)
     elif GLOB.config:
-        GLOB.dome = wcl.Dispatch(GLOB.config["dome_ascom"])
         GLOB.root.title("OPC - Asservimento cupola - V. %s%s"%(__version__, mode))
-        GLOB.dome_maxerr = GLOB.config["dome_maxerr"]
-        GLOB.dome_crit = GLOB.config["dome_critical"]
-        GLOB.repeat = int(GLOB.config["repeat"]*1000)
-        if not GLOB.dome.Connected:
+        GLOB.core = TrackerCore(GLOB.config, keepalive=GLOB.keepalive)
+        if not GLOB.core.dome_call("Connected").result():
             msg = "Errore comunicazione con cupola"
             wdg = WarningMsg(GLOB.root, msg)
         else:
+            GLOB.core.start()
             wdg = DTracker(GLOB.root, logging=True)
             GLOB.root.protocol("WM_DELETE_WINDOW", wdg.termina)
     else:
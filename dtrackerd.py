@@ -0,0 +1,120 @@
+"""
+OPC - Asservimento cupola senza GUI [%s]
+
+Esegue l'inseguimento del telescopio da parte della cupola senza
+interfaccia grafica (non importa tkinter): può essere lanciato da
+un gestore di servizi o su un calcolatore senza display.
+
+Uso:
+        python dtrackerd.py [-s] [-k] [-m] [-n] [-h] [-v]
+
+Dove:
+       -h  Mostra questa pagina ed esce
+       -k  Mantiene aperta la connessione con il telescopio (keep-alive)
+       -m  Modo manuale: non attiva l'inseguimento alla partenza
+       -n  Non attiva il logging su file
+       -s  Si connette al simulatore con IP: 127.0.0.1, Port: 9753
+       -v  Scrive numero di versione
+
+La procedura termina con CTRL-C oppure con il segnale SIGTERM
+"""
+
+import sys
+import time
+import queue
+import signal
+
+import configdata
+from trackcore import TrackerCore, SIMULATED_ASCOM
+
+__author__ = "Luca Fini"
+__version__ = "1.0"
+__date__ = "Gennaio 2021"
+
+STATE_WAIT = 1.0       # Attesa massima nuovo stato (sec)
+
+NO_CONFIG = """
+  File di configurazione mancante o incompleto
+
+  È stato creato un file di default che sarà attivo
+  al prossimo restart (per modificarlo: python configure.py)
+"""
+
+class GLOB:           # pylint: disable=R0903
+    "globals senza usare global"
+    goon = True
+
+def stop(*_unused):
+    "Gestione segnali di terminazione"
+    GLOB.goon = False
+
+def report(text):
+    "Scrive messaggio di stato con data e ora"
+    print(time.strftime("%Y-%m-%d %H:%M:%S"), text, flush=True)
+
+def run(core):
+    """Ciclo principale: riporta i cambiamenti dello stato fino a terminazione
+
+Riporta False se il thread di controllo è terminato per errore"""
+    info = None
+    while GLOB.goon and core.is_alive():
+        try:
+            state = core.states.get(timeout=STATE_WAIT)
+        except queue.Empty:
+            continue
+        if state.info != info:
+            info = state.info
+            if info:
+                report(info)
+    failed = GLOB.goon                   # Thread di controllo terminato da solo
+    if failed:
+        state = core.latest()            # Stato finale, con il messaggio di errore
+        if state is not None and state.info and state.info != info:
+            report(state.info)
+    else:
+        core.terminate(dispose=SIMULATED_ASCOM)
+    core.join(5)
+    report("Asservimento terminato")
+    return not failed
+
+def main():
+    "funzione main"
+    if "-v" in sys.argv:
+        print(__version__)
+        sys.exit()
+
+    if "-h" in sys.argv:
+        vinfo = "Vers. %s - %s, %s"%(__version__, __author__, __date__)
+        print(__doc__%vinfo)
+        sys.exit()
+
+    if "-s" in sys.argv:
+        config = configdata.get_config(0)
+    else:
+        config = configdata.get_config(2)
+    if not config:
+        configdata.store_config()
+        print(NO_CONFIG)
+        sys.exit(1)
+
+    core = TrackerCore(config, keepalive=("-k" in sys.argv))
+    if not core.dome_call("Connected").result():
+        print("Errore comunicazione con cupola")
+        sys.exit(1)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    core.set_logger("-n" not in sys.argv)
+    if "-m" not in sys.argv:
+        core.set_slave(True)
+    core.start()
+    report("Asservimento cupola V. %s - telescopio: %s:%d"%(__version__, config["tel_ip"],
+                                                          config["tel_port"]))
+    if "-n" not in sys.argv:
+        report("Logfile: "+core.logname)
+    if not run(core):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Test del compositore dei comandi (cmdencoder.py) e delle statistiche
+di comunicazione relative
+
+Verifica che:
+  - i comandi composti abbiano il formato e la lunghezza dei formati
+    (RA_LAYOUT, DE_LAYOUT, ...) e siano decodificabili
+  - dopo set_target(..., move=True) le statistiche di TeleCommunicator
+    siano raccolte sotto i codici :Sr, :Sd, :MS (con e senza
+    connessione persistente)
+
+Per il secondo test viene usato un server LX200 minimo interno, senza
+bisogno del simulatore.
+
+Uso:
+      python encodertest.py
+"""
+
+import sys
+import socket
+import threading
+
+import cmdencoder
+from cmdencoder import CommandEncoder
+from telecomm import TeleCommunicator
+
+                  # (ore, gradi, comando :Sr atteso, comando :Sd atteso)
+TARGETS = ((0., 0., b":Sr00:00:00.0000#", b":Sd+00*00:00.0000#"),
+           (12.5, -45.25, b":Sr12:30:00.0000#", b":Sd-45*15:00.0000#"),
+           (5.0001, 10.00001, b":Sr05:00:00.3600#", b":Sd+10*00:00.0360#"),
+           (23.99999999, 89.99999999, b":Sr00:00:00.0000#", b":Sd+90*00:00.0000#"))
+
+def lx200_server(skt):
+    "Server LX200 minimo: risponde '1' ai comandi :S, '0' a :MS"
+    while True:
+        client, _unused = skt.accept()
+        threading.Thread(target=serve_client, args=(client,), daemon=True).start()
+
+def serve_client(client):
+    "Gestione della connessione con un client"
+    buff = b""
+    with client:
+        while True:
+            data = client.recv(1024)
+            if not data:
+                break
+            buff += data
+            while b"#" in buff:
+                command, _unused, buff = buff.partition(b"#")
+                client.sendall(b"0" if command == b":MS" else b"1")
+
+def test_encoder():
+    "Verifica dei comandi composti"
+    encoder = CommandEncoder()
+    nerr = 0
+    for hours, deg, ra_cmd, de_cmd in TARGETS:
+        target = encoder.target(hours, deg, True)
+        expected = ra_cmd+de_cmd+cmdencoder.MOVE
+        if target != expected:
+            print("ERRORE: target(%r, %r): %s != %s"%(hours, deg, target, expected))
+            nerr += 1
+    for cmd, layout in ((encoder.ra(7.25), cmdencoder.RA_LAYOUT),
+                        (encoder.de(-3.5), cmdencoder.DE_LAYOUT),
+                        (encoder.alt(-12.5), cmdencoder.ALT_LAYOUT),
+                        (encoder.az(359.999), cmdencoder.AZ_LAYOUT)):
+        if len(cmd) != len(layout) or cmd[:3] != layout[:3].encode("ascii"):
+            print("ERRORE: %s non corrisponde al formato %s"%(cmd, layout))
+            nerr += 1
+    return nerr
+
+def test_stats(port):
+    "Verifica dei codici comando nelle statistiche"
+    nerr = 0
+    for keepalive in (False, True):
+        tel = TeleCommunicator("127.0.0.1", port, keepalive=keepalive)
+        ret = tel.set_target(10.5, 20.25, move=True)
+        if ret != "110":
+            print("ERRORE (keepalive=%s): risposta %r"%(keepalive, ret))
+            nerr += 1
+        keys = sorted(tel.stats()["commands"])
+        if keys != [":MS", ":Sd", ":Sr"]:
+            print("ERRORE (keepalive=%s): codici nelle statistiche: %s"%(keepalive, keys))
+            nerr += 1
+        tel.set_ra(1.)
+        tel.set_alt(30.)
+        tel.set_az(120.)
+        keys = sorted(tel.stats()["commands"])
+        if keys != [":MS", ":Sa", ":Sd", ":Sr", ":Sz"]:
+            print("ERRORE (keepalive=%s): codici nelle statistiche: %s"%(keepalive, keys))
+            nerr += 1
+        if tel.stats()["commands"].get(":Sr", {}).get("count") != 2:
+            print("ERRORE (keepalive=%s): conteggio :Sr errato"%keepalive)
+            nerr += 1
+    return nerr
+
+def main():
+    "Procedura di test"
+    if "-h" in sys.argv:
+        print(__doc__)
+        sys.exit()
+    skt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    skt.bind(("127.0.0.1", 0))
+    skt.listen(5)
+    threading.Thread(target=lx200_server, args=(skt,), daemon=True).start()
+    nerr = test_encoder()
+    print("Compositore dei comandi: %s"%("OK" if not nerr else "%d errori"%nerr))
+    nerr2 = test_stats(skt.getsockname()[1])
+    print("Statistiche per comando: %s"%("OK" if not nerr2 else "%d errori"%nerr2))
+    sys.exit(1 if nerr+nerr2 else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Inseguimento di oggetti non siderei da effemeride
+
+Legge un'effemeride (posizioni RA/DEC con tempo) e, da un thread dedicato,
+invia al telescopio a cadenza fissa la posizione interpolata dell'oggetto
+(comandi :Sr e :Sd con un solo invio, eventualmente seguiti da :MS) e le
+correzioni di velocità:
+
+    set_trate:                 frequenza di tracking corrispondente alla
+                               velocità in ascensione retta dell'oggetto,
+                               solo se compresa fra 30 e 90 Hz (valori
+                               accettati da OnStep); per oggetti più
+                               veloci viene usata solo la velocità assi
+    set_slew_ha, set_slew_dec: velocità di movimento degli assi, solo per
+                               oggetti veloci (almeno 0.1 gradi/sec,
+                               risoluzione del comando)
+
+Le correzioni vengono inviate solo quando il valore, alla risoluzione del
+comando, cambia; al termine viene ripristinata la frequenza siderea.
+Vengono riportati il jitter (ritardo rispetto all'istante previsto) e il
+numero di aggiornamenti saltati perché in ritardo.
+
+Formato del file (una posizione per riga, in ordine di tempo; le righe
+vuote e quelle che iniziano con "#" sono ignorate):
+
+    YYYY-MM-DD HH:MM:SS[.sss] RA DEC
+
+con tempo UTC, RA in ore e DEC in gradi, in forma decimale o
+sessagesimale (es: 12:30:15.2 -05:10:20)
+
+Uso:
+      python ephemeris.py [-d] [-k] [-m] [-n] [-p sec] [-l sec] file
+      python ephemeris.py -c file
+
+dove:
+      -c  Verifica il file e mostra posizioni e velocità (senza inviare comandi)
+      -d  Collegamento al simulatore (IP: 127.0.0.1, Port: 9753)
+      -k  Usa connessione persistente (keep-alive)
+      -l  Ritardo massimo degli aggiornamenti (sec, default: metà del periodo)
+      -m  Ogni aggiornamento comprende il comando di movimento (:MS)
+      -n  Non invia le correzioni di velocità
+      -p  Periodo degli aggiornamenti (sec, default: 1)
+
+L'inseguimento può essere interrotto con CTRL-C (vengono riportati i
+risultati parziali)
+"""
+
+import sys
+import time
+import bisect
+import calendar
+import threading
+
+import configdata as conf
+from astro import TCIV_TO_TSID
+from telecomm import TeleCommunicator, wait_until
+from telestats import Histogram
+
+__version__ = "1.0"
+__author__ = "Luca Fini"
+__date__ = "Gennaio 2021"
+
+PERIOD = 1.
+SIDEREAL_TRATE = 60.*TCIV_TO_TSID    # Frequenza di tracking siderea (Hz)
+MIN_SLEW = 0.1                       # Minima velocità assi inviata (gradi/sec)
+TRATE_MIN = 30.                      # Limiti della frequenza di tracking
+TRATE_MAX = 90.                      # accettata da OnStep (Hz, comando :ST)
+TIMEOUT = 2.0
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _sexa(text):
+    "Decodifica valore decimale o sessagesimale (dd:mm[:ss.s])"
+    fields = text.split(":")
+    if len(fields) > 3:
+        raise ValueError(text)
+    value = 0.
+    for field, scale in zip(fields, (1., 60., 3600.)):
+        value += abs(float(field))/scale
+    return -value if text.startswith("-") else value
+
+def parse_utc(date, hms):
+    "Converte data e ora UTC (YYYY-MM-DD, HH:MM:SS[.sss]) in secondi dall'epoca"
+    hms, _unused, frac = hms.partition(".")
+    tstamp = calendar.timegm(time.strptime(date+" "+hms, TIME_FORMAT))
+    return tstamp+float("0."+frac) if frac else float(tstamp)
+
+def read_ephemeris(fname):
+    """Legge effemeride da file
+
+Riporta lista di terne (tempo UTC in sec. dall'epoca, RA in ore, DEC in gradi)
+Genera ValueError per errori di formato o di ordinamento"""
+    ephem = []
+    with open(fname) as fin:
+        for nline, line in enumerate(fin, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split()
+            try:
+                tstamp = parse_utc(fields[0], fields[1])
+                ra_h, de_d = _sexa(fields[2]), _sexa(fields[3])
+            except (IndexError, ValueError):
+                raise ValueError("Errore di formato alla riga %d: %s"%(nline, line))
+            if not (0. <= ra_h < 24. and -90. <= de_d <= 90.):
+                raise ValueError("Posizione non valida alla riga %d: %s"%(nline, line))
+            if ephem and tstamp <= ephem[-1][0]:
+                raise ValueError("Tempo non crescente alla riga %d: %s"%(nline, line))
+            ephem.append((tstamp, ra_h, de_d))
+    if len(ephem) < 2:
+        raise ValueError("Effemeride con meno di due posizioni")
+    return ephem
+
+def interpolate(ephem, tstamp, times=None):
+    """Interpolazione lineare dell'effemeride
+
+times: lista dei tempi dell'effemeride (opzionale, per evitare di ricalcolarla)
+
+Riporta (RA in ore, DEC in gradi, velocità RA in ore/sec, velocità DEC in gradi/sec)"""
+    if times is None:
+        times = [item[0] for item in ephem]
+    idx = min(max(bisect.bisect_right(times, tstamp), 1), len(ephem)-1)
+    tm0, ra0, de0 = ephem[idx-1]
+    tm1, ra1, de1 = ephem[idx]
+    dra = ra1-ra0
+    if dra > 12.:
+        dra -= 24.
+    elif dra < -12.:
+        dra += 24.
+    ra_rate = dra/(tm1-tm0)
+    de_rate = (de1-de0)/(tm1-tm0)
+    return ((ra0+ra_rate*(tstamp-tm0))%24., de0+de_rate*(tstamp-tm0), ra_rate, de_rate)
+
+def track_rate(ra_rate):
+    "Frequenza di tracking (Hz) per la velocità in ascensione retta data (ore/sec)"
+    return 60.*(TCIV_TO_TSID-ra_rate*3600.)
+
+def valid_trate(trate):
+    "Verifica se la frequenza di tracking può essere impostata con :ST"
+    return TRATE_MIN <= trate < TRATE_MAX
+
+class EphemerisStreamer(threading.Thread):              # pylint: disable=R0902
+    """
+Invio al telescopio delle posizioni di un'effemeride a cadenza fissa
+
+tel:    TeleCommunicator
+ephem:  effemeride (vedi read_ephemeris())
+period: intervallo fra gli aggiornamenti (sec)
+move:   se True ogni aggiornamento comprende il comando di movimento (:MS)
+rates:  se True invia le correzioni di velocità (set_trate, set_slew_ha,
+        set_slew_dec)
+late:   ritardo massimo (sec, default: period/2): gli aggiornamenti con
+        ritardo maggiore vengono saltati, per mantenere la cadenza
+
+Gli aggiornamenti sono allineati ai tempi ephem[0][0]+k*period; se
+l'effemeride è già iniziata si parte dal primo istante futuro.
+"""
+    def __init__(self, tel, ephem, period=PERIOD, move=False, rates=True,   # pylint: disable=R0913
+                 late=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.tel = tel
+        self.ephem = ephem
+        self.period = period
+        self.move = move
+        self.rates = rates
+        self.late = period/2. if late is None else late
+        self._times = [item[0] for item in ephem]
+        self._halt = threading.Event()
+        self._lock = threading.Lock()
+        self._jitter = Histogram()
+        self._sent = {}
+        self.counts = {"sent": 0, "dropped": 0, "errors": 0, "rate_updates": 0}
+        self.last_error = ""
+
+    def _update_rate(self, name, text, func, value, success):     # pylint: disable=R0913
+        """Invia correzione di velocità se il valore (alla risoluzione del comando) è
+cambiato. Se il comando fallisce (risposta diversa da success) verrà ripetuto
+all'aggiornamento successivo"""
+        if self._sent.get(name) == text:
+            return
+        if func(value) == success:
+            self._sent[name] = text
+            self.counts["rate_updates"] += 1
+        else:
+            self.counts["errors"] += 1
+            self.last_error = "%s: %s"%(func.__name__, self.tel.last_error() or "risposta errata")
+
+    def _send_rates(self, ra_rate, de_rate):
+        "Invia correzioni di velocità"
+        trate = track_rate(ra_rate)
+        if valid_trate(trate):
+            self._update_rate("trate", "%08.5f"%trate, self.tel.set_trate, trate, "1")
+        for name, func, degsec in (("ha", self.tel.set_slew_ha, abs(ra_rate)*15.),
+                                   ("dec", self.tel.set_slew_dec, abs(de_rate))):
+            if degsec >= MIN_SLEW:
+                self._update_rate(name, "%.1f"%degsec, func, degsec, "")
+
+    def _first_time(self, now):
+        "Istante del primo aggiornamento (UTC)"
+        tm0 = self._times[0]
+        if now <= tm0:
+            return tm0
+        nper = int((now-tm0)/self.period)+1
+        return tm0+nper*self.period
+
+    def run(self):
+        "Ciclo degli aggiornamenti"
+        expected = "110" if self.move else "11"
+        offset = time.time()-time.perf_counter()
+        tstamp = self._first_time(time.time())
+        while tstamp <= self._times[-1]:
+            deadline = tstamp-offset
+            if not wait_until(deadline, self._halt):
+                break
+            lag = time.perf_counter()-deadline
+            this_time = tstamp
+            tstamp += self.period
+            if lag > self.late:
+                self.counts["dropped"] += 1
+                continue
+            with self._lock:
+                self._jitter.record(lag)
+            ra_h, de_d, ra_rate, de_rate = interpolate(self.ephem, this_time, self._times)
+            if self.rates:
+                self._send_rates(ra_rate, de_rate)
+            if self.tel.set_target(ra_h, de_d, self.move) == expected:
+                self.counts["sent"] += 1
+            else:
+                self.counts["errors"] += 1
+                self.last_error = self.tel.last_error()
+        if "trate" in self._sent:
+            self.tel.set_trate(SIDEREAL_TRATE)
+
+    def stop(self):
+        "Interrompe l'inseguimento"
+        self._halt.set()
+
+    def report(self):
+        """Riporta dizionario con: sent (aggiornamenti inviati), dropped (saltati),
+errors (rifiutati o senza risposta), rate_updates (correzioni di velocità),
+jitter (vedi telestats.Histogram.summary()), last_error"""
+        with self._lock:
+            ret = dict(self.counts, jitter=self._jitter.summary())
+        ret["last_error"] = self.last_error
+        return ret
+
+def _msec(value):
+    "Formatta tempo in millisecondi"
+    if value is None:
+        return "-"
+    return "%.3f"%(value*1000.)
+
+def format_report(rep):
+    "Riporta i risultati (da EphemerisStreamer.report()) come testo"
+    jit = rep["jitter"]
+    lines = ["Aggiornamenti inviati: %d, saltati: %d, errori: %d, correzioni di velocità: %d"%(
+        rep["sent"], rep["dropped"], rep["errors"], rep["rate_updates"]),
+             "Jitter (ms): media %s, p50 %s, p95 %s, p99 %s, max %s"%(
+                 _msec(jit["mean"]), _msec(jit["p50"]), _msec(jit["p95"]), _msec(jit["p99"]),
+                 _msec(jit["max"]))]
+    if rep["last_error"]:
+        lines.append("Ultimo errore: %s"%rep["last_error"])
+    return "\n".join(lines)
+
+def show_ephemeris(ephem):
+    "Mostra posizioni e velocità dell'effemeride"
+    print("Tempo (UTC)           RA (ore)    DEC (gradi)  vRA (s/min)  vDEC (\"/min)  Trate (Hz)")
+    times = [item[0] for item in ephem]
+    for tstamp, ra_h, de_d in ephem:
+        ra_rate, de_rate = interpolate(ephem, tstamp, times)[2:]
+        trate = track_rate(ra_rate)
+        print("%s  %10.6f  %+11.6f  %11.4f  %12.3f  %s"%(
+            time.strftime(TIME_FORMAT, time.gmtime(tstamp)), ra_h, de_d, ra_rate*3600.*60.,
+            de_rate*3600.*60., "%10.5f"%trate if valid_trate(trate) else "fuori limiti"))
+
+def get_arg(flag, default):
+    "Legge valore di un'opzione"
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag)+1]
+    return default
+
+def main():
+    "Procedura di inseguimento"
+    if "-h" in sys.argv or len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit()
+    try:
+        ephem = read_ephemeris(sys.argv[-1])
+    except (IOError, ValueError) as excp:
+        print(excp)
+        sys.exit(1)
+    if "-c" in sys.argv:
+        show_ephemeris(ephem)
+        sys.exit()
+
+    if "-d" in sys.argv:
+        config = {"tel_ip": "127.0.0.1",
+                  "tel_port": 9753,
+                  "debug": 1}
+    else:
+        config = conf.get_config()
+    if not config:
+        print("File di configurazione inesistente!")
+        print("occorre definirlo con:")
+        print()
+        print("   python configure.py")
+        sys.exit()
+
+    tel = TeleCommunicator(config["tel_ip"], config["tel_port"], timeout=TIMEOUT,
+                           keepalive="-k" in sys.argv)
+    late = get_arg("-l", None)
+    streamer = EphemerisStreamer(tel, ephem, float(get_arg("-p", PERIOD)), "-m" in sys.argv,
+                                 "-n" not in sys.argv, None if late is None else float(late))
+    print("Effemeride: %d posizioni, da %s a %s UTC"%(
+        len(ephem), time.strftime(TIME_FORMAT, time.gmtime(ephem[0][0])),
+        time.strftime(TIME_FORMAT, time.gmtime(ephem[-1][0]))))
+    streamer.start()
+    try:
+        while streamer.is_alive():
+            streamer.join(1.)
+    except KeyboardInterrupt:
+        print("Inseguimento interrotto")
+        streamer.stop()
+        streamer.join()
+    print(format_report(streamer.report()))
+
+if __name__ == "__main__":
+    main()
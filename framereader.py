@@ -0,0 +1,111 @@
+"""
+Lettura bufferizzata di messaggi LX200 terminati da "#"
+
+I dati vengono letti dal socket a blocchi, in un buffer riutilizzabile.
+Ogni chiamata a read_frame() riporta un messaggio completo, mentre gli
+eventuali caratteri in eccesso restano nel buffer per la lettura successiva
+(necessario con connessioni persistenti e comandi in sequenza)
+
+L'attributo first_data riporta l'istante (time.perf_counter()) della
+prima ricezione di dati dopo l'ultimo reset() (per le statistiche dei
+tempi di risposta)
+"""
+
+import time
+
+__version__ = "1.0"
+__author__ = "Luca Fini"
+__date__ = "Gennaio 2021"
+
+CHUNK_SIZE = 1024
+TERMINATOR = b"#"
+
+class FrameReader:
+    """
+Lettore di messaggi terminati da "#"
+
+skt:   socket da cui leggere (può essere assegnato dopo con attach())
+chunk: dimensione del blocco di lettura
+"""
+    def __init__(self, skt=None, chunk=CHUNK_SIZE):
+        self.skt = skt
+        self.eof = False
+        self.first_data = None
+        self._chunk = bytearray(chunk)
+        self._view = memoryview(self._chunk)
+        self._buffer = bytearray()
+        self._scan = 0
+
+    def attach(self, skt):
+        "Associa il lettore ad un nuovo socket (svuota il buffer)"
+        self.skt = skt
+        self.reset()
+
+    def reset(self):
+        "Svuota il buffer"
+        del self._buffer[:]
+        self._scan = 0
+        self.eof = False
+        self.first_data = None
+
+    def pending(self):
+        "Riporta numero di caratteri nel buffer non ancora letti"
+        return len(self._buffer)
+
+    def take(self):
+        "Riporta (e rimuove) tutti i caratteri presenti nel buffer"
+        data = bytes(self._buffer)
+        del self._buffer[:]
+        self._scan = 0
+        return data
+
+    def feed(self, data):
+        "Aggiunge dati al buffer (per uso senza socket)"
+        self._buffer += data
+
+    def _fill(self):
+        "Legge un blocco dal socket. Riporta False se connessione chiusa"
+        nbytes = self.skt.recv_into(self._view)
+        if not nbytes:
+            self.eof = True
+            return False
+        if self.first_data is None:
+            self.first_data = time.perf_counter()
+        self._buffer += self._view[:nbytes]
+        return True
+
+    def next_frame(self):
+        "Estrae messaggio completo dal buffer, senza leggere dal socket (None se manca)"
+        idx = self._buffer.find(TERMINATOR, self._scan)
+        if idx < 0:
+            self._scan = len(self._buffer)
+            return None
+        idx += 1
+        frame = bytes(self._buffer[:idx])
+        del self._buffer[:idx]
+        self._scan = 0
+        return frame
+
+    def read_frame(self):
+        """
+Legge messaggio fino al terminatore "#" (incluso).
+
+Se la connessione viene chiusa prima del terminatore riporta i
+caratteri ricevuti (eventualmente b""). In caso di timeout viene
+generata l'eccezione del socket e i dati parziali restano nel buffer"""
+        while True:
+            frame = self.next_frame()
+            if frame is not None:
+                return frame
+            if not self._fill():
+                return self.take()
+
+    def read_count(self, count):
+        "Legge esattamente count caratteri (meno se la connessione viene chiusa)"
+        while len(self._buffer) < count:
+            if not self._fill():
+                break
+        data = bytes(self._buffer[:count])
+        del self._buffer[:count]
+        self._scan = 0
+        return data
@@ -2,16 +2,126 @@
 Calcolo azimut cupola per interpolazione tabelle
 
 Le tabelle vengono generate dalla procedura tel_model.py
-e sono contenute nei files: dometab_e.p e dometab_w.p
+e sono contenute nei files: dometab_e.p e dometab_w.p (formato pickle)
+
+Le tabelle possono essere convertite nel formato binario dometab_e.tab
+e dometab_w.tab (python interpolator.py -c), che viene letto mediante
+mmap (senza decodifica e con pagine condivise fra processi) e viene
+utilizzato, se presente, in alternativa al formato pickle.
+
+Formato binario: header di 48 byte (vedi TAB_HEADER) seguito dalla
+griglia di valori (float64 o float32, little endian) per righe
+a declinazione costante.
+
+Se è installato numpy è disponibile anche la classe ArrayInterpolator
+per il calcolo su array di coordinate
 """
 
 import sys
 import os
+import math
+import mmap
 import pickle
+import struct
 
-__version__ = "1.1"
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+__version__ = "1.2"
 __author__ = "Luca Fini"
-__date__ = "Dicembre 2020"
+__date__ = "Gennaio 2021"
+
+FLOAT_NAN = float("nan")
+
+NEAREST = "nearest"      # DEC: riga più vicina, interpolazione lineare in HA
+BILINEAR = "bilinear"    # interpolazione lineare in HA e in DEC
+MODES = (NEAREST, BILINEAR)
+
+TAB_MAGIC = b"OPCDTAB1"
+# magic, tipo dati ("d": float64, "f": float32), lato, n. righe DEC, n. colonne HA,
+# HA_STEP (ore), DE_0 (gradi), DE_STEP (gradi)
+TAB_HEADER = struct.Struct("<8scc2xIIddd4x")
+
+def table_name(tabdir, side, binary):
+    "Riporta il pathname del file tabella"
+    return os.path.join(tabdir, "dometab_"+side+(".tab" if binary else ".p"))
+
+def write_table(fname, table, dtype="d"):
+    "Scrive tabella (dizionario come nel formato pickle) in formato binario"
+    if len(dtype) != 1 or dtype not in "df":
+        raise ValueError("Tipo dati errato: %s"%dtype)
+    data = table["DATA"]
+    n_ha = len(data[0])
+    header = TAB_HEADER.pack(TAB_MAGIC, dtype.encode("ascii"), table["SIDE"].encode("ascii"),
+                             len(data), n_ha, table["HA_STEP"], table["DE_0"], table["DE_STEP"])
+    row_fmt = struct.Struct("<%d%s"%(n_ha, dtype))
+    with open(fname, "wb") as fpt:
+        fpt.write(header)
+        for row in data:
+            fpt.write(row_fmt.pack(*row))
+
+def read_table(fname):
+    """
+Legge tabella in formato binario mediante mmap
+
+Riporta dizionario con le stesse chiavi del formato pickle. DATA è una
+lista di righe (memoryview sul file) indirizzabili come liste; inoltre:
+MMAP (oggetto mmap), OFFSET (posizione inizio dati), SHAPE (n. righe,
+n. colonne) e TYPE (tipo dati)"""
+    with open(fname, "rb") as fpt:
+        if not os.fstat(fpt.fileno()).st_size:
+            raise ValueError("Tabella incompleta: %s"%fname)
+        mapped = mmap.mmap(fpt.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, dtype, side, n_de, n_ha, ha_step, de_0, de_step = \
+                TAB_HEADER.unpack_from(mapped)
+    except struct.error:
+        magic = None
+    if magic != TAB_MAGIC or dtype not in (b"d", b"f"):
+        mapped.close()
+        raise ValueError("Formato tabella errato: %s"%fname)
+    dtype = dtype.decode("ascii")
+    itemsize = struct.calcsize(dtype)
+    if len(mapped)-TAB_HEADER.size < n_de*n_ha*itemsize or (len(mapped)-TAB_HEADER.size)%itemsize:
+        mapped.close()
+        raise ValueError("Tabella incompleta: %s"%fname)
+    if sys.byteorder == "little":
+        flat = memoryview(mapped)[TAB_HEADER.size:].cast(dtype)
+    else:
+        flat = list(struct.unpack_from("<%d%s"%(n_de*n_ha, dtype), mapped, TAB_HEADER.size))
+    rows = [flat[nrow*n_ha:(nrow+1)*n_ha] for nrow in range(n_de)]
+    return {"DATA": rows, "SIDE": side.decode("ascii"), "HA_STEP": ha_step, "DE_0": de_0,
+            "DE_STEP": de_step, "MMAP": mapped, "OFFSET": TAB_HEADER.size,
+            "SHAPE": (n_de, n_ha), "TYPE": dtype}
+
+def load_table(tabdir, side):
+    "Legge tabella: in formato binario se presente e valida, altrimenti pickle"
+    binfile = table_name(tabdir, side, True)
+    picklefile = table_name(tabdir, side, False)
+    if os.path.exists(binfile):
+        try:
+            return read_table(binfile)
+        except ValueError as excp:
+            if not os.path.exists(picklefile):
+                raise
+            print("Tabella binaria non valida (%s), uso formato pickle"%excp, file=sys.stderr)
+    with open(picklefile, "rb") as fpt:
+        return pickle.load(fpt)
+
+def convert(tabdir, side, dtype="d"):
+    "Converte tabella da formato pickle a formato binario. Riporta nome file"
+    with open(table_name(tabdir, side, False), "rb") as fpt:
+        table = pickle.load(fpt)
+    binfile = table_name(tabdir, side, True)
+    write_table(binfile, table, dtype)
+    return binfile
+
+def az_delta(az0, az1):
+    "Differenza az1-az0 ridotta all'intervallo [-180, 180)"
+    return (az1-az0+180.)%360.-180.
 
 class Interpolator:
     """
@@ -19,17 +129,21 @@ Interpolatore per posizione cupola
 
 tabdir: Directory per file tabelle
 side:   e=est / w=ovest
+mode:   nearest (default): in DEC usa la riga più vicina
+        bilinear: interpola anche fra le righe in DEC (ai bordi della
+                  tabella e vicino a valori indefiniti usa la riga più vicina)
 """
-    def __init__(self, tabdir=None, side="e"):
+    def __init__(self, tabdir=None, side="e", mode=NEAREST):
         "Costruttore. tabdir: directory per file tabelle"
+        if mode not in MODES:
+            raise ValueError("Modo di interpolazione errato: %s"%mode)
+        self.mode = mode
         if tabdir is None:
             self.tabdir = os.path.dirname(__file__)
         else:
             self.tabdir = tabdir
-        fname = "dometab_"+side+".p"
-        datafile = os.path.join(self.tabdir, fname)
-        with open(datafile, "rb") as fpt:
-            table = pickle.load(fpt)
+        table = load_table(self.tabdir, side)
+        self._table = table
         self.data = table["DATA"]
         self.side = table["SIDE"]
         self.ha_step = table["HA_STEP"]
@@ -49,23 +163,141 @@ side:   e=est / w=ovest
     def interpolate(self, ha, de):           # pylint: disable=C0103
         "Trova azimut cupola per interpolazione"
         ha %= 24.
+        if self.mode == BILINEAR:
+            return self._bilinear(ha, de)
+        return self._nearest(ha, de)
+
+    def _nearest(self, ha, de):           # pylint: disable=C0103
+        "Interpolazione in HA sulla riga in DEC più vicina (ha in [0, 24))"
+        deix = int((de-self.de_min)*self.c_de+.5)
+        if deix < 0:
+            return FLOAT_NAN
         try:
-            azl = self.data[int((de-self.de_min)*self.c_de+.5)]
+            azl = self.data[deix]
             haix = int(ha*self.c_ha)
             az0 = azl[haix]
-            val = (az0+(azl[haix+1]-az0)*self.c_ha*(ha-self.ha_grid[haix]))%360.
+            val = (az0+az_delta(az0, azl[haix+1])*self.c_ha*(ha-self.ha_grid[haix]))%360.
         except IndexError:
-            val = float("nan")
+            val = FLOAT_NAN
+        return val
+
+    def _bilinear(self, ha, de):           # pylint: disable=C0103
+        "Interpolazione in HA e in DEC (ha in [0, 24))"
+        xde = (de-self.de_min)*self.c_de
+        deix = int(xde)
+        haix = int(ha*self.c_ha)
+        if xde < 0 or deix+1 >= len(self.data) or haix+1 >= len(self.ha_grid):
+            return self._nearest(ha, de)
+        dha = self.c_ha*(ha-self.ha_grid[haix])
+        azl = self.data[deix]
+        az00 = azl[haix]
+        az0 = az00+az_delta(az00, azl[haix+1])*dha
+        azl = self.data[deix+1]
+        az10 = azl[haix]
+        az1 = az10+az_delta(az10, azl[haix+1])*dha
+        if math.isnan(az0) or math.isnan(az1):
+            return self._nearest(ha, de)
+        return (az0+az_delta(az0, az1)*(xde-deix))%360.
+
+class ArrayInterpolator(Interpolator):
+    """
+Interpolatore per posizione cupola su array di coordinate (richiede numpy)
+
+La tabella è memorizzata come array numpy bidimensionale (DEC x HA).
+I risultati coincidono con quelli di Interpolator.interpolate()
+
+tabdir: Directory per file tabelle
+side:   e=est / w=ovest
+mode:   nearest/bilinear (vedi Interpolator)
+"""
+    def __init__(self, tabdir=None, side="e", mode=NEAREST):
+        if not HAS_NUMPY:
+            raise ImportError("ArrayInterpolator richiede numpy")
+        super().__init__(tabdir, side, mode)
+        if "MMAP" in self._table and self._table["TYPE"] == "d":
+            self.table = np.frombuffer(self._table["MMAP"], dtype="<f8",
+                                       count=self._table["SHAPE"][0]*self._table["SHAPE"][1],
+                                       offset=self._table["OFFSET"]).reshape(self._table["SHAPE"])
+        else:
+            self.table = np.ascontiguousarray(self.data, dtype=np.float64)
+
+    def interpolate_many(self, ha, de):           # pylint: disable=C0103
+        """
+Trova azimut cupola per interpolazione su array di coordinate
+
+ha, de: angolo orario (ore) e declinazione (gradi), array o scalari
+        (combinati secondo le regole di broadcast di numpy)
+
+Riporta array di azimut (gradi); NaN per punti fuori tabella"""
+        ha, de = np.broadcast_arrays(np.mod(np.asarray(ha, dtype=np.float64), 24.),
+                                     np.asarray(de, dtype=np.float64))
+        val = self._nearest_many(ha, de)
+        if self.mode == BILINEAR:
+            bil = self._bilinear_many(ha, de)
+            val = np.where(np.isnan(bil), val, bil)
         return val
 
+    def _along_ha(self, deix, haix, dha):
+        "Interpolazione lineare in HA sulle righe deix"
+        az0 = self.table[deix, haix]
+        return az0+az_delta(az0, self.table[deix, haix+1])*dha
+
+    def _nearest_many(self, ha, de):           # pylint: disable=C0103
+        "Interpolazione in HA sulla riga in DEC più vicina"
+        n_de, n_ha = self.table.shape
+        deix = np.trunc((de-self.de_min)*self.c_de+.5)
+        haix = np.trunc(ha*self.c_ha)
+        valid = (deix >= 0) & (deix < n_de) & (haix < n_ha-1)
+        deix = np.where(valid, deix, 0).astype(np.intp)
+        haix = np.where(valid, haix, 0).astype(np.intp)
+        az0 = self.table[deix, haix]
+        az1 = self.table[deix, haix+1]
+        val = np.mod(az0+az_delta(az0, az1)*self.c_ha*(ha-haix*self.ha_step), 360.)
+        return np.where(valid, val, np.nan)
+
+    def _bilinear_many(self, ha, de):           # pylint: disable=C0103
+        "Interpolazione in HA e in DEC (NaN dove non applicabile)"
+        n_de, n_ha = self.table.shape
+        xde = (de-self.de_min)*self.c_de
+        deix = np.trunc(xde)
+        haix = np.trunc(ha*self.c_ha)
+        valid = (xde >= 0) & (deix+1 < n_de) & (haix+1 < n_ha)
+        deix = np.where(valid, deix, 0).astype(np.intp)
+        haix = np.where(valid, haix, 0).astype(np.intp)
+        dha = self.c_ha*(ha-haix*self.ha_step)
+        az0 = self._along_ha(deix, haix, dha)
+        az1 = self._along_ha(deix+1, haix, dha)
+        val = np.mod(az0+az_delta(az0, az1)*(xde-deix), 360.)
+        return np.where(valid, val, np.nan)
+
 def main():
-    "Codice di test"
+    """Codice di test
+
+Uso: python interpolator.py [-w] [-b]    Calcolo interattivo
+     python interpolator.py -c [-f]      Converte tabelle in formato binario
+
+     -b  Interpolazione bilineare
+     -c  Converte le tabelle dometab_e.p e dometab_w.p in formato binario
+     -f  Formato binario con valori float32 (default: float64)
+     -w  Usa tabella per telescopio ad ovest
+"""
+    if "-h" in sys.argv:
+        print(main.__doc__)
+        sys.exit()
+    if "-c" in sys.argv:
+        dtype = "f" if "-f" in sys.argv else "d"
+        for side in "ew":
+            print("Generato:", convert(os.path.dirname(os.path.abspath(__file__)), side, dtype))
+        sys.exit()
+
     if "-w" in sys.argv:
         side = "w"
     else:
         side = "e"
 
-    interp = Interpolator(side=side)
+    mode = BILINEAR if "-b" in sys.argv else NEAREST
+
+    interp = Interpolator(side=side, mode=mode)
     while True:
         answ = input("ha(ore) de(gradi)? ").strip()
         if not answ:
@@ -0,0 +1,194 @@
+"""
+Confronto fra i modi di calcolo della posizione cupola
+
+Misura il tempo di calcolo e la regolarità dell'azimut cupola calcolato
+con interpolazione "nearest" (riga in DEC più vicina), "bilinear" e con
+il modello geometrico (domemodel.py, "analytic"). Per quest'ultimo
+riporta anche la differenza rispetto all'interpolazione bilineare.
+
+La regolarità è valutata su scansioni in declinazione ad angolo orario
+costante: per ogni modo vengono riportati il salto massimo fra punti
+successivi e il numero di salti superiori all'errore massimo di
+inseguimento (ciascuno dei quali provoca un comando SlewToAzimuth).
+
+Con l'opzione -b verifica invece la lettura delle tabelle in formato
+binario (.tab): valori uguali a quelli della tabella pickle, errore
+(ValueError) per file troncati o errati e, in tal caso, uso della
+tabella pickle da parte di Interpolator.
+
+Uso:
+      python interptest.py [-w] [-n num] [-e err]
+      python interptest.py -b
+
+dove:
+      -b  Verifica tabelle in formato binario
+      -w  Usa la tabella per telescopio ad ovest (default: est)
+      -n  Numero di punti per la misura dei tempi (default: 100000)
+      -e  Errore massimo di inseguimento in gradi (default: 0.5)
+"""
+
+import sys
+import os
+import time
+import math
+import pickle
+import random
+import shutil
+import tempfile
+
+from interpolator import Interpolator, ArrayInterpolator, HAS_NUMPY, MODES, BILINEAR, az_delta
+from interpolator import convert, read_table, load_table, table_name
+from domemodel import DomeModel
+
+ANALYTIC = "analytic"
+
+NPOINTS = 100000
+MAXERR = 0.5
+
+HA_SCAN = [x*0.25 for x in range(-24, 25)]   # Angoli orari per scansioni in DEC (ore)
+DE_SCAN = (-40., 89.)                        # Intervallo scansioni in DEC (gradi)
+DE_STEP = 0.01                               # Passo scansioni in DEC (gradi)
+
+def get_arg(flag, default):
+    "Legge valore numerico di un'opzione"
+    if flag in sys.argv:
+        return float(sys.argv[sys.argv.index(flag)+1])
+    return default
+
+def timing(interp, points):
+    "Tempo medio di calcolo (microsecondi per punto)"
+    tm0 = time.perf_counter()
+    for ha_h, de_d in points:
+        interp.interpolate(ha_h, de_d)
+    return (time.perf_counter()-tm0)*1.E6/len(points)
+
+def timing_many(interp, ha_h, de_d):
+    "Tempo medio di calcolo vettoriale (microsecondi per punto)"
+    tm0 = time.perf_counter()
+    interp.interpolate_many(ha_h, de_d)
+    return (time.perf_counter()-tm0)*1.E6/len(ha_h)
+
+def smoothness(interp, maxerr):
+    "Riporta (salto massimo, numero di salti > maxerr) su scansioni in DEC"
+    nstep = int((DE_SCAN[1]-DE_SCAN[0])/DE_STEP)
+    maxjump = 0.
+    njumps = 0
+    for ha_h in HA_SCAN:
+        prev = None
+        for istep in range(nstep+1):
+            azm = interp.interpolate(ha_h, DE_SCAN[0]+istep*DE_STEP)
+            if math.isnan(azm):
+                prev = None
+                continue
+            if prev is not None:
+                jump = abs(az_delta(prev, azm))
+                maxjump = max(maxjump, jump)
+                if jump > maxerr:
+                    njumps += 1
+            prev = azm
+    return maxjump, njumps
+
+def model_diff(model, interp, points):
+    "Differenza fra modello e interpolazione: (media quadratica, massimo) in gradi"
+    sumsq = 0.
+    maxdiff = 0.
+    npts = 0
+    for ha_h, de_d in points:
+        diff = az_delta(interp.interpolate(ha_h, de_d), model.interpolate(ha_h, de_d))
+        if math.isnan(diff):
+            continue
+        sumsq += diff*diff
+        maxdiff = max(maxdiff, abs(diff))
+        npts += 1
+    return math.sqrt(sumsq/npts), maxdiff
+
+def same_values(table, ref):
+    "Verifica che i valori di due tabelle coincidano (NaN inclusi)"
+    for row, refrow in zip(table["DATA"], ref["DATA"]):
+        for val, refval in zip(row, refrow):
+            if val != refval and not (math.isnan(val) and math.isnan(refval)):
+                return False
+    return len(table["DATA"]) == len(ref["DATA"])
+
+def check_binary(side):
+    "Verifica lettura tabelle binarie. Riporta numero di errori"
+    srcdir = os.path.dirname(os.path.abspath(__file__))
+    tabdir = tempfile.mkdtemp()
+    nerr = 0
+    try:
+        shutil.copy(table_name(srcdir, side, False), tabdir)
+        binfile = convert(tabdir, side)
+        with open(table_name(tabdir, side, False), "rb") as fpt:
+            ref = pickle.load(fpt)
+        table = read_table(binfile)
+        if not same_values(table, ref):
+            print("ERRORE: valori della tabella binaria diversi dalla tabella pickle")
+            nerr += 1
+        del table
+        with open(binfile, "rb") as fpt:
+            data = fpt.read()
+        for name, content in (("troncata", data[:len(data)//2]),
+                              ("troncata (dispari)", data[:-3]),
+                              ("solo header", data[:48]),
+                              ("header incompleto", data[:20]),
+                              ("vuota", b""),
+                              ("formato errato", b"X"+data[1:])):
+            with open(binfile, "wb") as fpt:
+                fpt.write(content)
+            try:
+                read_table(binfile)
+            except ValueError as excp:
+                print("Tabella %-20s ValueError: %s"%(name+":", excp))
+            else:
+                print("ERRORE: tabella %s: nessun errore"%name)
+                nerr += 1
+            if not same_values(load_table(tabdir, side), ref):
+                print("ERRORE: tabella %s: lettura tabella pickle errata"%name)
+                nerr += 1
+        Interpolator(tabdir, side)
+    finally:
+        shutil.rmtree(tabdir)
+    return nerr
+
+def main():
+    "Procedura di test"
+    if "-h" in sys.argv:
+        print(__doc__)
+        sys.exit()
+    if "-b" in sys.argv:
+        nerr = check_binary("w" if "-w" in sys.argv else "e")
+        print("Tabelle binarie: %s"%("OK" if not nerr else "%d errori"%nerr))
+        sys.exit(1 if nerr else 0)
+    side = "w" if "-w" in sys.argv else "e"
+    npoints = int(get_arg("-n", NPOINTS))
+    maxerr = get_arg("-e", MAXERR)
+
+    points = [(random.uniform(-12., 12.), random.uniform(-40., 89.)) for _ in range(npoints)]
+    print("Tabella: %s - punti: %d - errore max: %.2f gradi"%(side, npoints, maxerr))
+    print()
+    print("Modo        t(us/punto)  t_vett(us/punto)  salto max(gradi)  salti>errore")
+    for mode in MODES+(ANALYTIC,):
+        if mode == ANALYTIC:
+            interp = DomeModel(side=side)
+            ainterp = interp
+        else:
+            interp = Interpolator(side=side, mode=mode)
+            ainterp = ArrayInterpolator(side=side, mode=mode) if HAS_NUMPY else None
+        tscal = timing(interp, points)
+        if HAS_NUMPY:
+            import numpy as np                   # pylint: disable=C0415
+            hav = np.array([x[0] for x in points])
+            dev = np.array([x[1] for x in points])
+            tvect = "%16.3f"%timing_many(ainterp, hav, dev)
+        else:
+            tvect = "%16s"%"(no numpy)"
+        maxjump, njumps = smoothness(interp, maxerr)
+        print("%-10s %12.3f  %s  %16.3f  %12d"%(mode, tscal, tvect, maxjump, njumps))
+    rms, maxdiff = model_diff(DomeModel(side=side), Interpolator(side=side, mode=BILINEAR),
+                              points)
+    print()
+    print("Differenza analytic - bilinear: media quadratica %.3f, massima %.3f gradi"%(rms,
+                                                                                     maxdiff))
+
+if __name__ == "__main__":
+    main()
@@ -136,7 +136,7 @@ if not WINSHELL:
 
 os.makedirs(ICONDIR, exist_ok=True)
 
-SOURCEFILES = [os.path.join("dist", x) for x in os.listdir("dist") if os.path.splitext(x)[1] in (".py", ".ico", ".p")]
+SOURCEFILES = [os.path.join("dist", x) for x in os.listdir("dist") if os.path.splitext(x)[1] in (".py", ".ico", ".p", ".tab")]
 ICONFILES = [os.path.join("icons", x) for x in os.listdir("icons")]
 
 for src in SOURCEFILES:                      # Installa scripts e file dati
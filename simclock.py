@@ -0,0 +1,220 @@
+"""
+Orologio simulato per i simulatori di telescopio e cupola
+
+Sostituisce le funzioni time.time(), time.localtime() e time.sleep()
+nei simulatori (telsimulator.py, ascom_fake.py), in astro.loc_st_now(),
+in trackcore.py e nella cache di telecomm.CachedTeleCommunicator,
+in modo da poter riprodurre l'inseguimento di un'intera notte in pochi
+minuti. Modi di funzionamento:
+
+    speed = 1:   tempo reale (le funzioni coincidono con quelle del modulo time)
+    speed = N:   il tempo simulato scorre N volte più veloce del tempo reale
+                 (le attese sleep(dt) durano dt/N secondi reali)
+    speed = 0:   simulazione a eventi discreti: il tempo simulato avanza
+                 solo quando tutti i thread registrati (attach()) sono in
+                 attesa, e salta direttamente al primo risveglio previsto.
+                 Senza thread registrati ogni sleep() avanza il tempo
+                 senza attesa. Il tempo può anche essere avanzato
+                 esplicitamente con advance()
+
+L'orologio del processo (CLOCK) viene configurato all'avvio dalla
+variabile d'ambiente OPC_SIMCLOCK, con formato:
+
+    speed[,YYYY-MM-DD HH:MM:SS]
+
+dove la data opzionale è il tempo simulato iniziale (ora locale; default:
+tempo corrente). Impostando la stessa variabile per il simulatore del
+telescopio e per dtracker (cupola simulata) i due processi usano la stessa
+velocità (il modo a eventi discreti vale solo all'interno di un processo).
+
+Uso (per verificare la configurazione):
+
+      python simclock.py [-x speed] [-s "YYYY-MM-DD HH:MM:SS"]
+"""
+
+import os
+import sys
+import time
+import threading
+
+__version__ = "1.0"
+__author__ = "Luca Fini"
+__date__ = "Gennaio 2021"
+
+ENV_VAR = "OPC_SIMCLOCK"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+REAL_TIME = 1.
+STEPPING = 0.
+
+def parse_time(spec):
+    "Converte data e ora locale (YYYY-MM-DD HH:MM:SS) in secondi dall'epoca"
+    return time.mktime(time.strptime(spec.strip(), TIME_FORMAT))
+
+class SimClock:
+    """
+Orologio simulato
+
+L'attributo generation viene incrementato ad ogni nuova configurazione
+(gli oggetti che memorizzano riferimenti di tempo, es: astro.SiderealClock,
+lo usano per ricalcolarli)
+
+speed: fattore di velocità rispetto al tempo reale (0: eventi discreti)
+start: tempo simulato iniziale (secondi dall'epoca, default: tempo corrente)
+"""
+    def __init__(self, speed=REAL_TIME, start=None):
+        self._cond = threading.Condition()
+        self._actors = set()
+        self._waiting = {}
+        self.generation = 0
+        self.configure(speed, start)
+
+    def configure(self, speed=REAL_TIME, start=None):
+        "Imposta velocità e tempo iniziale"
+        if speed < 0:
+            raise ValueError("Velocità negativa: %g"%speed)
+        with self._cond:
+            self.speed = float(speed)
+            self._real = self.speed == REAL_TIME and start is None
+            self._real0 = time.monotonic()
+            self._sim0 = time.time() if start is None else float(start)
+            self.generation += 1
+            self._cond.notify_all()
+
+    def is_real(self):
+        "Riporta True se l'orologio segue il tempo reale"
+        return self._real
+
+    def time(self):
+        "Tempo simulato (secondi dall'epoca, come time.time())"
+        if self.speed == STEPPING:
+            return self._sim0
+        if self.is_real():
+            return time.time()
+        return self._sim0+(time.monotonic()-self._real0)*self.speed
+
+    def monotonic(self):
+        "Tempo simulato monotono (sec, come time.monotonic(); riferimento arbitrario)"
+        if self.is_real():
+            return time.monotonic()
+        return self.time()
+
+    def localtime(self):
+        "Tempo simulato come struct_time locale (come time.localtime())"
+        return time.localtime(self.time())
+
+    def sleep(self, delay):
+        "Attesa di delay secondi di tempo simulato"
+        if self.speed == STEPPING:
+            self._step_sleep(delay)
+        elif self.is_real():
+            time.sleep(delay)
+        else:
+            time.sleep(delay/self.speed)
+
+    def attach(self):
+        "Registra il thread corrente fra quelli che partecipano agli eventi discreti"
+        with self._cond:
+            self._actors.add(threading.get_ident())
+
+    def detach(self):
+        "Cancella la registrazione del thread corrente"
+        with self._cond:
+            self._actors.discard(threading.get_ident())
+            self._maybe_advance()
+
+    def advance(self, delta):
+        "Avanza esplicitamente il tempo simulato (solo nel modo a eventi discreti)"
+        with self._cond:
+            if self.speed != STEPPING:
+                raise RuntimeError("advance() valido solo nel modo a eventi discreti")
+            self._sim0 += delta
+            self._cond.notify_all()
+
+    def _maybe_advance(self):
+        "Avanza al primo risveglio se tutti i thread registrati sono in attesa"
+        if not self._waiting:
+            return
+        if not self._actors.issubset(self._waiting):
+            return
+        wakeup = min(self._waiting.values())
+        if wakeup > self._sim0:
+            self._sim0 = wakeup
+        self._cond.notify_all()
+
+    def _step_sleep(self, delay):
+        "Attesa nel modo a eventi discreti"
+        with self._cond:
+            wakeup = self._sim0+max(0., delay)
+            if not self._actors:
+                self._sim0 = max(self._sim0, wakeup)
+                return
+            ident = threading.get_ident()
+            self._waiting[ident] = wakeup
+            try:
+                self._maybe_advance()
+                while self.speed == STEPPING and self._sim0 < wakeup:
+                    self._cond.wait()
+            finally:
+                del self._waiting[ident]
+
+    def __str__(self):
+        if self.speed == STEPPING:
+            mode = "eventi discreti"
+        else:
+            mode = "velocità x%g"%self.speed
+        return "Orologio simulato: %s - tempo: %s"%(mode, time.strftime(TIME_FORMAT,
+                                                                         self.localtime()))
+
+def from_spec(spec):
+    "Crea orologio dalla specifica: speed[,YYYY-MM-DD HH:MM:SS]"
+    speed, _unused, start = spec.partition(",")
+    return SimClock(float(speed) if speed.strip() else REAL_TIME,
+                    parse_time(start) if start.strip() else None)
+
+CLOCK = from_spec(os.environ.get(ENV_VAR, ""))
+
+def configure(speed=REAL_TIME, start=None):
+    "Configura l'orologio del processo"
+    CLOCK.configure(speed, start)
+
+def now():
+    "Tempo simulato (come time.time())"
+    return CLOCK.time()
+
+def monotonic():
+    "Tempo simulato monotono (come time.monotonic())"
+    return CLOCK.monotonic()
+
+def localtime():
+    "Tempo simulato locale (come time.localtime())"
+    return CLOCK.localtime()
+
+def sleep(delay):
+    "Attesa in tempo simulato (come time.sleep())"
+    CLOCK.sleep(delay)
+
+def get_arg(flag, default):
+    "Legge valore di un'opzione"
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag)+1]
+    return default
+
+def main():
+    "Verifica configurazione dell'orologio"
+    if "-h" in sys.argv:
+        print(__doc__)
+        sys.exit()
+    if "-x" in sys.argv or "-s" in sys.argv:
+        start = get_arg("-s", "")
+        configure(float(get_arg("-x", REAL_TIME)), parse_time(start) if start else None)
+    print(CLOCK)
+    if CLOCK.speed != STEPPING:
+        tm0 = time.monotonic()
+        sim0 = now()
+        sleep(1.)
+        print("sleep(1): %.3f sec reali, %.3f sec simulati"%(time.monotonic()-tm0,
+                                                              now()-sim0))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Misura dei tempi di avvio di dtracker.py e dtrackerd.py
+
+Misura (media su più esecuzioni, in processi separati):
+
+  - il tempo di esecuzione di "dtracker.py -v" (usato dal Makefile)
+    e di "dtrackerd.py -v" / "dtrackerd.py -h"
+  - il tempo di caricamento delle tabelle di interpolazione, che in
+    precedenza veniva speso all'importazione di dtracker.py
+  - il tempo fino alla visualizzazione della prima finestra di dtracker
+    con caricamento delle tabelle differito (modo attuale) e anticipato
+    all'avvio (modo precedente). Richiede un display.
+
+Uso:
+      python startuptest.py [-n num]
+
+dove:
+      -n  Numero di ripetizioni di ciascuna misura (default: 10)
+"""
+
+import sys
+import os
+import time
+import subprocess
+
+NREPEAT = 10
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+FRAME_FLAG = "--first-frame"
+EAGER_FLAG = "--eager"
+
+def run_time(args):
+    "Tempo di esecuzione di un comando python (sec). None se fallisce"
+    tm0 = time.perf_counter()
+    ret = subprocess.run([sys.executable]+args, cwd=HERE, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL)
+    if ret.returncode:
+        return None
+    return time.perf_counter()-tm0
+
+def child_time(args):
+    "Esegue comando python che stampa un tempo (sec). None se fallisce"
+    ret = subprocess.run([sys.executable]+args, cwd=HERE, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, universal_newlines=True)
+    if ret.returncode:
+        return None
+    return float(ret.stdout.split()[-1])
+
+def average(func, args, nrep):
+    "Tempo medio di nrep esecuzioni (ms). None se fallisce"
+    total = 0.
+    for _unused in range(nrep):
+        tval = func(args)
+        if tval is None:
+            return None
+        total += tval
+    return total*1000./nrep
+
+def report(label, value):
+    "Stampa risultato"
+    if value is None:
+        print("%-44s %12s"%(label, "non disp."))
+    else:
+        print("%-44s %9.1f ms"%(label, value))
+
+def first_frame(eager):
+    "Processo figlio: tempo dall'avvio alla prima finestra di dtracker (sec)"
+    tm0 = time.perf_counter()
+    import dtracker                              # pylint: disable=C0415
+    import trackcore                             # pylint: disable=C0415
+    from tkinter import Tk                       # pylint: disable=C0415
+    if eager:
+        trackcore.get_interpolator(trackcore.BR_EAST)
+        trackcore.get_interpolator(trackcore.BR_WEST)
+    dtracker.GLOB.config = dtracker.configure.get_config(0)
+    dtracker.GLOB.core = trackcore.TrackerCore(dtracker.GLOB.config)
+    dtracker.GLOB.root = Tk()
+    wdg = dtracker.DTracker(dtracker.GLOB.root, logging=False)
+    wdg.pack()
+    dtracker.GLOB.root.update()
+    elapsed = time.perf_counter()-tm0
+    dtracker.GLOB.root.destroy()
+    print(elapsed)
+
+def tables_time():
+    "Processo figlio: tempo di caricamento delle tabelle (sec)"
+    import trackcore                             # pylint: disable=C0415
+    tm0 = time.perf_counter()
+    trackcore.get_interpolator(trackcore.BR_EAST)
+    trackcore.get_interpolator(trackcore.BR_WEST)
+    print(time.perf_counter()-tm0)
+
+def main():
+    "Procedura di test"
+    if "-h" in sys.argv:
+        print(__doc__)
+        sys.exit()
+    if FRAME_FLAG in sys.argv:
+        first_frame(EAGER_FLAG in sys.argv)
+        sys.exit()
+    if "--tables" in sys.argv:
+        tables_time()
+        sys.exit()
+    if "-n" in sys.argv:
+        nrep = int(sys.argv[sys.argv.index("-n")+1])
+    else:
+        nrep = NREPEAT
+
+    tabfmt = "binario" if os.path.exists(os.path.join(HERE, "dometab_e.tab")) else "pickle"
+    print("Tempi medi su %d esecuzioni (tabelle in formato %s)"%(nrep, tabfmt))
+    print()
+    report("python dtracker.py -v", average(run_time, ["dtracker.py", "-v"], nrep))
+    report("python dtrackerd.py -v", average(run_time, ["dtrackerd.py", "-v"], nrep))
+    report("python dtrackerd.py -h", average(run_time, ["dtrackerd.py", "-h"], nrep))
+    report("Caricamento tabelle (risparmiato con -v/-h)",
+           average(child_time, [__file__, "--tables"], nrep))
+    report("Prima finestra, tabelle differite",
+           average(child_time, [__file__, FRAME_FLAG], nrep))
+    report("Prima finestra, tabelle caricate all'avvio",
+           average(child_time, [__file__, FRAME_FLAG, EAGER_FLAG], nrep))
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,17 @@ Implementa i comandi LX200 specifici per OnStep
 
 Uso interattivo:
 
-      python telcomm.py [-dhvV]
+      python telcomm.py [-cdhkvV] [-s sec]
+      python telcomm.py -b [num]
 
 Dove:
+      -b  Misura la velocità di decodifica delle risposte (formato fisso
+          e generico) per num ripetizioni (default: 100000)
       -d  Collegamento al simulatore (IP: 127.0.0.1, Port: 9753)
+      -c  Usa la cache delle interrogazioni (CachedTeleCommunicator)
+      -k  Usa connessione persistente (keep-alive)
+      -s  Visualizza periodicamente le statistiche di comunicazione
+          (-s sec: periodo in secondi, default: 60)
       -v  Modo verboso (visualizza protocollo)
       -V  Mostra versione ed esci
 
@@ -18,21 +25,25 @@ Il file puo essere importato come modulo.
 import sys
 import re
 import socket
+import asyncio
+import functools
+import threading
 import time
-import configure as conf
+import configdata as conf
+import simclock
 
-from astro import OPC, float2ums, loc_st_now
+from framereader import FrameReader
+from telestats import CommStats, StatsDumper, report, Histogram
+from cmdencoder import CommandEncoder, RA_LAYOUT, DE_LAYOUT, MOVE_LAYOUT, ALT_LAYOUT, AZ_LAYOUT
+from astro import OPC, float2ums, loc_st_now, TCIV_TO_TSID, SiderealClock
 
 __version__ = "2.5"
 __date__ = "Marzo 2020"
 __author__ = "L.Fini, L.Naponiello"
 
                                   # Comandi definiti
-                                  # Comandi di preset
-_SET_ALT = ":Sa%s%02d*%02d'%02d#" # Set altezza target (+-dd,mm,ss)
-_SET_AZ = ":Sz%03d*%02d"          # Set azimuth target (ddd,mm)
+                                  # Comandi di preset (:Sr, :Sd, :Sa, :Sz: vedi cmdencoder)
 _SET_DATE = ":SC%02d/%02d/%02d#"  # Set data
-_SET_DEC = ":Sd%s%02d*%02d:%02d.%03d#" # Set declinazione target (+dd,mm,ss.sss)
 _SET_LAT = ":St%s%02d*%02d#"      # Set latitudine del luogo (+dd, mm)
 _SET_LON = ":Sg%s%03d*%02d#"      # Set longitudine del luogo (+ddd, mm)
 _SET_MNAP = ":Sh+%02d#"           # Set minima altezza raggiungibile (+dd)
@@ -40,7 +51,6 @@ _SET_MNAN = ":Sh-%02d#"           # Set minima altezza raggiungibile (-dd)
 _SET_MAXA = ":So%02d#"            # Set massima altezza raggiungibile (dd)
 _SET_LTIME = ":SL%02d:%02d:%02d#" # Set ora locale: hh, mm, ss
 _SET_ONSTEP_V = ":SX%s,%s#"       # Set valore OnStep
-_SET_RA = ":Sr%02d:%02d:%02d.%03d#"# Set ascensione retta dell'oggetto target (hh,mm,ss.sss)
 _SET_TRATE = ":ST%08.5f#"         # Set freq. di tracking (formato da commenti nel codice)
 _SET_TSID = ":SS%02d:%02d:%02d#"  # Set tempo sidereo: hh, mm, ss
 _SET_UOFF = ":SG%s%04.1f#"        # Set UTC offset (UTC = LocalTime+Offset)
@@ -171,6 +181,57 @@ _ROT_SETPOS = ":rS%s%03d*%02d'%02d#" # Set posizione rotatore (+-dd, mm, ss)
 
 _ROT_GET = ":rG#"       # Legge posizione rotatore (gradi)
 
+                        # Comandi con risposta di un solo carattere, senza
+                        # terminatore "#" (0/1 o codice di errore)
+_ONECHAR_REPLY = (":S", ":MS", ":Te", ":Td", ":To", ":Tr", ":Tn",
+                  ":hP", ":hR", ":$B", ":FA", ":rS")
+
+                        # Comandi senza risposta
+_NO_REPLY = (":SS", ":R", ":Q", ":Me", ":Mw", ":Mn", ":Ms", ":Mg", ":CS", ":CM",
+             ":T+", ":T-", ":TK", ":TL", ":TQ", ":TS", ":T1", ":T2", ":TR",
+             ":hF", ":hC", ":hQ", ":r+", ":r-", ":rc", ":rP", ":rR", ":rF", ":rC",
+             ":r>", ":r<", ":r1", ":r2", ":r3",
+             ":F+", ":F-", ":FQ", ":FZ", ":FF", ":FR", ":FS", ":F1", ":F2", ":F3", ":F4",
+             ":f+", ":f-", ":fQ", ":fZ", ":fF", ":fR", ":fS", ":f1", ":f2", ":f3", ":f4")
+
+# Interrogazioni eseguibili con query_many(): nome metodo -> (comando, decodifica)
+#
+# Tipi di decodifica:  str: stringa come ricevuta
+#                      ums: dd:mm:ss senza segno     sms: dd:mm:ss con segno
+#                      sdm: dd:mm con segno          flt: float
+#                      ha:  angolo orario da ascensione retta
+_QUERIES = {"get_alt": (_GET_ALT, "sms"),
+            "get_az": (_GET_AZ, "ums"),
+            "get_current_de": (_GET_CUR_DE, "sms"),
+            "get_current_deh": (_GET_CUR_DEH, "sms"),
+            "get_current_ha": (_GET_CUR_RAH, "ha"),
+            "get_current_ra": (_GET_CUR_RA, "ums"),
+            "get_current_rah": (_GET_CUR_RAH, "ums"),
+            "get_date": (_GET_DATE, "str"),
+            "get_db": (_GET_DB, "str"),
+            "get_fmwdate": (_GET_FMWDATE, "str"),
+            "get_fmwname": (_GET_FMWNAME, "str"),
+            "get_fmwnumb": (_GET_FMWNUMB, "str"),
+            "get_fmwtime": (_GET_FMWTIME, "str"),
+            "get_genmsg": (_GET_GENMSG, "str"),
+            "get_lat": (_GET_LAT, "sdm"),
+            "get_lon": (_GET_LON, "sdm"),
+            "get_ltime": (_GET_LTIME, "ums"),
+            "get_mstat": (_GET_MSTAT, "str"),
+            "get_pside": (_GET_PSIDE, "str"),
+            "get_status": (_GET_STAT, "str"),
+            "get_target_de": (_GET_TAR_DE, "sms"),
+            "get_target_deh": (_GET_TAR_DEH, "sms"),
+            "get_target_ra": (_GET_TAR_RA, "ums"),
+            "get_target_rah": (_GET_TAR_RAH, "ums"),
+            "get_timefmt": (_GET_TFMT, "str"),
+            "get_trate": (_GET_TRATE, "flt"),
+            "get_tsid": (_GET_TSID, "ums"),
+            "get_utcoffset": (_GET_UOFF, "flt"),
+           }
+
+QUERY_NAMES = tuple(sorted(_QUERIES))
+
 _ERRCODE = "Codice di errore"
 
 _CODICI_STATO = {
@@ -339,65 +400,176 @@ _CODICI_ONSTEP_GX = """
   GF:   valueAux15/2.55
 """
 
+def expects_reply(command):
+    "Riporta True se il comando LX200 prevede una risposta"
+    return not command.startswith(_NO_REPLY)
+
 def get_version():
     "Riporta informazioni su versione"
     return "telecomm.py - Vers. %s. %s. %s"%(__version__, __author__, __date__)
 
+_SIDEREAL_CLOCK = SiderealClock()    # Tempo sidereo locale per il calcolo dell'angolo orario
+
+SPIN_TIME = 0.002    # Attesa attiva prima degli invii a cadenza fissa (sec)
+
+_TARGET_LAYOUTS = ((RA_LAYOUT, DE_LAYOUT), (RA_LAYOUT, DE_LAYOUT, MOVE_LAYOUT))
+_TARGET_REPLIES = ("11", "110")      # Risposte attese da set_target (senza/con :MS)
+
+def wait_until(deadline, halt=None):
+    """Attende fino all'istante dato (time.perf_counter()): sleep fino a SPIN_TIME
+prima della scadenza, poi attesa attiva per ridurre il jitter.
+
+halt: threading.Event per l'interruzione (opzionale)
+
+Riporta False se l'attesa è stata interrotta"""
+    delay = deadline-time.perf_counter()-SPIN_TIME
+    if delay > 0:
+        if halt is None:
+            time.sleep(delay)
+        elif halt.wait(delay):
+            return False
+    while time.perf_counter() < deadline:
+        pass
+    return halt is None or not halt.is_set()
+
 _DDMMSS_RE = re.compile("[+-]?(\\d{2,3})[*:](\\d{2})[':](\\d{2}(\\.\\d+)?)")
 _DDMM_RE = re.compile("[+-]?(\\d{2,3})[*:](\\d{2})")
 
+# Decodifica veloce delle risposte a formato fisso, selezionata in base al
+# comando. Le funzioni riportano None se la risposta non ha il formato atteso:
+# in tal caso viene usata la decodifica generica (espressioni regolari)
+
+_DIGITS2 = {"%02d"%num: num for num in range(100)}    # Conversione campi di 2 e 3 cifre
+_DIGITS3 = {"%03d"%num: num for num in range(1000)}
+
+def _hms_fast(text):
+    "Decodifica HH:MM:SS# oppure HH:MM:SS.sss#"
+    if len(text) < 9 or text[2] != ":" or text[5] != ":" or text[-1] != "#":
+        return None
+    try:
+        sss = _DIGITS2[text[6:8]] if len(text) == 9 else float(text[6:-1])
+        return _DIGITS2[text[0:2]]+_DIGITS2[text[3:5]]/60.+sss/3600.
+    except (KeyError, ValueError):
+        return None
+
+def _dms_fast(text):
+    "Decodifica sDD*MM:SS# oppure sDD*MM:SS.sss# (anche sDD*MM'SS#)"
+    if len(text) < 10 or text[3] != "*" or text[6] not in ":'" or text[-1] != "#":
+        return None
+    sgn = text[0]
+    if sgn not in "+-":
+        return None
+    try:
+        sss = _DIGITS2[text[7:9]] if len(text) == 10 else float(text[7:-1])
+        return (_DIGITS2[text[1:3]]+_DIGITS2[text[4:6]]/60.+sss/3600.)*(-1 if sgn == "-" else 1)
+    except (KeyError, ValueError):
+        return None
+
+def _ddd_fast(text):
+    "Decodifica DDD*MM:SS# (anche DDD*MM'SS#)"
+    if len(text) != 10 or text[3] != "*" or text[6] not in ":'" or text[9] != "#":
+        return None
+    try:
+        return _DIGITS3[text[0:3]]+_DIGITS2[text[4:6]]/60.+_DIGITS2[text[7:9]]/3600.
+    except KeyError:
+        return None
+
+def _dm_fast(text):
+    "Decodifica sDD*MM# oppure sDDD*MM#"
+    star = len(text)-4
+    if star not in (3, 4) or text[star] != "*" or text[-1] != "#":
+        return None
+    sgn = text[0]
+    if sgn not in "+-":
+        return None
+    units = _DIGITS2 if star == 3 else _DIGITS3
+    try:
+        return (units[text[1:star]]+_DIGITS2[text[star+1:star+3]]/60.)*(-1 if sgn == "-" else 1)
+    except KeyError:
+        return None
+
+_FAST_DECODERS = {_GET_CUR_RA: _hms_fast, _GET_CUR_RAH: _hms_fast,
+                  _GET_TAR_RA: _hms_fast, _GET_TAR_RAH: _hms_fast,
+                  _GET_LTIME: _hms_fast, _GET_TSID: _hms_fast,
+                  _GET_CUR_DE: _dms_fast, _GET_CUR_DEH: _dms_fast,
+                  _GET_TAR_DE: _dms_fast, _GET_TAR_DEH: _dms_fast,
+                  _GET_ALT: _dms_fast, _GET_AZ: _ddd_fast,
+                  _GET_LAT: _dm_fast, _GET_LON: _dm_fast}
+
 
 class TeleCommunicator:
     "Gestione comunicazione con server telescopio (LX200 specifico OnStep)"
 
-    def __init__(self, ipadr, port, timeout=0.5):
+    def __init__(self, ipadr, port, timeout=0.5, keepalive=False):
         """Inizializzazione TeleCommunicator:
 
-ipaddr:  Indirizzo IP telescopio (str)
-port:    Port IP telescopio (int)
-timeout: Timeout comunicazione in secondi (float)
+ipaddr:    Indirizzo IP telescopio (str)
+port:      Port IP telescopio (int)
+timeout:   Timeout comunicazione in secondi (float)
+keepalive: Se True mantiene aperta una sola connessione, condivisa da
+           tutti i comandi e riaperta automaticamente se cade. Se False
+           apre una connessione per ogni comando (per firmware che chiude
+           la connessione dopo ogni risposta)
 """
         self.connected = False
         self.ipadr = ipadr
         self.port = port
         self.timeout = timeout
+        self.keepalive = keepalive
+        self._skt = None
+        self._reader = FrameReader()
+        self._lock = threading.Lock()
         self._errmsg = ""
         self._command = ""
         self._reply = ""
+        self._stats = CommStats()
+        self._encoder = None
 
     def _float_decode(self, the_str):
         "Decodifica stringa x.xxxx"
+        if the_str is None:
+            self._errmsg = "Valore mancante"
+            return None
         try:
-            val = float(the_str)
+            val = float(the_str.rstrip("#"))
         except ValueError:
             val = float('nan')
             self._errmsg = "Errore decodifica valore float"
         return val
 
-    def _ddmmss_decode(self, the_str, with_sign=False):
-        "Decodifica stringa DD.MM.SS. Riporta float"
+    def _ddmmss_decode(self, the_str, with_sign=False, command=None):
+        "Decodifica stringa DD.MM.SS (formato fisso, se previsto per il comando). Riporta float"
         if the_str is None:
             self._errmsg = "Valore mancante"
             return None
+        fast = _FAST_DECODERS.get(command)
+        if fast is not None:
+            value = fast(the_str)
+            if value is not None:
+                return value
         if with_sign:
             sgn = -1 if the_str[0] == "-" else 1
         else:
             sgn = 1
         flds = _DDMMSS_RE.match(the_str)
-        try:
-            ddd = int(flds.group(1))
-            mmm = int(flds.group(2))
-            sss = float(flds.group(3))
-        except:
+        if not flds:
             self._errmsg = "Errore decodifica valore dd.mm.ss"
             return None
+        ddd = int(flds.group(1))
+        mmm = int(flds.group(2))
+        sss = float(flds.group(3))
         return (ddd+mmm/60.+sss/3600.)*sgn
 
-    def _ddmm_decode(self, the_str, with_sign=False):
-        "Decodifica stringa DD.MM. Riporta float"
+    def _ddmm_decode(self, the_str, with_sign=False, command=None):
+        "Decodifica stringa DD.MM (formato fisso, se previsto per il comando). Riporta float"
         if the_str is None:
             self._errmsg = "Valore mancante"
             return None
+        fast = _FAST_DECODERS.get(command)
+        if fast is not None:
+            value = fast(the_str)
+            if value is not None:
+                return value
         if with_sign:
             sgn = -1 if the_str[0] == "-" else 1
         else:
@@ -410,54 +582,334 @@ timeout: Timeout comunicazione in secondi (float)
         mmm = int(flds.group(2))
         return (ddd+mmm/60.)*sgn
 
-    def __send_cmd(self, command, expected):
-        """
-Invio comandi. expected == True: prevista risposta.
+    def _ha_decode(self, the_str, command=None):
+        "Decodifica ascensione retta e calcola angolo orario (ore)"
+        rah = self._ddmmss_decode(the_str, command=command)
+        if rah is None:
+            return None
+        return _SIDEREAL_CLOCK.lst()-rah
+
+    def _decode(self, kind, the_str, command=None):
+        "Decodifica risposta secondo il tipo (vedi _QUERIES) e il comando"
+        if kind == "str":
+            if the_str is None:
+                self._errmsg = "Valore mancante"
+            return the_str
+        if kind == "ums":
+            return self._ddmmss_decode(the_str, command=command)
+        if kind == "sms":
+            return self._ddmmss_decode(the_str, with_sign=True, command=command)
+        if kind == "sdm":
+            return self._ddmm_decode(the_str, with_sign=True, command=command)
+        if kind == "ha":
+            return self._ha_decode(the_str, command=command)
+        if the_str is None:
+            self._errmsg = "Valore mancante"
+            return None
+        return self._float_decode(the_str)
 
-Possibili valori di ritorno:
-    '':      Nessuna risposta attesa
-    'xxxx':  Stringa di ritorno da OnStep
-    1/0:     Successo/fallimento da OnStep
-    None:    Risposta prevista ma non ricevuta"""
-        self._errmsg = ""
-        self._reply = ""
-        self._command = command
+    def __connect(self):
+        "Apre connessione con il server del telescopio"
         skt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         skt.settimeout(self.timeout)
         try:
             skt.connect((self.ipadr, self.port))
+        except IOError:
+            skt.close()
+            raise
+        if self.keepalive:
+            skt.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return skt
+
+    def close(self):
+        "Chiude la connessione persistente (se aperta)"
+        with self._lock:
+            self.__drop()
+
+    def __drop(self):
+        "Chiude socket persistente"
+        if self._skt is not None:
+            try:
+                self._skt.close()
+            except IOError:
+                pass
+        self._skt = None
+        self.connected = False
+
+    def __check_link(self):
+        """Verifica connessione persistente prima dell'invio
+
+Scarta eventuali caratteri residui (risposte non lette) e chiude
+il socket se il server ha chiuso la connessione"""
+        self._reader.reset()
+        skt = self._skt
+        skt.setblocking(False)
+        try:
+            while True:
+                data = skt.recv(256)
+                if not data:
+                    self.__drop()
+                    return
+        except BlockingIOError:
+            pass
+        except IOError:
+            self.__drop()
+            return
+        finally:
+            if self._skt is not None:
+                skt.settimeout(self.timeout)
+
+    def __read_reply(self, single):
+        """Legge risposta fino al terminatore '#' (o un solo carattere
+se single == True). Riporta (risposta, completa)"""
+        if single:
+            ret = self._reader.read_count(1)
+            return ret, len(ret) == 1
+        ret = self._reader.read_frame()
+        return ret, ret.endswith(b"#")
+
+    def __record(self, command, timing, tstart, tsent=None,     # pylint: disable=R0913
+                 received=0, error=None):
+        """Registra tempi e caratteri trasferiti per un comando (vedi telestats)
+
+timing: tempi delle fasi connect e send già eseguite
+tstart: inizio esecuzione
+tsent:  fine dell'invio, per il calcolo di first_byte (None: non calcolato)
+error:  messaggio di errore (default: ultimo errore)"""
+        timing = dict(timing, complete=time.perf_counter()-tstart)
+        first = self._reader.first_data
+        if received and first is not None and tsent is not None:
+            timing["first_byte"] = max(0., first-tsent)
+        self._stats.record(command, timing, len(command) if "send" in timing else 0, received,
+                           self._errmsg if error is None else error)
+
+    def __send_once(self, command, expected, data=None):
+        "Invio comando con connessione dedicata (data: comando già codificato)"
+        tm0 = time.perf_counter()
+        timing = {}
+        try:
+            skt = self.__connect()
         except IOError:
             self._errmsg = "Tel. non connesso"
+            self.__record(command, timing, tm0)
             return None
+        tm1 = time.perf_counter()
+        timing["connect"] = tm1-tm0
+        self._reader.attach(skt)
         try:
-            skt.sendall(command.encode("ascii"))
+            skt.sendall(command.encode("ascii") if data is None else data)
         except socket.timeout:
             skt.close()
             self._errmsg = "Timeout"
+            self.__record(command, timing, tm0)
             return None
+        tm2 = time.perf_counter()
+        timing["send"] = tm2-tm1
         ret = b""
         repl = None
         if expected:
             try:
-                while True:
-                    nchr = skt.recv(1)
-                    if not nchr:
-                        break
-                    ret += nchr
-                    if nchr == b"#":
-                        break
+                ret = self.__read_reply(command.startswith(_ONECHAR_REPLY))[0]
             except (socket.timeout, IOError):
+                ret = self._reader.take()
                 self._errmsg = "Risposta senza terminatore #"
             finally:
                 skt.close()
                 repl = ret.decode("ascii")
                 self._reply = repl
         else:
+            skt.close()
             repl = ""
+        self.__record(command, timing, tm0, tm2, len(ret))
         return repl
 
+    def __ensure_link(self):
+        "Verifica connessione persistente e la riapre se necessario"
+        if self._skt is not None:
+            self.__check_link()
+        if self._skt is None:
+            try:
+                self._skt = self.__connect()
+            except IOError:
+                self._errmsg = "Tel. non connesso"
+                return False
+            self._reader.attach(self._skt)
+            self.connected = True
+        return True
+
+    def __send_keep(self, command, expected, data=None):
+        "Invio comando su connessione persistente (data: comando già codificato)"
+        single = command.startswith(_ONECHAR_REPLY)
+        tm0 = time.perf_counter()
+        for retry in (True, False):
+            timing = {}
+            tm2 = None
+            skt = self._skt
+            if not self.__ensure_link():
+                self.__record(command, timing, tm0)
+                return None
+            tm1 = time.perf_counter()
+            if self._skt is not skt:
+                timing["connect"] = tm1-tm0
+            try:
+                self._skt.sendall(command.encode("ascii") if data is None else data)
+                tm2 = time.perf_counter()
+                timing["send"] = tm2-tm1
+                if not expected:
+                    self.__record(command, timing, tm0, tm2)
+                    return ""
+                ret, complete = self.__read_reply(single)
+            except socket.timeout:
+                self.__drop()
+                self._errmsg = "Timeout"
+                self.__record(command, timing, tm0, tm2)
+                return None
+            except IOError:
+                self.__drop()
+                if retry:
+                    continue
+                self._errmsg = "Tel. non connesso"
+                self.__record(command, timing, tm0, tm2)
+                return None
+            if not complete:            # Connessione chiusa dal server
+                self.__drop()
+                if retry and not ret:
+                    continue
+                self._errmsg = "Risposta senza terminatore #"
+            self.__record(command, timing, tm0, tm2, len(ret))
+            repl = ret.decode("ascii")
+            self._reply = repl
+            return repl
+        return None
+
+    def __pipeline(self, skt, commands, tstart, timing, data=None):   # pylint: disable=R0913
+        """Invia più comandi con un solo invio e legge le risposte in ordine.
+
+tstart, timing: inizio esecuzione e tempo di connessione (per le statistiche)
+data:           comandi già codificati (commands contiene allora i formati,
+                vedi cmdencoder)
+
+Riporta lista di coppie (risposta, errore). Errore "Risposta mancante"
+indica che il server ha chiuso la connessione prima di rispondere"""
+        results = []
+        tm1 = time.perf_counter()
+        try:
+            skt.sendall("".join(commands).encode("ascii") if data is None else data)
+        except socket.timeout:
+            for command in commands:
+                self.__record(command, timing, tstart, error="Timeout")
+            return [(None, "Timeout")]*len(commands)
+        except IOError:
+            return [(None, "Risposta mancante")]*len(commands)
+        tsent = time.perf_counter()
+        timing = dict(timing, send=tsent-tm1)
+        for command in commands:
+            try:
+                ret, complete = self.__read_reply(command.startswith(_ONECHAR_REPLY))
+            except socket.timeout:
+                results.append((None, "Timeout"))
+                self.__record(command, timing, tstart, tsent, error="Timeout")
+                break
+            except IOError:
+                ret, complete = b"", False
+            if complete:
+                results.append((ret.decode("ascii"), ""))
+            elif ret:
+                results.append((ret.decode("ascii"), "Risposta senza terminatore #"))
+            else:
+                break
+            self.__record(command, timing, tstart, tsent if len(results) == 1 else None,
+                          len(ret), results[-1][1])
+            if not complete:
+                break
+        missing = "Timeout" if results and results[-1][1] == "Timeout" else "Risposta mancante"
+        if missing == "Timeout":
+            for command in commands[len(results):]:
+                self.__record(command, timing, tstart, error="Timeout")
+        while len(results) < len(commands):
+            results.append((None, missing))
+        return results
+
+    def __send_many(self, commands, data=None):
+        "Invio in sequenza (pipeline) di più comandi con risposta (data: vedi __pipeline)"
+        tm0 = time.perf_counter()
+        if self.keepalive:
+            skt = self._skt
+            if not self.__ensure_link():
+                for command in commands:
+                    self.__record(command, {}, tm0)
+                return [(None, self._errmsg)]*len(commands)
+            timing = {} if self._skt is skt else {"connect": time.perf_counter()-tm0}
+            results = self.__pipeline(self._skt, commands, tm0, timing, data)
+            if any(err for _unused, err in results):
+                self.__drop()
+        else:
+            try:
+                skt = self.__connect()
+            except IOError:
+                for command in commands:
+                    self.__record(command, {}, tm0, error="Tel. non connesso")
+                return [(None, "Tel. non connesso")]*len(commands)
+            self._reader.attach(skt)
+            results = self.__pipeline(skt, commands, tm0,
+                                      {"connect": time.perf_counter()-tm0}, data)
+            skt.close()
+        offset = 0
+        for nres, (command, (_unused, err)) in enumerate(zip(commands, results)):
+            if err == "Risposta mancante":   # Il server non accetta comandi in sequenza:
+                self._errmsg = ""            # prosegue con un comando alla volta
+                part = None if data is None else data[offset:offset+len(command)]
+                if self.keepalive:
+                    repl = self.__send_keep(command, True, part)
+                else:
+                    repl = self.__send_once(command, True, part)
+                results[nres] = (repl, self._errmsg)
+            offset += len(command)
+        return results
+
+    def __send_cmd(self, command, expected):
+        """
+Invio comandi. expected == True: prevista risposta.
+
+Possibili valori di ritorno:
+    '':      Nessuna risposta attesa
+    'xxxx':  Stringa di ritorno da OnStep
+    1/0:     Successo/fallimento da OnStep
+    None:    Risposta prevista ma non ricevuta"""
+        with self._lock:
+            self._errmsg = ""
+            self._reply = ""
+            self._command = command
+            if self.keepalive:
+                return self.__send_keep(command, expected)
+            return self.__send_once(command, expected)
+
+    def __send_encoded(self, data, layouts):
+        """Invio di comandi composti da cmdencoder, con risposta di un carattere
+
+data:    comandi codificati (bytes)
+layouts: formati dei comandi contenuti (vedi cmdencoder)
+
+Riporta le risposte concatenate (None se manca una risposta)"""
+        with self._lock:
+            self._errmsg = ""
+            self._reply = ""
+            self._command = data
+            if len(layouts) == 1:
+                if self.keepalive:
+                    return self.__send_keep(layouts[0], True, data)
+                return self.__send_once(layouts[0], True, data)
+            replies = self.__send_many(layouts, data)
+            self._errmsg = "; ".join(err for _unused, err in replies if err)
+            if any(repl is None for repl, _unused in replies):
+                return None
+            self._reply = "".join(repl for repl, _unused in replies)
+            return self._reply
+
     def last_command(self):
         "Riporta ultimo comando LX200"
+        if isinstance(self._command, bytes):
+            return self._command.decode("ascii")
         return self._command
 
     def last_reply(self):
@@ -468,14 +920,56 @@ Possibili valori di ritorno:
         "Riporta ultimo messaggio di errore"
         return self._errmsg
 
+    def stats(self):
+        """Riporta le statistiche di comunicazione per comando: numero di
+esecuzioni, errori, timeout, caratteri inviati e ricevuti, tempi per fase
+(vedi telestats.CommStats.snapshot(); per la visualizzazione: telestats.report())"""
+        return self._stats.snapshot()
+
+    def reset_stats(self):
+        "Azzera le statistiche di comunicazione"
+        self._stats.reset()
+
+    def query_many(self, names):
+        """Esegue più interrogazioni con un unico invio (pipeline)
+
+names: sequenza di nomi di metodi get_... (vedi QUERY_NAMES)
+
+Riporta lista di coppie (valore, errore) nell'ordine delle richieste,
+dove valore è decodificato come dal metodo corrispondente ed errore
+è la stringa vuota in caso di successo"""
+        try:
+            specs = [_QUERIES[name] for name in names]
+        except KeyError as excp:
+            raise ValueError("Interrogazione non prevista: %s"%str(excp))
+        with self._lock:
+            self._errmsg = ""
+            self._reply = ""
+            commands = [spec[0] for spec in specs]
+            self._command = "".join(commands)
+            replies = self.__send_many(commands)
+            results = []
+            for (cmd, kind), (repl, err) in zip(specs, replies):
+                if repl is None:
+                    results.append((None, err))
+                    continue
+                self._errmsg = ""
+                value = self._decode(kind, repl, cmd)
+                results.append((value, err or self._errmsg))
+            self._reply = "".join(repl for repl, _unused in replies if repl)
+            self._errmsg = "; ".join(err for _unused, err in results if err)
+        return results
+
+    def encoder(self):
+        "Riporta il compositore dei comandi di impostazione (vedi cmdencoder)"
+        if self._encoder is None:
+            self._encoder = CommandEncoder()
+        return self._encoder
+
     def set_ra(self, hours):
         "Imposta ascensione retta oggetto (ore)"
         if 0. <= hours < 24.:
-            _unused, hrs, mins, secs = float2ums(hours, precision=4)
-            isec = int(secs)
-            rest = int((secs-isec)*10000)
-            cmd = _SET_RA % (hrs, mins, isec, rest)
-            ret = self.__send_cmd(cmd, 1)
+            ret = self.__send_encoded(self.encoder().ra(hours), (RA_LAYOUT,))
         else:
             raise ValueError
         return ret
@@ -483,10 +977,7 @@ Possibili valori di ritorno:
     def set_alt(self, deg):
         "Imposta altezza oggetto (gradi)"
         if -90. <= deg <= 90.:
-            sign, degs, mins, secs = float2ums(deg, precision=3)
-            sign = "+" if sign >= 0 else "-"
-            cmd = _SET_ALT%(sign, degs, mins, secs)
-            ret = self.__send_cmd(cmd, 1)
+            ret = self.__send_encoded(self.encoder().alt(deg), (ALT_LAYOUT,))
         else:
             raise ValueError
         return ret
@@ -494,8 +985,7 @@ Possibili valori di ritorno:
     def set_az(self, deg):
         "Imposta azimut oggetto (0..360 gradi)"
         if 0. <= deg <= 360.:
-            cmd = _SET_AZ%float2ums(deg)[1:3]
-            ret = self.__send_cmd(cmd, 1)
+            ret = self.__send_encoded(self.encoder().az(deg), (AZ_LAYOUT,))
         else:
             raise ValueError
         return ret
@@ -503,16 +993,66 @@ Possibili valori di ritorno:
     def set_de(self, deg):
         "Imposta declinazione oggetto (gradi)"
         if -90. <= deg <= 90.:
-            sign, degs, mins, secs = float2ums(deg, precision=4)
-            sign = "+" if sign >= 0 else "-"
-            isec = int(secs)
-            rest = int((secs-isec)*10000)
-            cmd = _SET_DEC%(sign, degs, mins, isec, rest)
-            ret = self.__send_cmd(cmd, 1)
+            ret = self.__send_encoded(self.encoder().de(deg), (DE_LAYOUT,))
         else:
             raise ValueError
         return ret
 
+    def set_target(self, hours, deg, move=False):
+        """Imposta ascensione retta (ore) e declinazione (gradi) dell'oggetto con un
+solo invio (se move è True segue il comando di movimento :MS)
+
+Riporta le risposte concatenate ("11", oppure "110" con movimento avviato)"""
+        if not (0. <= hours < 24. and -90. <= deg <= 90.):
+            raise ValueError("Posizione non valida: %f, %f"%(hours, deg))
+        return self.__send_encoded(self.encoder().target(hours, deg, move),
+                                   _TARGET_LAYOUTS[bool(move)])
+
+    def set_target_many(self, track, period, move=False, late=None,     # pylint: disable=R0913
+                        start=None, halt=None):
+        """Invia una sequenza precalcolata di posizioni target a cadenza fissa
+
+track:  sequenza di coppie (ascensione retta in ore, declinazione in gradi)
+period: intervallo fra gli aggiornamenti (sec)
+move:   se True ogni aggiornamento comprende il comando di movimento (:MS)
+late:   ritardo massimo (sec, default: period/2): gli aggiornamenti con
+        ritardo maggiore vengono saltati, per mantenere la cadenza
+start:  istante del primo aggiornamento (time.perf_counter(), default: subito)
+halt:   threading.Event per l'interruzione anticipata (opzionale)
+
+I comandi vengono composti prima dell'inizio; ogni aggiornamento (:Sr, :Sd
+ed eventualmente :MS) viene inviato con un'unica scrittura.
+
+Riporta dizionario con: sent (aggiornamenti inviati), dropped (saltati),
+errors (rifiutati o senza risposta), jitter (ritardo rispetto all'istante
+previsto, vedi telestats.Histogram.summary())"""
+        encoder = self.encoder()
+        payloads = []
+        for hours, deg in track:
+            if not (0. <= hours < 24. and -90. <= deg <= 90.):
+                raise ValueError("Posizione non valida: %f, %f"%(hours, deg))
+            payloads.append(encoder.target(hours, deg, move))
+        layouts = _TARGET_LAYOUTS[bool(move)]
+        expected = _TARGET_REPLIES[bool(move)]
+        if late is None:
+            late = period/2.
+        jitter = Histogram()
+        sent = dropped = errors = 0
+        next_time = time.perf_counter() if start is None else start
+        for payload in payloads:
+            if not wait_until(next_time, halt):
+                break
+            lag = time.perf_counter()-next_time
+            next_time += period
+            if lag > late:
+                dropped += 1
+                continue
+            jitter.record(lag)
+            sent += 1
+            if self.__send_encoded(payload, layouts) != expected:
+                errors += 1
+        return {"sent": sent, "dropped": dropped, "errors": errors, "jitter": jitter.summary()}
+
     def set_max_alt(self, deg):
         "Imposta altezza massima raggiungibile (60..90 gradi)"
         if 60 <= deg <= 90:
@@ -773,7 +1313,7 @@ Possibili valori di ritorno:
     def get_alt(self):
         "Legge altezza telescopio (gradi)"
         ret = self.__send_cmd(_GET_ALT, True)
-        return self._ddmmss_decode(ret, with_sign=True)
+        return self._ddmmss_decode(ret, with_sign=True, command=_GET_ALT)
 
     def get_antib_dec(self):
         "Legge valore antibacklash declinazione (steps/arcsec)"
@@ -792,35 +1332,32 @@ Possibili valori di ritorno:
     def get_az(self):
         "Legge azimuth telescopio (gradi)"
         ret = self.__send_cmd(_GET_AZ, True)
-        return self._ddmmss_decode(ret)
+        return self._ddmmss_decode(ret, command=_GET_AZ)
 
     def get_current_de(self):
         "Legge declinazione telescopio (gradi)"
         ret = self.__send_cmd(_GET_CUR_DE, True)
-        return self._ddmmss_decode(ret, with_sign=True)
+        return self._ddmmss_decode(ret, with_sign=True, command=_GET_CUR_DE)
 
     def get_current_deh(self):
         "Legge declinazione telescopio (gradi, alta precisione)"
         ret = self.__send_cmd(_GET_CUR_DEH, True)
-        return self._ddmmss_decode(ret, with_sign=True)
+        return self._ddmmss_decode(ret, with_sign=True, command=_GET_CUR_DEH)
 
     def get_current_ha(self):
         "Legge ascensione retta telescopio e calcola angolo orario (ore)"
         ret = self.__send_cmd(_GET_CUR_RAH, True)
-        rah = self._ddmmss_decode(ret)
-        if rah is None:
-            return None
-        return loc_st_now()-rah
+        return self._ha_decode(ret, command=_GET_CUR_RAH)
 
     def get_current_ra(self):
         "Legge ascensione retta telescopio (ore)"
         ret = self.__send_cmd(_GET_CUR_RA, True)
-        return self._ddmmss_decode(ret)
+        return self._ddmmss_decode(ret, command=_GET_CUR_RA)
 
     def get_current_rah(self):
         "Legge ascensione retta telescopio (ore, alta precisione)"
         ret = self.__send_cmd(_GET_CUR_RAH, True)
-        return self._ddmmss_decode(ret)
+        return self._ddmmss_decode(ret, command=_GET_CUR_RAH)
 
     def get_date(self):
         "Legge data impostata al telescopio"
@@ -916,12 +1453,12 @@ Possibili valori di ritorno:
     def get_lon(self):
         "Legge longitudine del sito (gradi)"
         ret = self.__send_cmd(_GET_LON, True)
-        return self._ddmm_decode(ret, with_sign=True)
+        return self._ddmm_decode(ret, with_sign=True, command=_GET_LON)
 
     def get_lat(self):
         "Legge latitudine del sito (gradi)"
         ret = self.__send_cmd(_GET_LAT, True)
-        return self._ddmm_decode(ret, with_sign=True)
+        return self._ddmm_decode(ret, with_sign=True, command=_GET_LAT)
 
     def get_fmwname(self):
         "Legge nome firmware"
@@ -959,7 +1496,7 @@ Possibili valori di ritorno:
     def get_ltime(self):
         "Legge tempo locale (ore)"
         ret = self.__send_cmd(_GET_LTIME, True)
-        return self._ddmmss_decode(ret)
+        return self._ddmmss_decode(ret, command=_GET_LTIME)
 
     def get_mstat(self):
         "Legge stato allineamento montatura"
@@ -977,22 +1514,22 @@ Possibili valori di ritorno:
     def get_target_de(self):
         "Legge declinazione oggetto (gradi)"
         ret = self.__send_cmd(_GET_TAR_DE, True)
-        return self._ddmmss_decode(ret, with_sign=True)
+        return self._ddmmss_decode(ret, with_sign=True, command=_GET_TAR_DE)
 
     def get_target_deh(self):
         "Legge declinazione oggetto (gradi, alta precisione)"
         ret = self.__send_cmd(_GET_TAR_DEH, True)
-        return self._ddmmss_decode(ret, with_sign=True)
+        return self._ddmmss_decode(ret, with_sign=True, command=_GET_TAR_DEH)
 
     def get_target_ra(self):
         "Legge ascensione retta oggetto (ore)"
         ret = self.__send_cmd(_GET_TAR_RA, True)
-        return self._ddmmss_decode(ret)
+        return self._ddmmss_decode(ret, command=_GET_TAR_RA)
 
     def get_target_rah(self):
         "Legge ascensione retta oggetto (ore, alta precisione)"
         ret = self.__send_cmd(_GET_TAR_RAH, True)
-        return self._ddmmss_decode(ret)
+        return self._ddmmss_decode(ret, command=_GET_TAR_RAH)
 
     def get_timefmt(self):
         "Legge formato ora"
@@ -1006,7 +1543,7 @@ Possibili valori di ritorno:
     def get_tsid(self):
         "Legge tempo sidereo (ore)"
         ret = self.__send_cmd(_GET_TSID, True)
-        return self._ddmmss_decode(ret)
+        return self._ddmmss_decode(ret, command=_GET_TSID)
 
     def get_utcoffset(self):
         "Legge offset UTC (ore)"
@@ -1189,7 +1726,7 @@ Possibili valori di ritorno:
     def rot_getpos(self):
         "Legge posizione rotatore (gradi)"
         ret = self.__send_cmd(_ROT_GET, True)
-        return self._ddmm_decode(ret)
+        return self._ddmm_decode(ret, command=_ROT_GET)
 
     def set_antib_dec(self, stpar):
         "Imposta valore anti backlash declinazione (steps per arcsec)"
@@ -1283,6 +1820,14 @@ Possibili valori di ritorno:
             text += "#"
         return self.__send_cmd(text, True)
 
+    def send_command(self, command, expected=True):
+        """Invia comando LX200 completo (es: ":GR#") senza decodifica
+
+expected: True se il comando prevede risposta (vedi expects_reply())
+
+Riporta la risposta come ricevuta ('' se non prevista, None se mancante)"""
+        return self.__send_cmd(command, expected)
+
     def opc_init(self):
         "Invia comandi di inizializzazione per telescopio OPC"
         ret1 = self.set_lat(OPC.lat_deg)
@@ -1295,13 +1840,358 @@ Possibili valori di ritorno:
             ret = None
         return ret
 
+class AsyncTeleCommunicator:
+    """Versione asyncio di TeleCommunicator
+
+Le interrogazioni elencate in QUERY_NAMES (singole o con query_many) usano
+I/O asincrono su una connessione persistente. Tutti gli altri metodi di
+TeleCommunicator sono disponibili con lo stesso nome come coroutine, eseguite
+in un thread separato per non bloccare il loop di eventi.
+"""
+    def __init__(self, ipadr, port, timeout=0.5, keepalive=False):
+        """Inizializzazione AsyncTeleCommunicator:
+
+ipaddr:    Indirizzo IP telescopio (str)
+port:      Port IP telescopio (int)
+timeout:   Timeout comunicazione in secondi (float)
+keepalive: Se False la connessione viene chiusa dopo ogni interrogazione
+"""
+        self.ipadr = ipadr
+        self.port = port
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self._sync = TeleCommunicator(ipadr, port, timeout, keepalive)
+        self._reader = None
+        self._writer = None
+        self._lock = None
+        self._errmsg = ""
+
+    def last_error(self):
+        "Riporta ultimo messaggio di errore"
+        return self._errmsg
+
+    def stats(self):
+        """Riporta le statistiche di comunicazione (vedi TeleCommunicator.stats()).
+
+Per le interrogazioni asincrone first_byte è misurato all'arrivo della prima
+risposta completa"""
+        return self._sync.stats()
+
+    def reset_stats(self):
+        "Azzera le statistiche di comunicazione"
+        self._sync.reset_stats()
+
+    def _record(self, commands, timing, tstart, results):
+        "Registra statistiche di comunicazione (vedi telestats)"
+        now = time.perf_counter()
+        stats = self._sync._stats                # pylint: disable=W0212
+        for command, (repl, err) in zip(commands, results):
+            if err == "Risposta mancante":       # Comando ripetuto singolarmente
+                continue
+            stats.record(command, dict(timing, complete=now-tstart),
+                         len(command) if "send" in timing else 0, len(repl or ""), err)
+            timing.pop("first_byte", None)
+
+    def _close(self):
+        "Chiude connessione"
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+
+    async def close(self):
+        "Chiude le connessioni"
+        self._close()
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._sync.close)
+
+    async def _open(self):
+        "Apre connessione con il server del telescopio"
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.ipadr, self.port), self.timeout)
+
+    async def _exchange(self, commands):
+        "Invio in sequenza di più comandi con risposta. Riporta lista di (risposta, errore)"
+        tm0 = time.perf_counter()
+        for retry in (True, False):
+            results = []
+            timing = {}
+            if self._writer is None:
+                try:
+                    await self._open()
+                except (OSError, asyncio.TimeoutError):
+                    results = [(None, "Tel. non connesso")]*len(commands)
+                    self._record(commands, timing, tm0, results)
+                    return results
+                timing["connect"] = time.perf_counter()-tm0
+            try:
+                tm1 = time.perf_counter()
+                self._writer.write("".join(commands).encode("ascii"))
+                await self._writer.drain()
+                tsent = time.perf_counter()
+                timing["send"] = tsent-tm1
+                for command in commands:
+                    if command.startswith(_ONECHAR_REPLY):
+                        data = await asyncio.wait_for(self._reader.readexactly(1), self.timeout)
+                    else:
+                        data = await asyncio.wait_for(self._reader.readuntil(b"#"), self.timeout)
+                    if not results:
+                        timing["first_byte"] = time.perf_counter()-tsent
+                    results.append((data.decode("ascii"), ""))
+                    self._record((command,), timing, tm0, results[-1:])
+                return results
+            except asyncio.TimeoutError:
+                self._close()
+                missing = "Timeout"
+            except asyncio.IncompleteReadError as excp:
+                self._close()
+                if retry and not results and not excp.partial:
+                    continue
+                if excp.partial:
+                    results.append((excp.partial.decode("ascii"), "Risposta senza terminatore #"))
+                missing = "Risposta mancante"
+            except OSError:
+                self._close()
+                if retry and not results:
+                    continue
+                missing = "Risposta mancante"
+            nrec = sum(1 for _unused, err in results if not err)
+            while len(results) < len(commands):
+                results.append((None, missing))
+            self._record(commands[nrec:], timing, tm0, results[nrec:])
+            return results
+        return [(None, "Tel. non connesso")]*len(commands)
+
+    async def query_many(self, names):
+        """Esegue più interrogazioni con un unico invio (pipeline)
+
+Come TeleCommunicator.query_many(): riporta lista di (valore, errore)"""
+        try:
+            specs = [_QUERIES[name] for name in names]
+        except KeyError as excp:
+            raise ValueError("Interrogazione non prevista: %s"%str(excp))
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        commands = [spec[0] for spec in specs]
+        async with self._lock:
+            replies = await self._exchange(commands)
+            for nres, (command, (_unused, err)) in enumerate(zip(commands, replies)):
+                if err == "Risposta mancante":  # Il server non accetta comandi in sequenza
+                    replies[nres] = (await self._exchange([command]))[0]
+            if not self.keepalive:
+                self._close()
+        results = []
+        decoder = self._sync
+        for (cmd, kind), (repl, err) in zip(specs, replies):
+            if repl is None:
+                results.append((None, err))
+                continue
+            decoder._errmsg = ""                       # pylint: disable=W0212
+            value = decoder._decode(kind, repl, cmd)   # pylint: disable=W0212
+            results.append((value, err or decoder._errmsg))   # pylint: disable=W0212
+        self._errmsg = "; ".join(err for _unused, err in results if err)
+        return results
+
+    def __getattr__(self, name):
+        "Fornisce i metodi di TeleCommunicator come coroutine"
+        if name in _QUERIES:
+            async def query():
+                "Interrogazione asincrona"
+                return (await self.query_many((name,)))[0][0]
+            query.__doc__ = getattr(TeleCommunicator, name).__doc__
+            return query
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(self._sync, name)
+        if not callable(method):
+            raise AttributeError(name)
+        async def call(*args):
+            "Esecuzione in thread separato"
+            loop = asyncio.get_event_loop()
+            ret = await loop.run_in_executor(None, functools.partial(method, *args))
+            self._errmsg = self._sync.last_error()
+            return ret
+        call.__doc__ = method.__doc__
+        return call
+
+# Cache delle interrogazioni (vedi CachedTeleCommunicator)
+
+CACHE_TTL = 0.5       # Validità valori variabili (sec)
+EXTRAP_TTL = 5.0      # Validità valori estrapolati (sec)
+
+                      # Valori costanti fino a invalidazione
+_STATIC_QUERIES = ("get_fmwdate", "get_fmwname", "get_fmwnumb", "get_fmwtime",
+                   "get_lat", "get_lon", "get_timefmt", "get_utcoffset")
+
+_SIDEREAL_RATE = TCIV_TO_TSID/3600.     # Ore sideree per secondo
+
+                      # Valori estrapolati: nome -> (velocità (ore/sec), modulo)
+_EXTRAPOLATED = {"get_current_ha": (_SIDEREAL_RATE, None),
+                 "get_current_ra": (0., None),
+                 "get_current_rah": (0., None),
+                 "get_ltime": (1./3600., 24.),
+                 "get_tsid": (_SIDEREAL_RATE, 24.),
+                }
+
+                      # Comandi che invalidano anche i valori costanti
+_STATIC_SETTERS = ("set_lat", "set_lon", "set_time", "set_date", "set_tsid",
+                   "opc_init", "gen_cmd", "set_onstep_")
+
+                      # Comandi senza effetto sui valori in cache
+_READ_ONLY = ("get_", "last_", "foc1_get_", "foc2_get_", "rot_get")
+
+class CachedTeleCommunicator:
+    """Cache delle interrogazioni per TeleCommunicator
+
+Le interrogazioni elencate in QUERY_NAMES vengono servite dalla cache se
+il valore è ancora valido:
+
+  - latitudine, longitudine, dati firmware, offset UTC, formato ora:
+    fino a invalidazione
+  - ascensione retta, angolo orario, tempo sidereo, tempo locale: per
+    extrap_ttl secondi, estrapolando angolo orario e tempi dall'ultima
+    lettura (l'ascensione retta è costante con telescopio in tracking)
+  - altri valori: per ttl secondi
+
+I tempi sono quelli dell'orologio simulato (vedi simclock.py): con
+OPC_SIMCLOCK impostato come per il simulatore, l'estrapolazione segue il
+tempo simulato.
+
+Ogni altro comando viene inviato al telescopio e invalida i valori
+variabili (i comandi in _STATIC_SETTERS invalidano l'intera cache).
+Tutti i metodi di TeleCommunicator sono disponibili con lo stesso nome.
+"""
+    def __init__(self, tel, ttl=CACHE_TTL, extrap_ttl=EXTRAP_TTL):
+        """Inizializzazione CachedTeleCommunicator:
+
+tel:        istanza di TeleCommunicator
+ttl:        validità dei valori variabili (sec)
+extrap_ttl: validità dei valori estrapolati (sec)
+"""
+        self.tel = tel
+        self.ttl = ttl
+        self.extrap_ttl = extrap_ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, name, now):
+        "Cerca valore valido in cache. Riporta None se assente o scaduto"
+        entry = self._cache.get(name)
+        if entry is None:
+            return None
+        tstamp, value = entry
+        if name in _STATIC_QUERIES:
+            return value
+        age = now-tstamp
+        if name in _EXTRAPOLATED:
+            if age > self.extrap_ttl:
+                return None
+            rate, modulo = _EXTRAPOLATED[name]
+            value += rate*age
+            if modulo:
+                value %= modulo
+            return value
+        if age > self.ttl:
+            return None
+        return value
+
+    def query_many(self, names):
+        """Come TeleCommunicator.query_many(). Al telescopio vengono inviate
+(con un unico invio) solo le interrogazioni non presenti in cache"""
+        for name in names:
+            if name not in _QUERIES:
+                raise ValueError("Interrogazione non prevista: '%s'"%name)
+        results = [None]*len(names)
+        missing = []
+        with self._lock:
+            now = simclock.now()
+            for nres, name in enumerate(names):
+                value = self._lookup(name, now)
+                if value is None:
+                    missing.append(nres)
+                else:
+                    results[nres] = (value, "")
+            self.hits += len(names)-len(missing)
+            self.misses += len(missing)
+        if missing:
+            replies = self.tel.query_many([names[nres] for nres in missing])
+            now = simclock.now()
+            with self._lock:
+                for nres, (value, err) in zip(missing, replies):
+                    results[nres] = (value, err)
+                    if value is not None and not err:
+                        self._cache[names[nres]] = (now, value)
+        return results
+
+    def query(self, name):
+        "Esegue singola interrogazione (vedi QUERY_NAMES). Riporta valore o None"
+        return self.query_many((name,))[0][0]
+
+    def get_firmware(self):
+        "Legge informazioni complete su firmware"
+        return tuple(value for value, _unused in
+                     self.query_many(("get_fmwname", "get_fmwnumb", "get_fmwdate",
+                                      "get_fmwtime")))
+
+    def invalidate(self, static=True):
+        "Invalida i valori in cache (solo quelli variabili se static=False)"
+        with self._lock:
+            if static:
+                self._cache.clear()
+            else:
+                for name in list(self._cache):
+                    if name not in _STATIC_QUERIES:
+                        del self._cache[name]
+
+    def stats(self):
+        "Riporta dizionario con statistiche d'uso della cache"
+        with self._lock:
+            total = self.hits+self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache),
+                    "hit_ratio": self.hits/total if total else 0.}
+
+    def reset_stats(self):
+        "Azzera i contatori"
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def __getattr__(self, name):
+        "Fornisce i metodi di TeleCommunicator"
+        if name in _QUERIES:
+            def query():
+                "Interrogazione con cache"
+                return self.query(name)
+            query.__doc__ = getattr(TeleCommunicator, name).__doc__
+            return query
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(self.tel, name)
+        if not callable(method) or name.startswith(_READ_ONLY):
+            return method
+        def call(*args):
+            "Esecuzione comando con invalidazione della cache"
+            try:
+                return method(*args)
+            finally:
+                self.invalidate(name.startswith(_STATIC_SETTERS))
+        call.__doc__ = method.__doc__
+        return call
+
 ########################################################
 # Classe per il supporto del modo interattivo
 
+STATS_PERIOD = 60.    # Periodo di visualizzazione statistiche (sec)
+
 class __Executor:                     # pylint: disable=C0103
     "Esecuzione comandi interattivi"
-    def __init__(self, config, verbose):
-        dcom = TeleCommunicator(config["tel_ip"], config["tel_port"])
+    def __init__(self, config, verbose, keepalive=False, cached=False):
+        dcom = TeleCommunicator(config["tel_ip"], config["tel_port"], keepalive=keepalive)
+        self.tel = dcom
+        if cached:
+            dcom = CachedTeleCommunicator(dcom)
         self._verbose = verbose
 #                    codice   funzione      convers.argom.
         self.lxcmd = {"f1+": (dcom.foc1_move_in, self.__noargs),
@@ -1462,8 +2352,15 @@ class __Executor:                     # pylint: disable=C0103
                       "cmd": (dcom.gen_cmd, self.__getword),
                       "fmw": (dcom.get_firmware, self.__noargs),
                       "ver": (self.__toggle_verbose, self.__noargs),
+                      "tst": (self.__comm_stats, self.__noargs),
+                      "eph": (self.__ephem_start, self.__getword),
+                      "eps": (self.__ephem_stop, self.__noargs),
                      }
+        if cached:
+            self.hkcmd["cst"] = (self.__cache_stats, self.__noargs)
+            self.hkcmd["cin"] = (self.__cache_invalidate, self.__noargs)
         self._dcom = dcom
+        self._streamer = None
 
     def __getddmmss(self, args):
         "[dd [mm [ss]]]"
@@ -1556,6 +2453,44 @@ class __Executor:                     # pylint: disable=C0103
                 print(" %s: %s"%(stchr, _CODICI_STATO.get(stchr, "???")))
         return stat
 
+    def __comm_stats(self):
+        "Mostra statistiche di comunicazione (tempi in ms)"
+        return report(self.tel.stats())
+
+    def __ephem_start(self, fname):
+        "Avvia inseguimento da file di effemeride (vedi: python ephemeris.py -h)"
+        import ephemeris                                   # pylint: disable=C0415
+        if self._streamer and self._streamer.is_alive():
+            return "Inseguimento già attivo"
+        try:
+            ephem = ephemeris.read_ephemeris(fname)
+        except (IOError, ValueError) as excp:
+            return str(excp)
+                         # Con la cache (-c) i comandi inviati la invalidano
+        self._streamer = ephemeris.EphemerisStreamer(self._dcom, ephem)
+        self._streamer.start()
+        return "Inseguimento avviato"
+
+    def __ephem_stop(self):
+        "Termina inseguimento da effemeride e mostra i risultati"
+        if not self._streamer:
+            return "Inseguimento non attivo"
+        import ephemeris                                   # pylint: disable=C0415
+        self._streamer.stop()
+        self._streamer.join()
+        return ephemeris.format_report(self._streamer.report())
+
+    def __cache_stats(self):
+        "Mostra statistiche cache interrogazioni"
+        stats = self._dcom.stats()
+        return "Successi: %d, mancati: %d (%.1f%%), valori in cache: %d"%(
+            stats["hits"], stats["misses"], stats["hit_ratio"]*100., stats["entries"])
+
+    def __cache_invalidate(self):
+        "Invalida cache interrogazioni"
+        self._dcom.invalidate()
+        return ""
+
     def __toggle_verbose(self):
         "Abilita/Disabilita modo verboso"
         self._verbose = not self._verbose
@@ -1618,6 +2553,52 @@ class __Executor:                     # pylint: disable=C0103
         print("\nComandi aggiuntivi:")
         self.__print_cmd(self.hkcmd)
 
+                 # Risposte tipiche per la misura di velocità di decodifica:
+                 # (nome metodo, comando, tipo, risposta)
+DECODE_SAMPLES = (("get_current_ra", _GET_CUR_RA, "ums", "12:34:56#"),
+                  ("get_current_rah", _GET_CUR_RAH, "ums", "12:34:56.789#"),
+                  ("get_target_ra", _GET_TAR_RA, "ums", "05:06:07#"),
+                  ("get_target_rah", _GET_TAR_RAH, "ums", "05:06:07.123#"),
+                  ("get_ltime", _GET_LTIME, "ums", "22:10:05#"),
+                  ("get_tsid", _GET_TSID, "ums", "04:13:59#"),
+                  ("get_current_de", _GET_CUR_DE, "sms", "+45*30:15#"),
+                  ("get_current_deh", _GET_CUR_DEH, "sms", "-12*34:56.789#"),
+                  ("get_target_de", _GET_TAR_DE, "sms", "-05*06'07#"),
+                  ("get_target_deh", _GET_TAR_DEH, "sms", "+05*06:07.890#"),
+                  ("get_alt", _GET_ALT, "sms", "+26*20'50#"),
+                  ("get_az", _GET_AZ, "ums", "241*56:31#"),
+                  ("get_lat", _GET_LAT, "sdm", "+43*31#"),
+                  ("get_lon", _GET_LON, "sdm", "-011*14#"),
+                  ("get_trate", _GET_TRATE, "flt", "60.16427#"),
+                  ("get_utcoffset", _GET_UOFF, "flt", "-01.0#"))
+DECODE_REPEAT = 100000
+
+def decode_benchmark(nrep):
+    "Misura velocità di decodifica delle risposte: formato fisso e generico"
+    tel = TeleCommunicator("127.0.0.1", 0)
+    print("Metodo            Risposta         generica(us)  fissa(us)  rapporto")
+    tot_gen = tot_fix = 0.
+    for name, command, kind, reply in DECODE_SAMPLES:
+        generic = tel._decode(kind, reply)                 # pylint: disable=W0212
+        fixed = tel._decode(kind, reply, command)          # pylint: disable=W0212
+        if generic != fixed:
+            print("%-17s %-16s ERRORE: %s != %s"%(name, reply, generic, fixed))
+            continue
+        tm0 = time.perf_counter()
+        for _unused in range(nrep):
+            tel._decode(kind, reply)                       # pylint: disable=W0212
+        tm1 = time.perf_counter()
+        for _unused in range(nrep):
+            tel._decode(kind, reply, command)              # pylint: disable=W0212
+        tm2 = time.perf_counter()
+        tot_gen += tm1-tm0
+        tot_fix += tm2-tm1
+        print("%-17s %-16s %12.3f %10.3f %9.1f"%(name, reply, (tm1-tm0)*1.E6/nrep,
+                                                 (tm2-tm1)*1.E6/nrep, (tm1-tm0)/(tm2-tm1)))
+    ndec = nrep*len(DECODE_SAMPLES)
+    print()
+    print("Media: generica %.3f us, fissa %.3f us"%(tot_gen*1.E6/ndec, tot_fix*1.E6/ndec))
+
 def main():
     "Invio comandi da console e test"
     if '-h' in sys.argv:
@@ -1629,6 +2610,14 @@ def main():
         print(get_version())
         sys.exit()
 
+    if '-b' in sys.argv:
+        try:
+            nrep = int(sys.argv[sys.argv.index('-b')+1])
+        except (IndexError, ValueError):
+            nrep = DECODE_REPEAT
+        decode_benchmark(nrep)
+        sys.exit()
+
     if '-d' in sys.argv:
         config = {"tel_ip": "127.0.0.1",
                   "tel_port": 9753,
@@ -1643,8 +2632,17 @@ def main():
         sys.exit()
 
     verbose = ("-v" in sys.argv)
+    keepalive = ("-k" in sys.argv)
+    cached = ("-c" in sys.argv)
 
-    exe = __Executor(config, verbose)
+    exe = __Executor(config, verbose, keepalive, cached)
+
+    if '-s' in sys.argv:
+        try:
+            period = float(sys.argv[sys.argv.index('-s')+1])
+        except (IndexError, ValueError):
+            period = STATS_PERIOD
+        StatsDumper(exe.tel, period).start()
 
     while True:
         answ = input("\nComando (invio per aiuto): ")
@@ -0,0 +1,237 @@
+"""
+Statistiche di comunicazione con il telescopio
+
+Raccolta dei tempi di risposta per comando LX200 con istogrammi a
+risoluzione relativa costante (stile HDR: intervalli lineari all'interno
+di ogni potenza di due, errore relativo inferiore al 6%), conteggio di
+timeout ed errori e numero di caratteri inviati e ricevuti.
+
+Per ciascun comando i tempi sono suddivisi nelle fasi:
+
+    connect:     apertura connessione (solo se eseguita)
+    send:        invio del comando
+    first_byte:  dalla fine dell'invio all'arrivo del primo carattere
+    complete:    tempo totale, dall'inizio alla risposta completa
+
+Usato da telecomm.TeleCommunicator (metodo stats())
+"""
+
+import sys
+import re
+import threading
+
+__version__ = "1.0"
+__author__ = "Luca Fini"
+__date__ = "Gennaio 2021"
+
+PHASES = ("connect", "send", "first_byte", "complete")
+
+SUB_BITS = 4                    # Suddivisioni di ogni potenza di due: 2**SUB_BITS
+_LINEAR = 2<<SUB_BITS           # Sotto questo valore (microsec) la risoluzione è 1 microsec
+
+_CMD_CODE_RE = re.compile(":.[A-Za-z]*")
+
+def command_code(command):
+    "Codice del comando LX200, senza argomenti (es: ':Sr12:00:00#' -> ':Sr')"
+    match = _CMD_CODE_RE.match(command)
+    if match:
+        return match.group(0)
+    return command.rstrip("#")
+
+def _bucket(usec):
+    "Indice dell'intervallo per il valore dato (microsecondi)"
+    if usec < _LINEAR:
+        return usec
+    mag = usec.bit_length()-SUB_BITS-1
+    return (mag<<SUB_BITS)+(usec>>mag)
+
+def _bucket_range(idx):
+    "Riporta (limite inferiore, ampiezza) dell'intervallo (microsecondi)"
+    if idx < _LINEAR:
+        return idx, 1
+    mag = (idx>>SUB_BITS)-1
+    return (idx-(mag<<SUB_BITS))<<mag, 1<<mag
+
+class Histogram:
+    "Istogramma di tempi (registrati in secondi, con risoluzione di 1 microsecondo)"
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        "Registra un tempo (sec)"
+        idx = _bucket(max(0, int(value*1.E6)))
+        self.counts[idx] = self.counts.get(idx, 0)+1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        "Aggiunge i valori di un altro istogramma"
+        for idx, num in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0)+num
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, perc):
+        "Riporta il percentile indicato (0..100) in secondi (None se vuoto)"
+        if not self.count:
+            return None
+        limit = self.count*perc/100.
+        cumul = 0
+        for idx in sorted(self.counts):
+            cumul += self.counts[idx]
+            if cumul >= limit:
+                lower, width = _bucket_range(idx)
+                value = (lower+width/2.)/1.E6
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        "Riporta il valor medio (sec, None se vuoto)"
+        if not self.count:
+            return None
+        return self.total/self.count
+
+    def summary(self):
+        "Riporta dizionario con numero, media, minimo, massimo, p50, p95, p99 (sec)"
+        return {"count": self.count, "mean": self.mean(), "min": self.min, "max": self.max,
+                "p50": self.percentile(50), "p95": self.percentile(95),
+                "p99": self.percentile(99)}
+
+class CommandStats:                      # pylint: disable=R0903
+    "Statistiche relative ad un comando"
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.sent = 0
+        self.received = 0
+        self.phases = {phase: Histogram() for phase in PHASES}
+
+    def as_dict(self):
+        "Riporta le statistiche come dizionario"
+        ret = {"count": self.count, "errors": self.errors, "timeouts": self.timeouts,
+               "sent": self.sent, "received": self.received}
+        for phase, hist in self.phases.items():
+            ret[phase] = hist.summary()
+        return ret
+
+class CommStats:
+    "Raccolta delle statistiche per comando (accesso da più thread)"
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def record(self, command, timing, sent, received, error=""):   # pylint: disable=R0913
+        """Registra l'esecuzione di un comando
+
+command:  comando LX200 (le statistiche sono raccolte per codice comando)
+timing:   dizionario con i tempi delle fasi eseguite (sec)
+sent:     numero di caratteri inviati
+received: numero di caratteri ricevuti
+error:    messaggio di errore ("Timeout" per i timeout)"""
+        code = command_code(command)
+        with self._lock:
+            stats = self._commands.get(code)
+            if stats is None:
+                stats = self._commands[code] = CommandStats()
+            stats.count += 1
+            stats.sent += sent
+            stats.received += received
+            if error:
+                stats.errors += 1
+                if error == "Timeout":
+                    stats.timeouts += 1
+            for phase, value in timing.items():
+                stats.phases[phase].record(value)
+
+    def reset(self):
+        "Azzera le statistiche"
+        with self._lock:
+            self._commands = {}
+
+    def snapshot(self):
+        """Riporta le statistiche come dizionario:
+
+   {"commands": {codice: {"count":..., "errors":..., "timeouts":..., "sent":...,
+                          "received":..., "connect": {...}, "send": {...},
+                          "first_byte": {...}, "complete": {...}}},
+    "totals": {stesse chiavi, per l'insieme dei comandi}}"""
+        with self._lock:
+            commands = {code: stats.as_dict() for code, stats in self._commands.items()}
+            totals = CommandStats()
+            for stats in self._commands.values():
+                totals.count += stats.count
+                totals.errors += stats.errors
+                totals.timeouts += stats.timeouts
+                totals.sent += stats.sent
+                totals.received += stats.received
+                for phase in PHASES:
+                    totals.phases[phase].merge(stats.phases[phase])
+        return {"commands": commands, "totals": totals.as_dict()}
+
+def _msec(value):
+    "Formatta tempo in millisecondi"
+    if value is None:
+        return "%8s"%"-"
+    return "%8.2f"%(value*1000.)
+
+def report(snapshot):
+    "Riporta le statistiche (da CommStats.snapshot()) come testo"
+    lines = ["Comando   Num.  Err. Timeout  Inviati Ricevuti  conn.p50  first_p50"
+             "     p50      p95      p99      max (ms)"]
+    items = sorted(snapshot["commands"].items())
+    items.append(("Totale", snapshot["totals"]))
+    for code, stats in items:
+        compl = stats["complete"]
+        lines.append("%-7s %6d %5d %7d %8d %8d  %s   %s %s %s %s %s"%(
+            code, stats["count"], stats["errors"], stats["timeouts"], stats["sent"],
+            stats["received"], _msec(stats["connect"]["p50"]),
+            _msec(stats["first_byte"]["p50"]), _msec(compl["p50"]), _msec(compl["p95"]),
+            _msec(compl["p99"]), _msec(compl["max"])))
+    return "\n".join(lines)
+
+class StatsDumper(threading.Thread):
+    """
+Visualizzazione periodica delle statistiche di comunicazione
+
+source: oggetto con metodo stats() (es: TeleCommunicator)
+period: periodo (sec)
+out:    file su cui scrivere (default: sys.stdout)
+reset:  se True azzera le statistiche dopo ogni visualizzazione
+"""
+    def __init__(self, source, period, out=None, reset=False):
+        threading.Thread.__init__(self, daemon=True)
+        self.source = source
+        self.period = period
+        self.out = out
+        self.reset = reset
+        self._halt = threading.Event()
+
+    def run(self):
+        "Ciclo di visualizzazione"
+        while not self._halt.wait(self.period):
+            self.dump()
+
+    def dump(self):
+        "Visualizza le statistiche"
+        out = self.out or sys.stdout
+        print(report(self.source.stats()), file=out)
+        print(file=out, flush=True)
+        if self.reset:
+            self.source.reset_stats()
+
+    def stop(self):
+        "Termina la visualizzazione periodica"
+        self._halt.set()
@@ -0,0 +1,234 @@
+"""
+Proxy LX200: condivisione della connessione al telescopio fra più client
+
+Il firmware OnStep accetta poche connessioni contemporanee: il proxy
+mantiene un'unica connessione con il telescopio e serve un numero
+qualunque di client locali con lo stesso protocollo (comandi terminati
+da "#"). I comandi vengono inviati al telescopio uno alla volta.
+
+Interrogazioni identiche ricevute mentre la precedente è ancora in corso
+vengono accorpate (una sola richiesta al telescopio, la risposta viene
+inviata a tutti i richiedenti) e le risposte restano valide in cache per
+un breve intervallo. Ogni comando diverso da un'interrogazione invalida
+la cache.
+
+Per utilizzare il proxy, i client devono usare come indirizzo del
+telescopio 127.0.0.1 e come port quello del proxy (vedi opzione -p).
+
+Uso:
+      python telproxy.py [-d] [-1] [-p port] [-t ttl] [-v]
+
+dove:
+      -d  Collegamento al simulatore (IP: 127.0.0.1, Port: 9753)
+      -1  Chiude la connessione con il client dopo ogni risposta
+          (come il firmware OnStep)
+      -p  Port su cui attendere i client (default: 9754)
+      -t  Validità delle risposte in cache (sec, default: 0.2)
+      -v  Modo verboso (visualizza comandi e risposte)
+
+Le statistiche d'uso vengono visualizzate al termine (CTRL-C)
+"""
+
+import sys
+import time
+import threading
+import socketserver
+
+import configdata as conf
+from framereader import FrameReader
+from telecomm import TeleCommunicator, expects_reply
+
+__version__ = "1.0"
+__author__ = "Luca Fini"
+__date__ = "Gennaio 2021"
+
+PROXY_PORT = 9754
+CACHE_TTL = 0.2           # Validità risposte in cache (sec)
+UPSTREAM_TIMEOUT = 1.0    # Timeout comunicazione con il telescopio (sec)
+
+                          # Interrogazioni (senza effetti sullo stato del telescopio)
+_CACHEABLE = (":G", ":%", ":D#", ":rG")
+
+class _Pending:                   # pylint: disable=R0903
+    "Interrogazione in corso, condivisa fra più client"
+    def __init__(self):
+        self.event = threading.Event()
+        self.reply = None
+
+class LX200Proxy:
+    """
+Esecuzione dei comandi dei client sulla connessione condivisa
+
+upstream: istanza di TeleCommunicator (preferibilmente con keepalive=True)
+ttl:      validità delle risposte in cache (sec)
+"""
+    def __init__(self, upstream, ttl=CACHE_TTL):
+        self.upstream = upstream
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._pending = {}
+        self._generation = 0
+        self._counters = {"clients": 0, "connections": 0, "commands": 0, "upstream": 0,
+                          "hits": 0, "coalesced": 0, "errors": 0}
+
+    def client_count(self, delta):
+        "Aggiorna il numero di client collegati"
+        with self._lock:
+            self._counters["clients"] += delta
+            if delta > 0:
+                self._counters["connections"] += delta
+
+    def _forward(self, command, expected):
+        "Invio comando al telescopio"
+        reply = self.upstream.send_command(command, expected)
+        if reply is None:
+            with self._lock:
+                self._counters["errors"] += 1
+        return reply
+
+    def execute(self, command):
+        """Esegue comando LX200 completo (es: ":GR#")
+
+Riporta la risposta ('' se non prevista, None se il telescopio non risponde)"""
+        expected = expects_reply(command)
+        with self._lock:
+            self._counters["commands"] += 1
+            if not (expected and command.startswith(_CACHEABLE)):
+                self._counters["upstream"] += 1
+                self._cache.clear()
+                self._generation += 1
+                pending = None
+            else:
+                entry = self._cache.get(command)
+                if entry is not None and time.time()-entry[0] <= self.ttl:
+                    self._counters["hits"] += 1
+                    return entry[1]
+                pending = self._pending.get(command)
+                if pending is not None:
+                    self._counters["coalesced"] += 1
+                    leader = False
+                else:
+                    pending = _Pending()
+                    self._pending[command] = pending
+                    self._counters["upstream"] += 1
+                    generation = self._generation
+                    leader = True
+        if pending is None:
+            return self._forward(command, expected)
+        if not leader:
+            pending.event.wait()
+            return pending.reply
+        reply = None
+        try:
+            reply = self._forward(command, True)
+        finally:
+            with self._lock:
+                del self._pending[command]
+                if reply is not None and generation == self._generation:
+                    self._cache[command] = (time.time(), reply)
+            pending.reply = reply
+            pending.event.set()
+        return reply
+
+    def stats(self):
+        "Riporta dizionario con statistiche d'uso"
+        with self._lock:
+            ret = self._counters.copy()
+        served = ret["hits"]+ret["coalesced"]
+        ret["saved_ratio"] = served/ret["commands"] if ret["commands"] else 0.
+        return ret
+
+class _ClientHandler(socketserver.BaseRequestHandler):
+    "Gestione della connessione con un client"
+    def handle(self):
+        proxy = self.server.proxy
+        reader = FrameReader(self.request)
+        proxy.client_count(1)
+        try:
+            while True:
+                frame = reader.read_frame()
+                if not frame.endswith(b"#"):
+                    break
+                command = frame.decode("ascii", "replace")
+                reply = proxy.execute(command)
+                if self.server.verbose:
+                    print("%s:%d  %s -> %s"%(self.client_address[0], self.client_address[1],
+                                             command, reply), flush=True)
+                if reply is None:
+                    break
+                if reply:
+                    self.request.sendall(reply.encode("ascii"))
+                if self.server.oneshot:
+                    break
+        except OSError:
+            pass
+        finally:
+            proxy.client_count(-1)
+
+class ProxyServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+Server TCP del proxy (un thread per client)
+
+address: indirizzo (ip, port) su cui attendere i client
+proxy:   istanza di LX200Proxy
+oneshot: se True chiude la connessione dopo ogni risposta
+verbose: se True visualizza comandi e risposte
+"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, proxy, oneshot=False, verbose=False):
+        self.proxy = proxy
+        self.oneshot = oneshot
+        self.verbose = verbose
+        socketserver.TCPServer.__init__(self, address, _ClientHandler)
+
+def print_stats(stats):
+    "Visualizza statistiche d'uso"
+    print("Connessioni: %d - comandi: %d - inviati al telescopio: %d - errori: %d"%(
+        stats["connections"], stats["commands"], stats["upstream"], stats["errors"]))
+    print("Risposte da cache: %d - accorpate: %d (risparmio: %.1f%%)"%(
+        stats["hits"], stats["coalesced"], stats["saved_ratio"]*100.))
+
+def get_arg(flag, default):
+    "Legge valore di un'opzione"
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag)+1]
+    return default
+
+def main():
+    "Lancio del proxy"
+    if "-h" in sys.argv:
+        print(__doc__)
+        sys.exit()
+    if "-d" in sys.argv:
+        config = {"tel_ip": "127.0.0.1",
+                  "tel_port": 9753,
+                  "debug": 1}
+    else:
+        config = conf.get_config()
+    if not config:
+        print("File di configurazione inesistente!")
+        print("occorre definirlo con:")
+        print()
+        print("   python configure.py")
+        sys.exit()
+    port = int(get_arg("-p", PROXY_PORT))
+    upstream = TeleCommunicator(config["tel_ip"], config["tel_port"],
+                                timeout=UPSTREAM_TIMEOUT, keepalive=True)
+    proxy = LX200Proxy(upstream, float(get_arg("-t", CACHE_TTL)))
+    server = ProxyServer(("127.0.0.1", port), proxy, oneshot="-1" in sys.argv,
+                         verbose="-v" in sys.argv)
+    print("Proxy attivo su port %d - telescopio: %s:%d"%(port, config["tel_ip"],
+                                                         config["tel_port"]), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print()
+    server.server_close()
+    upstream.close()
+    print_stats(proxy.stats())
+
+if __name__ == "__main__":
+    main()
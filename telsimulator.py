@@ -3,22 +3,38 @@
 Simulatore telescopio
 
 Uso:
-      python3 telsimulator.py [-v]
+      python3 telsimulator.py [-1] [-v] [-x speed] [-T "YYYY-MM-DD HH:MM:SS"]
+      python3 telsimulator.py -b [num]
 
 dove:
+      -1:  chiude la connessione dopo ogni comando (come il firmware OnStep)
+      -b:  misura la velocità di esecuzione dei comandi (senza server):
+           num ripetizioni di ciascun comando (default: 20000)
       -v:  modo verboso: scrive su stdout i comandi e le risposte
+      -x:  velocità dell'orologio simulato rispetto al tempo reale
+           (es: 60; 0: simulazione a eventi discreti, vedi simclock.py)
+      -T:  tempo simulato iniziale (ora locale)
+
+Senza -x e -T l'orologio è configurato dalla variabile d'ambiente
+OPC_SIMCLOCK (default: tempo reale).
+
+Il simulatore serve più client contemporaneamente (un thread per client).
+Senza l'opzione -1 le connessioni restano aperte e ciascun client può
+inviare più comandi, anche in sequenza senza attendere le risposte.
 
 """
 
 import sys
 import socket
-from threading import Thread
+from threading import Thread, Lock
 import random
 import time
 import math
 import pprint
 
 import astro
+import simclock
+from framereader import FrameReader
 
 __version__ = "1.0"
 __date__ = "Ottobre 2020"
@@ -27,6 +43,8 @@ __author__ = "Luca Fini"
 LINEAR = 0
 ROTATOR = 1
 
+PORT = 9753
+
 class GLOB:          # pylint: disable=R0903
     verbose = False
 
@@ -38,6 +56,8 @@ Comandi:
     e/w/n     - Set posizione braccio
     s dec ra  - Set posizione telescopio
     t         - Mostra stato telescopio
+    a sec     - Avanza l'orologio simulato (modo a eventi discreti)
+    c         - Mostra orologio simulato
     v         - Abilita/disabilita modo verboso
 
     q         - Termina
@@ -175,8 +195,9 @@ class Linear(Movement):
 
     def run(self):
         "Lancia simulatore lineare"
+        simclock.CLOCK.attach()
         while True:
-            time.sleep(self.timestep)
+            simclock.sleep(self.timestep)
             if self.movement < 0:
                 self.position -= self.xstep
                 if self.position <= self.limits[0]:
@@ -212,8 +233,9 @@ class Rotator(Movement):
 
     def run(self):
         "lancia rotatore"
+        simclock.CLOCK.attach()
         while True:
-            time.sleep(self.timestep)
+            simclock.sleep(self.timestep)
             if self.movement < 0:
                 self.position -= self.xstep
                 if self.position < self.limits[0]:
@@ -300,255 +322,307 @@ class Telescope(Thread):
                 "target_de": self.target.dec,
                 "target_ra": self.target.ras}
 
+                         # Registro dei comandi: codice (bytes) -> metodo
+_COMMANDS = {}
+_CODE_SIZES = (4, 3, 2)  # Lunghezze dei codici registrati (ricerca del più lungo)
+
+def lx200(*codes):
+    "Decoratore: registra il metodo come esecutore dei comandi LX200 con i codici dati"
+    def register(method):
+        for code in codes:
+            code = code.encode("ascii")
+            if len(code) not in _CODE_SIZES or code in _COMMANDS:
+                raise ValueError("Codice comando errato o duplicato: %s"%code)
+            _COMMANDS[code] = method
+        return method
+    return register
+
+def find_handler(command):
+    "Riporta il metodo registrato per il comando (codice più lungo), o None"
+    for size in _CODE_SIZES:
+        handler = _COMMANDS.get(command[:size])
+        if handler is not None:
+            return handler
+    return None
+
 class LX200(Telescope):         # pylint: disable=R0904
-    "LX200 protocol telescope"
-    def __init__(self):
+    """LX200 protocol telescope
+
+oneshot: se True chiude la connessione dopo ogni comando
+
+I metodi decorati con @lx200 ricevono il comando (bytes, senza "#")
+e riportano la risposta (str)"""
+    def __init__(self, oneshot=False):
         Telescope.__init__(self)
+        self.oneshot = oneshot
+        self._lock = Lock()
         self.utc_offset = 0
         self.latitude = 0
         self.longitude = 0
+        self.sidereal = astro.SiderealClock()
+        self.track_rate = 60.16427
+        self.move_rates = [0., 0.]
 
         self.rotator = CameraRotator()
         self.focuser1 = Focuser()
         self.focuser2 = Focuser()
 
-    def get_current_deh(self):
+    @lx200(":GDe", ":GDA")
+    def get_current_deh(self, _command=b""):
         "Leggi declinazione del telescopio codificata LX200 (alta precisione)"
         return dms_star_encode(self.de_axis.position, precision="h")
 
-    def get_current_de(self):
+    @lx200(":GD")
+    def get_current_de(self, _command=b""):
         "Leggi declinazione del telescopio codificata LX200"
         return dms_star_encode(self.de_axis.position)
 
     def _get_altaz(self):
         "riporta coordinate az, alt (rad) del telescopio"
         de_rad = self.de_axis.position*astro.DEG_TO_RAD
-        ltime = tuple(time.localtime()[:6])
         ra_rad = self.ra_axis.position*astro.HOUR_TO_RAD
         if self.longitude > 180.:
             lon_rad = (180.-self.longitude)*astro.DEG_TO_RAD
         else:
             lon_rad = self.longitude*astro.DEG_TO_RAD
-        tsid_rad = astro.loc_st(*ltime, self.utc_offset, lon_rad)*astro.HOUR_TO_RAD
+        tsid_rad = self.sidereal.lst(lon_rad)*astro.HOUR_TO_RAD
         ha_rad = tsid_rad-ra_rad
         return astro.az_coords(ha_rad, de_rad)
 
-    def get_current_rah(self):
+    @lx200(":GRa", ":GRA")
+    def get_current_rah(self, _command=b""):
         "Leggi ascensione retta del telescopio codificata LX200 (alta precisione)"
         return hms_colon_encode(self.ra_axis.position, precision="h")
 
-    def get_current_ra(self):
+    @lx200(":GR")
+    def get_current_ra(self, _command=b""):
         "Leggi ascensione retta del telescopio codificata LX200"
         return hms_colon_encode(self.ra_axis.position)
 
-    def get_current_az(self):
+    @lx200(":GZ")
+    def get_current_az(self, _command=b""):
         "Leggi azimuth telescopio"
         azalt = self._get_altaz()
         az_deg = astro.RAD_TO_DEG*azalt[0]
         return dddmm_star_encode(az_deg, with_sign=False)
 
-    def get_current_alt(self):
+    @lx200(":GA")
+    def get_current_alt(self, _command=b""):
         "Leggi altezza telescopio"
         azalt = self._get_altaz()
         alt_deg = astro.RAD_TO_DEG*azalt[1]
         return dms_star_encode(alt_deg, with_sign=True)
 
-    def get_date(self):
+    @lx200(":GC")
+    def get_date(self, _command=b""):
         "Leggi data locale"
-        ltime = time.localtime()
-        return "%d:%02d:%02d"%(ltime[2], ltime[1], ltime[0])
+        ltime = simclock.localtime()
+        return "%02d/%02d/%02d#"%(ltime[1], ltime[2], ltime[0]%100)
 
-    def get_ltime(self):
+    @lx200(":GL")
+    def get_ltime(self, _command=b""):
         "Leggi local time"
-        ltime = time.localtime()
-        return "%02d:%02d:%02d"%tuple(ltime[3:6])
+        ltime = simclock.localtime()
+        return "%02d:%02d:%02d#"%tuple(ltime[3:6])
 
-    def get_lon(self):
+    @lx200(":Gg")
+    def get_lon(self, _command=b""):
         "Leggi longitudine"
         return dddmm_star_encode(self.longitude, with_sign=True, precision="M")
 
-    def get_lat(self):
+    @lx200(":Gt")
+    def get_lat(self, _command=b""):
         "Leggi latitudine"
         return dms_star_encode(self.latitude, with_sign=True, precision="M")
 
-    def get_target_de(self):
+    @lx200(":Gd")
+    def get_target_de(self, _command=b""):
         "Leggi declinazione del target codificata LX200"
         return dms_star_encode(self.target.dec)
 
-    def get_target_deh(self):
+    @lx200(":Gde", ":Gda")
+    def get_target_deh(self, _command=b""):
         "Leggi declinazione del target codificata LX200 alta prec."
         return dms_star_encode(self.target.dec, precision="h")
 
-    def get_target_ra(self):
+    @lx200(":Gr")
+    def get_target_ra(self, _command=b""):
         "Leggi ascensione retta del target codificata LX200"
         return hms_colon_encode(self.target.ras)
 
-    def get_target_rah(self):
+    @lx200(":Gra")
+    def get_target_rah(self, _command=b""):
         "Leggi ascensione retta del target codificata LX200 alta prec."
         return hms_colon_encode(self.target.ras, precision="h")
 
-    def get_tsid(self):
+    @lx200(":GS")
+    def get_tsid(self, _command=b""):
         "Riporta tempo siderale"
-        hou, mnt, sec = _convert(astro.loc_st_now(), 24)[1:]
+        hou, mnt, sec = _convert(self.sidereal.lst(), 24)[1:]
         return "%02d:%02d:%02d#"%(hou, mnt, sec)
 
-    def get_pier_side(self):
+    @lx200(":Gm")
+    def get_pier_side(self, _command=b""):
         "Riporta lato braccio (N, E, W)"
         return self.brace+"#"
 
-    def get_uoff(self):
+    @lx200(":GG")
+    def get_uoff(self, _command=b""):
         "Leggi UTC offset"
         sgn = "+" if self.utc_offset >= 0 else "-"
         return sgn+"%04.1f#"%abs(self.utc_offset)
 
-    def move_dir(self, _unused):
-        "Muovi in direzione data"
+    @lx200(":GU")
+    def get_global_status(self, _command=b""):
+        "Leggi stato globale"
+        return "Hp#"
+
+    @lx200(":GW")
+    def get_mount_status(self, _command=b""):
+        "Leggi stato montatura"
+        return "GT2#"
+
+    @lx200(":GVP")
+    def get_product(self, _command=b""):
+        "Leggi nome prodotto"
+        return "Simulatore-"+__version__+"#"
+
+    @lx200(":GVN")
+    def get_fmw_version(self, _command=b""):
+        "Leggi versione firmware"
+        return __version__+"#"
+
+    @lx200(":GVD")
+    def get_fmw_date(self, _command=b""):
+        "Leggi data firmware"
+        return "Jan 01 2021#"
+
+    @lx200(":GVT")
+    def get_fmw_time(self, _command=b""):
+        "Leggi ora firmware"
+        return "00:00:00#"
+
+    @lx200(":GVM")
+    def get_message(self, _command=b""):
+        "Leggi messaggio generico"
+        return "Simulatore telescopio#"
+
+    @lx200(":Gc")
+    def get_time_format(self, _command=b""):
+        "Leggi formato ora"
+        return "24#"
+
+    @lx200(":GT")
+    def get_track_rate(self, _command=b""):
+        "Leggi frequenza di tracking"
+        return "%08.5f#"%self.track_rate
+
+    @lx200(":ST")
+    def set_track_rate(self, command):
+        "Comando STnn.nnnnn - Imposta frequenza di tracking (non simulata)"
+        self.track_rate = float(command[3:])
+        return "1"
+
+    @lx200(":RA", ":RE")
+    def set_move_rate(self, command):
+        "Comandi RAdd.d, REdd.d - Imposta velocità di movimento assi (non simulata)"
+        self.move_rates[command[2:3] == b"E"] = float(command[3:])
+        return ""
+
+    @lx200(":D")
+    def get_distance_bar(self, _command=b""):
+        "Leggi distance bar (telescopio fermo)"
+        return "#"
+
+    @lx200(":Sr")
+    def set_target_ra(self, command):
+        "Comando SrHH:MM:SS - set target RA"
+        hhh, mmm, sss = (int(command[3:5]), int(command[6:8]), int(command[9:11]))
+        if _inrange(hhh, 24) and _inrange(mmm, 60) and _inrange(sss, 60):
+            self.target.ras = hhh+mmm/60.+sss/3600.
+            return "1"
+        return "0"
+
+    @lx200(":Sd")
+    def set_target_de(self, command):
+        "Comando SdsDD*MM:SS - Set target DE"
+        sgn, ddd, mmm, sss = (command[3], int(command[4:6]),
+                              int(command[7:9]), int(command[10:12]))
+        if _inrange(ddd, 90) and _inrange(mmm, 60) and _inrange(sss, 60):
+            mult = 1 if sgn == ord(b"+") else -1
+            self.target.dec = mult*(ddd+mmm/60.+sss/3600.)
+            return "1"
+        return "0"
+
+    @lx200(":St")
+    def set_lat(self, command):
+        "Comando StsDD*MM - Set Latitude"
+        sgn, ddd, mmm = (command[3], int(command[4:6]), int(command[7:9]))
+        if _inrange(ddd, 90) and _inrange(mmm, 60):
+            mult = 1 if sgn == ord(b"+") else -1
+            self.latitude = mult*(ddd+mmm/60.)
+            return "1"
+        return "0"
+
+    @lx200(":Sg")
+    def set_lon(self, command):
+        "Comando SgDDD*MM - Set Longitude"
+        ddd, mmm = (int(command[3:7]), int(command[8:10]))
+        if _inrange(ddd, 360) and _inrange(mmm, 60):
+            self.longitude = ddd+mmm/60.
+            return "1"
+        return "0"
+
+    @lx200(":SG")
+    def set_uoff(self, command):
+        "Comando SGsHHH.H - Set UTC offset"
+        try:
+            val = float(command[3:8])
+        except ValueError:
+            val = None
+        if val is not None and -12 <= val <= 12:
+            self.utc_offset = val
+            return "1"
+        if GLOB.verbose:
+            print("Errore conversione UTC offset:", command[3:8])
+        return "0"
+
+    @lx200(":MS")
+    def slew_to_target(self, _command=b""):
+        "Comando MS - Slew to target"
+        self.ra_axis.goto(self.target.ras)
+        self.de_axis.goto(self.target.dec)
+        return "0"
+
+    @lx200(":Ms", ":Mn", ":Me", ":Mw")
+    def move_dir(self, _command):
+        "Comando Msd - Muovi in direzione data"
         return ""
 
-    def stop_dir(self, _unused):
-        "Interrompi movimento in direzione data"
+    @lx200(":Q")
+    def stop_dir(self, _command):
+        "Comando Q, Qd - Interrompi movimento (in direzione data)"
         return ""
 
-    def pulse_guide(self, _dirc, _time):
-        "Comando pulse-guide TBD"
+    @lx200(":Mg")
+    def pulse_guide(self, _command):
+        "Comando Mgdnnn - Pulse-guide TBD"
         return ""
 
-    def execute(self, command):           # pylint: disable=R0912
-        "Esecuzione comando telescopio"
+    @lx200(":r+", ":r-", ":rP", ":rR", ":rF", ":rC", ":r>", ":r<", ":r1", ":r2", ":r3",
+           ":rS", ":rG")
+    def rotator_cmd(self, _command):
+        "Comandi rotatore (non simulati)"
+        return "0"
+
+    def execute(self, command):
+        "Esecuzione comando telescopio (command: bytes, senza '#')"
+        handler = find_handler(command)
+        if handler is None:
+            return b"0"
         try:
-            if command[:3] == b":Sr":    # Comando SrHH:MM:SS - set target RA
-                hhh, mmm, sss = (int(command[3:5]), int(command[6:8]), int(command[9:11]))
-                if _inrange(hhh, 24) and _inrange(mmm, 60) and _inrange(sss, 60):
-                    self.target.ras = hhh+mmm/60.+sss/3600.
-                    ret = "1"
-                else:
-                    ret = "0"
-            elif command[:3] == b":Sd": # Comando SdsDD*MM:SS - Set target DE
-                sgn, ddd, mmm, sss = (command[3], int(command[4:6]),
-                                      int(command[7:9]), int(command[10:12]))
-                if _inrange(ddd, 90) and _inrange(mmm, 60) and _inrange(sss, 60):
-                    mult = 1 if sgn == ord(b"+") else -1
-                    self.target.dec = mult*(ddd+mmm/60.+sss/3600.)
-                    ret = "1"
-                else:
-                    ret = "0"
-            elif command[:3] == b":St": # Comando StsDD*MM - Set Latitude
-                sgn, ddd, mmm = (command[3], int(command[4:6]), int(command[7:9]))
-                if _inrange(ddd, 90) and _inrange(mmm, 60):
-                    mult = 1 if sgn == ord(b"+") else -1
-                    self.latitude = mult*(ddd+mmm/60.)
-                    ret = "1"
-                else:
-                    ret = "0"
-            elif command[:3] == b":Sg": # Comando SgDDD*MM - Set Longitude
-                print(command[3:7], command[8:10])
-                ddd, mmm = (int(command[3:7]), int(command[8:10]))
-                if _inrange(ddd, 360) and _inrange(mmm, 60):
-                    self.longitude = ddd+mmm/60.
-                    ret = "1"
-                else:
-                    ret = "0"
-            elif command[:3] == b":SG": # Comando SGsHHH.H - Set UTC offset
-                try:
-                    val = float(command[3:8])
-                except:
-                    ret = "0"
-                    if GLOB.verbose:
-                        print("Errore conversione UTC offset:", command[3:8])
-                else:
-                    if -12 <= val <= 12:
-                        self.utc_offset = val
-                        ret = "1"
-                    else:
-                        if GLOB.verbose:
-                            print("Errore conversione UTC offset:", command[3:8])
-                        ret = "0"
-            elif command[:2] == b":M":    # Comandi di movimento
-                if command[2] == b"S":    # Comando MS - Slew to target
-                    self.ra_axis.goto(self.target.ras)
-                    self.de_axis.goto(self.target.dec)
-                    ret = ""
-                elif command[2] in b"snew":   # Comando Msd - Muovi in direzione data
-                    ret = self.move_dir(command[2])
-            elif command[:2] == b":Q":    # Comandi stop
-                if len(command) > 2:
-                    drc = command[2]
-                else:
-                    drc = None
-                ret = self.stop_dir(drc)
-            elif command[:3] == b":Mg":   # Comando Mgdnnn - Pulse-guide
-                ret = self.pulse_guide(command[3], int(command[4:]))
-            elif command[:3] == b":GA":   # Comando GA - Get telescope altitude
-                ret = self.get_current_alt()
-            elif command[:3] == b":GC":   # Comando GA - Get telescope date
-                ret = self.get_date()
-            elif command[:4] == b":GDA":   # Comando GDA - Get scope declination (alta prec.)
-                ret = self.get_current_deh()
-            elif command[:3] == b":GD":   # Comando GD - Get scope declination
-                ret = self.get_current_de()
-            elif command[:4] == b":Gda":   # Comando Gd - Get target declination
-                ret = self.get_target_deh()
-            elif command[:3] == b":Gd":   # Comando Gd - Get target declination
-                ret = self.get_target_de()
-            elif command[:3] == b":GG":   # Comando GG - Get UTC offset
-                ret = self.get_uoff()
-            elif command[:3] == b":Gg":   # Comando Gg - Get longitude
-                ret = self.get_lon()
-            elif command[:3] == b":GL":   # Comando GL - Get local time
-                ret = self.get_ltime()
-            elif command[:3] == b":Gm":   # Comando Gm - Get pier side
-                ret = self.get_pier_side()
-            elif command[:4] == b":GRA":   # Comando GR - Get scope right ascension
-                ret = self.get_current_rah()
-            elif command[:3] == b":GR":   # Comando GR - Get scope right ascension
-                ret = self.get_current_ra()
-            elif command[:4] == b":Gra":   # Comando Gr - Get target right ascension
-                ret = self.get_target_rah()
-            elif command[:3] == b":Gr":   # Comando Gr - Get target right ascension
-                ret = self.get_target_ra()
-            elif command[:3] == b":GS":   # Comando GS - Get sidereal time
-                ret = self.get_tsid()
-            elif command[:3] == b":Gt":   # Comando Gt - Get latitude
-                ret = self.get_lat()
-            elif command[:3] == b":GU":   # Comando GU - Get global status
-                ret = "Hp#"
-            elif command[:4] == b":GVP":   # Comando GVP - Get product name
-                ret = "Simulatore-"+__version__+"#"
-            elif command[:4] == b":GW":   # Comando GW - Get Mount status
-                ret = "GT2#"
-            elif command[:3] == b":GZ":   # Comando GZ - Get telescope azimuth
-                ret = self.get_current_az()
-            elif command[:3] == b":r+":   # Comando r+ - Abilita rotatore
-                ret = "0"
-            elif command[:3] == b":r-":   # Comando r- - Disabilita rotatore
-                ret = "0"
-            elif command[:3] == b":rP":   # Comando rP - Muovi rotatore ad angolo parallattico
-                ret = "0"
-            elif command[:3] == b":rR":   # Comando rR - Inverte direzione rotatore
-                ret = "0"
-            elif command[:3] == b":rF":   # Comando rF - Reset rotatore a pos. home
-                ret = "0"
-            elif command[:3] == b":rC":   # Comando rC - Muovi rotatore a pos. home
-                ret = "0"
-            elif command[:3] == b":r>":   # Comando r> - Muove rotatore in senso orario
-                ret = "0"
-            elif command[:3] == b":r<":   # Comando r< - Muove rotatore in senso antiorario
-                ret = "0"
-            elif command[:3] == b":r1":   # Comando r1 - Imposta incremento rotatore
-                ret = "0"
-            elif command[:3] == b":r2":   # Comando r2 - Imposta incremento rotatore
-                ret = "0"
-            elif command[:3] == b":r3":   # Comando r3 - Imposta incremento rotatore
-                ret = "0"
-            elif command[:3] == b":rS":   # Comando rS - Imposta posizione rotatore
-                ret = "0"
-            elif command[:3] == b":rG":   # Comando rG - Leggi posizione rotatore
-                ret = "0"
-            elif command[:3] == b":r+":   # Comando r+ - Abilita rotatore
-                ret = "0"
-            else:
-                ret = "0"
-        except Exception as excp:
+            ret = handler(self, command)
+        except Exception as excp:          # pylint: disable=W0703
             if GLOB.verbose:
                 print("Tel Exception:", str(excp))
             ret = "0"
@@ -563,44 +637,96 @@ class LX200(Telescope):         # pylint: disable=R0904
         self.focuser2.start()
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind(('', 9753))
-        print("Simulatore telescopio attivo su port 9753", flush=True)
-        sock.listen(5)
+        sock.bind(('', PORT))
+        print("Simulatore telescopio attivo su port %d%s"%(PORT, " (one-shot)"
+                                                           if self.oneshot else ""), flush=True)
+        sock.listen(socket.SOMAXCONN)
 
         while True:
             (client, address) = sock.accept()
-            command = b""
+            Thread(target=self.serve_client, args=(client, address), daemon=True).start()
+
+    def serve_client(self, client, address):
+        "Gestione della connessione con un client"
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = FrameReader(client)
+        try:
             while True:
-                achar = client.recv(1)
-                if not achar:
+                frame = reader.read_frame()
+                if not frame.endswith(b"#"):
                     break
-                if achar == b"#":
-                    if GLOB.verbose:
-                        print("Comando telescopio da %s %s#"%(address[0],
-                                                              command.decode("ascii")), end=" ")
+                command = frame[:-1]
+                with self._lock:
                     ret = self.execute(command)
+                if GLOB.verbose:
+                    print("Comando telescopio da %s:%d %s# - %s"%(address[0], address[1],
+                                                                 command.decode("ascii"),
+                                                                 ret.decode("ascii")), flush=True)
+                if ret:
                     client.sendall(ret)
+                if self.oneshot:
                     client.shutdown(socket.SHUT_RDWR)
-                    client.close()
-                    if GLOB.verbose:
-                        print("-", ret.decode("ascii"), flush=True)
-                    command = b""
                     break
-                command += achar
+        except OSError:
+            pass
+        finally:
+            client.close()
 
 def help_cmd():
     "Aiuto per comandi"
     print(HELP)
 
+                  # Comandi per la misura di velocità
+BENCH_COMMANDS = (b":GRa", b":GR", b":GDe", b":GD", b":Gm", b":GS", b":GU", b":GZ", b":GA",
+                  b":GC", b":GL", b":Gt", b":Gg", b":GG", b":Gr", b":Gd", b":GVP", b":D",
+                  b":Sr12:30:00.000", b":Sd+45*30:00.000", b":St+43*45", b":SG+01.0",
+                  b":Me", b":Q", b":Qe", b":rG", b":XX")
+BENCH_REPEAT = 20000
+
+def benchmark(nrep):
+    "Misura velocità di ricerca ed esecuzione dei comandi"
+    telescope = LX200()
+    print("Comando               ricerca(us)  esecuzione(us)")
+    tot_find = tot_exec = 0.
+    for command in BENCH_COMMANDS:
+        tm0 = time.perf_counter()
+        for _unused in range(nrep):
+            find_handler(command)
+        tm1 = time.perf_counter()
+        for _unused in range(nrep):
+            telescope.execute(command)
+        tm2 = time.perf_counter()
+        tot_find += tm1-tm0
+        tot_exec += tm2-tm1
+        print("%-20s %12.3f %15.3f"%(command.decode("ascii"), (tm1-tm0)*1.E6/nrep,
+                                     (tm2-tm1)*1.E6/nrep))
+    ncmds = nrep*len(BENCH_COMMANDS)
+    print()
+    print("Media: ricerca %.3f us, esecuzione %.3f us - %.0f comandi/sec"%(
+        tot_find*1.E6/ncmds, tot_exec*1.E6/ncmds, ncmds/tot_exec))
+
 def main():
     "Programma principale"
 
     if "-h" in sys.argv:
         print(__doc__)
         sys.exit()
+    if "-b" in sys.argv:
+        try:
+            nrep = int(sys.argv[sys.argv.index("-b")+1])
+        except (IndexError, ValueError):
+            nrep = BENCH_REPEAT
+        benchmark(nrep)
+        sys.exit()
     if "-v" in sys.argv:
         GLOB.verbose = True
-    telescope = LX200()
+    if "-x" in sys.argv or "-T" in sys.argv:
+        speed = float(sys.argv[sys.argv.index("-x")+1]) if "-x" in sys.argv else 1.
+        start = simclock.parse_time(sys.argv[sys.argv.index("-T")+1]) \
+                if "-T" in sys.argv else None
+        simclock.configure(speed, start)
+    print(simclock.CLOCK, flush=True)
+    telescope = LX200(oneshot="-1" in sys.argv)
     telescope.start()
     time.sleep(2)
 
@@ -617,6 +743,14 @@ def main():
             GLOB.verbose = not GLOB.verbose
         elif cmds[0][0].lower() == "t":
             pprint.pprint(telescope.get_status(), indent=4)
+        elif cmds[0][0].lower() == "a":
+            try:
+                simclock.CLOCK.advance(float(cmds[1]))
+            except (IndexError, ValueError, RuntimeError) as excp:
+                print("Errore:", excp)
+            print(simclock.CLOCK)
+        elif cmds[0][0].lower() == "c":
+            print(simclock.CLOCK)
         elif cmds[0][0].lower() == "q":
             break
         else:
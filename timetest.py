@@ -1,62 +1,320 @@
 """
-Test di temporizzazione comunicazione con telescopio
+Test di carico e di temporizzazione della comunicazione con il telescopio
 
-Misura i tempi di risposta ai comandi più comuni (interrogazioni posizione)
+Esegue una sequenza di interrogazioni (miscela di comandi) con N client
+contemporanei, ciascuno alla frequenza richiesta, e riporta per comando e
+in totale: numero di richieste, frequenza ottenuta, tempi di risposta
+(media, p50, p95, p99, massimo) e frazione di errori.
+
+Serve a dimensionare la frequenza di interrogazione (repeat, UPDATE_TRACKER)
+sul simulatore o sul telescopio reale. I risultati possono essere salvati
+in formato JSON o CSV e confrontati con quelli di un'esecuzione precedente.
 
 Uso:
-      python timetest.py [-d] [rip]
+      python timetest.py [-c] [-d] [-k] [-q] [-m mix] [-n num] [-r freq] [-t durata]
+                         [-j file.json] [-o file.csv]
+      python timetest.py -C base.json nuovo.json
 
 dove:
+      -c  Usa la cache delle interrogazioni (CachedTeleCommunicator)
       -d  Collegamento al simulatore (IP: 127.0.0.1, Port: 9753)
-      rip  Intervallo ripetizione interrogazioni (default: 1 sec)
+      -k  Usa connessioni persistenti (keep-alive)
+      -q  Invia l'intera miscela con un'unica richiesta (query_many)
+      -m  Miscela di comandi: nome predefinito (position, timetest, all) o
+          lista di nomi di metodi get_... separati da virgola, ciascuno
+          eventualmente con peso (es: get_current_ha:2,get_pside:1).
+          Default: position
+      -n  Numero di client contemporanei (default: 1)
+      -r  Frequenza delle richieste per client (Hz, 0: massima; default: 1)
+      -t  Durata del test (sec, default: 60)
+      -j  Salva i risultati in formato JSON
+      -o  Salva i risultati in formato CSV
+      -C  Confronta i risultati di due esecuzioni (file JSON)
 
-NOTA: il test dura 5 minuti e può essere interrotto con CTRL-C
+Il test può essere interrotto con CTRL-C (vengono riportati i risultati parziali)
 """
 
 import sys
 import time
-import configure as conf
-from telecomm import TeleCommunicator
-
-def timeme(func):
-    tm0 = time.time()
-    ret = func()
-    tm1 = time.time()
-    print(ret, "   -- delay: %.3f s"%(tm1-tm0))
-
-if '-h' in sys.argv:
-    print(__doc__)
-    sys.exit()
-
-if '-d' in sys.argv:
-    config = {"tel_ip": "127.0.0.1",
-              "tel_port": 9753,
-              "debug": 1}
-else:
-    config = conf.get_config()
-if not config:
-    print("File di configurazione inesistente!")
-    print("occorre definirlo con:")
+import json
+import random
+import threading
+
+import configdata as conf
+from telecomm import TeleCommunicator, CachedTeleCommunicator, QUERY_NAMES
+from telestats import Histogram
+
+                   # Miscele predefinite
+MIXES = {"position": ("get_current_ha", "get_current_de", "get_pside"),   # come trackcore
+         "timetest": ("get_az", "get_current_de", "get_current_ra", "get_tsid"),
+         "all": QUERY_NAMES}
+
+DEFAULT_MIX = "position"
+DURATION = 60.
+RATE = 1.
+TIMEOUT = 2.0
+
+PIPELINE = "query_many"            # Nome per le richieste con -q
+
+def parse_mix(spec):
+    "Decodifica specifica della miscela. Riporta lista di (nome, peso)"
+    if spec in MIXES:
+        return [(name, 1.) for name in MIXES[spec]]
+    mix = []
+    for item in spec.split(","):
+        name, _unused, weight = item.strip().partition(":")
+        if name not in QUERY_NAMES:
+            raise ValueError("Interrogazione non prevista: %s"%name)
+        mix.append((name, float(weight) if weight else 1.))
+    return mix
+
+class Results:
+    "Risultati di un client (o dell'insieme dei client)"
+    def __init__(self):
+        self.latency = {}
+        self.errors = {}
+
+    def record(self, name, elapsed, error):
+        "Registra una richiesta"
+        hist = self.latency.get(name)
+        if hist is None:
+            hist = self.latency[name] = Histogram()
+            self.errors[name] = 0
+        hist.record(elapsed)
+        if error:
+            self.errors[name] += 1
+
+    def merge(self, other):
+        "Aggiunge i risultati di un altro client"
+        for name, hist in other.latency.items():
+            if name not in self.latency:
+                self.latency[name] = Histogram()
+                self.errors[name] = 0
+            self.latency[name].merge(hist)
+            self.errors[name] += other.errors[name]
+
+class Client(threading.Thread):
+    """
+Client di test: esegue le richieste alla frequenza data fino al termine
+
+tel:      TeleCommunicator (o CachedTeleCommunicator)
+mix:      lista di (nome, peso)
+rate:     frequenza delle richieste (Hz, 0: massima)
+pipeline: se True ogni richiesta comprende l'intera miscela (query_many)
+"""
+    def __init__(self, tel, mix, rate, pipeline, seed):      # pylint: disable=R0913
+        threading.Thread.__init__(self, daemon=True)
+        self.tel = tel
+        self.names = [name for name, _unused in mix]
+        self.weights = [weight for _unused, weight in mix]
+        self.period = 1./rate if rate > 0 else 0.
+        self.pipeline = pipeline
+        self.results = Results()
+        self.goon = threading.Event()
+        self.goon.set()
+        self._random = random.Random(seed)
+
+    def choose(self):
+        "Sceglie la prossima interrogazione in base ai pesi"
+        total = sum(self.weights)
+        value = self._random.uniform(0., total)
+        for name, weight in zip(self.names, self.weights):
+            value -= weight
+            if value <= 0.:
+                return name
+        return self.names[-1]
+
+    def request(self):
+        "Esegue una richiesta"
+        if self.pipeline:
+            tm0 = time.perf_counter()
+            replies = self.tel.query_many(self.names)
+            elapsed = time.perf_counter()-tm0
+            self.results.record(PIPELINE, elapsed, any(err for _unused, err in replies))
+            return
+        name = self.choose()
+        tm0 = time.perf_counter()
+        value, err = self.tel.query_many((name,))[0]
+        elapsed = time.perf_counter()-tm0
+        self.results.record(name, elapsed, err or value is None)
+
+    def run(self):
+        "Ciclo delle richieste"
+        next_time = time.perf_counter()
+        while self.goon.is_set():
+            self.request()
+            if self.period:
+                next_time += self.period
+                delay = next_time-time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:                           # In ritardo: non recupera
+                    next_time = time.perf_counter()
+
+    def stop(self):
+        "Termina il client"
+        self.goon.clear()
+
+def _msec(value):
+    "Converte tempo in millisecondi"
+    return None if value is None else value*1000.
+
+def summarize(hist, errors, elapsed):
+    "Riassunto dei risultati di un comando (tempi in ms)"
+    return {"requests": hist.count, "throughput": hist.count/elapsed if elapsed else 0.,
+            "errors": errors, "error_rate": errors/hist.count if hist.count else 0.,
+            "mean": _msec(hist.mean()), "p50": _msec(hist.percentile(50)),
+            "p95": _msec(hist.percentile(95)), "p99": _msec(hist.percentile(99)),
+            "max": _msec(hist.max)}
+
+def run_test(config, pars):
+    "Esegue il test. Riporta dizionario con parametri e risultati"
+    mix = parse_mix(pars["mix"])
+    clients = []
+    for ncl in range(pars["clients"]):
+        tel = TeleCommunicator(config["tel_ip"], config["tel_port"], timeout=TIMEOUT,
+                               keepalive=pars["keepalive"])
+        if pars["cache"]:
+            tel = CachedTeleCommunicator(tel)
+        clients.append(Client(tel, mix, pars["rate"], pars["pipeline"], ncl))
+    tm0 = time.perf_counter()
+    for client in clients:
+        client.start()
+    try:
+        time.sleep(pars["duration"])
+    except KeyboardInterrupt:
+        print("Test interrotto")
+    for client in clients:
+        client.stop()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter()-tm0
+    total = Results()
+    for client in clients:
+        total.merge(client.results)
+    alltimes = Histogram()
+    for hist in total.latency.values():
+        alltimes.merge(hist)
+    commands = {name: summarize(hist, total.errors[name], elapsed)
+                for name, hist in total.latency.items()}
+    return {"params": dict(pars, tel_ip=config["tel_ip"], tel_port=config["tel_port"],
+                           date=time.strftime("%Y-%m-%d %H:%M:%S")),
+            "elapsed": elapsed,
+            "total": summarize(alltimes, sum(total.errors.values()), elapsed),
+            "commands": commands}
+
+COLUMNS = ("requests", "throughput", "error_rate", "mean", "p50", "p95", "p99", "max")
+
+def _fmt(value, width=9):
+    "Formatta valore per la tabella"
+    if value is None:
+        return "%*s"%(width, "-")
+    if isinstance(value, int):
+        return "%*d"%(width, value)
+    return "%*.3f"%(width, value)
+
+def print_results(result):
+    "Visualizza i risultati"
+    pars = result["params"]
+    print("Telescopio: %s:%d - miscela: %s - client: %d - freq.: %g Hz - durata: %.1f s"%(
+        pars["tel_ip"], pars["tel_port"], pars["mix"], pars["clients"], pars["rate"],
+        result["elapsed"]))
+    print("Opzioni: keep-alive=%s, cache=%s, query_many=%s"%(pars["keepalive"], pars["cache"],
+                                                            pars["pipeline"]))
+    print()
+    print("%-18s %9s %9s %9s %9s %9s %9s %9s %9s"%("Comando", "Num.", "Rich./s", "Errori",
+                                                   "Media", "p50", "p95", "p99", "Max (ms)"))
+    items = sorted(result["commands"].items())
+    items.append(("Totale", result["total"]))
+    for name, res in items:
+        print("%-18s %s"%(name, " ".join(_fmt(res[col]) for col in COLUMNS)))
+
+def write_csv(result, fname):
+    "Salva i risultati in formato CSV (una riga per comando e una per il totale)"
+    with open(fname, "w") as fout:
+        fout.write("command,"+",".join(COLUMNS)+"\n")
+        items = sorted(result["commands"].items())
+        items.append(("total", result["total"]))
+        for name, res in items:
+            fout.write(name+","+",".join("" if res[col] is None else str(res[col])
+                                         for col in COLUMNS)+"\n")
+
+def _delta(old, new):
+    "Variazione percentuale"
+    if old is None or new is None:
+        return "%9s"%"-"
+    if old == 0:
+        return "%9s"%("=" if new == 0 else "+inf")
+    return "%+8.1f%%"%((new-old)*100./old)
+
+def compare(base, new):
+    "Confronta i risultati di due esecuzioni"
+    print("Base:  %s - %s"%(base["params"]["date"], base["params"]["mix"]))
+    print("Nuovo: %s - %s"%(new["params"]["date"], new["params"]["mix"]))
     print()
-    print("   python cupola.py -c")
-    sys.exit()
-
-try:
-    rep = float(sys.argv[-1])
-except ValueError:
-    rep = 1.0
-
-tlc = TeleCommunicator(config["tel_ip"], config["tel_port"], timeout=2.0)
-
-time0 = time.time()
-final_time = time0+300
-while time0 < final_time:
-    time.sleep(rep)
-    print("Leggi azimuth", end=" ", flush=True); timeme(tlc.get_az)
-    time.sleep(rep)
-    print("Leggi declin.", end=" ", flush=True); timeme(tlc.get_current_de)
-    time.sleep(rep)
-    print("Leggi asc.retta.", end=" ", flush=True); timeme(tlc.get_current_ra)
-    time.sleep(rep)
-    print("Leggi t.sid.", end=" ", flush=True); timeme(tlc.get_tsid)
-    time0 = time.time()
+    print("%-18s %-10s %10s %10s %10s"%("Comando", "Valore", "Base", "Nuovo", "Variaz."))
+    names = sorted(set(base["commands"]) & set(new["commands"]))
+    items = [(name, base["commands"][name], new["commands"][name]) for name in names]
+    items.append(("Totale", base["total"], new["total"]))
+    for name, bres, nres in items:
+        for col in COLUMNS[1:]:
+            print("%-18s %-10s %s  %s %s"%(name, col, _fmt(bres[col], 9), _fmt(nres[col], 9),
+                                           _delta(bres[col], nres[col])))
+            name = ""
+
+def get_arg(flag, default):
+    "Legge valore di un'opzione"
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag)+1]
+    return default
+
+def main():
+    "Procedura di test"
+    if '-h' in sys.argv:
+        print(__doc__)
+        sys.exit()
+
+    if '-C' in sys.argv:
+        idx = sys.argv.index('-C')
+        with open(sys.argv[idx+1]) as fin:
+            base = json.load(fin)
+        with open(sys.argv[idx+2]) as fin:
+            new = json.load(fin)
+        compare(base, new)
+        sys.exit()
+
+    if '-d' in sys.argv:
+        config = {"tel_ip": "127.0.0.1",
+                  "tel_port": 9753,
+                  "debug": 1}
+    else:
+        config = conf.get_config()
+    if not config:
+        print("File di configurazione inesistente!")
+        print("occorre definirlo con:")
+        print()
+        print("   python cupola.py -c")
+        sys.exit()
+
+    pars = {"mix": get_arg("-m", DEFAULT_MIX),
+            "clients": int(get_arg("-n", 1)),
+            "rate": float(get_arg("-r", RATE)),
+            "duration": float(get_arg("-t", DURATION)),
+            "keepalive": "-k" in sys.argv,
+            "cache": "-c" in sys.argv,
+            "pipeline": "-q" in sys.argv}
+    try:
+        parse_mix(pars["mix"])
+    except ValueError as excp:
+        print(excp)
+        sys.exit(1)
+    result = run_test(config, pars)
+    print_results(result)
+    if '-j' in sys.argv:
+        with open(get_arg("-j", ""), "w") as fout:
+            json.dump(result, fout, indent=2)
+    if '-o' in sys.argv:
+        write_csv(result, get_arg("-o", ""))
+
+if __name__ == "__main__":
+    main()
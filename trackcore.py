@@ -0,0 +1,655 @@
+"""
+Nucleo di acquisizione e controllo per asservimento cupola
+
+Il loop di eventi asyncio gira in un thread dedicato: interroga
+contemporaneamente telescopio (AsyncTeleCommunicator) e cupola (ASCOM),
+calcola la posizione obiettivo della cupola, invia i comandi di movimento
+e scrive il file di log.
+
+Lo stato corrente viene pubblicato ad ogni ciclo come oggetto immutabile
+(State) in una coda, da cui la GUI lo preleva alla propria cadenza. I comandi
+della GUI vengono accodati ed eseguiti dal thread di controllo, per cui la
+latenza dell'inseguimento non dipende dalla GUI.
+
+Tutte le operazioni sulla cupola sono eseguite da un unico thread
+(necessario per gli oggetti COM di ASCOM), che crea anche l'oggetto
+cupola mediante la funzione fornita dal chiamante (default: open_dome).
+
+Il modulo non importa tkinter: è utilizzato sia dalla GUI (dtracker.py)
+che dalla procedura senza GUI (dtrackerd.py)
+"""
+
+import os
+import sys
+import time
+import math
+import queue
+import asyncio
+import traceback
+from threading import Thread
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from telecomm import AsyncTeleCommunicator
+from interpolator import Interpolator, az_delta
+from domemodel import DomeModel
+from domesched import segment, sample_path, HORIZON, STEP
+from astro import TCIV_TO_TSID
+import simclock
+
+__version__ = "1.2"
+__author__ = "Luca Fini"
+__date__ = "Gennaio 2021"
+
+try:
+    import win32com.client as wcl
+    import pythoncom
+    SIMULATED_ASCOM = False
+except ModuleNotFoundError:
+    import ascom_fake as wcl
+    print("Using ASCOM_FAKE !!!", file=sys.stderr)
+    SIMULATED_ASCOM = True
+
+TEL_QUERY = ("get_current_ha", "get_current_de", "get_pside")
+TEL_RETRY = 0.3        # Attesa prima di ripetere interrogazione telescopio (sec)
+
+BR_EAST = "E"
+BR_WEST = "W"
+
+FLOAT_NAN = float("nan")
+
+TABLE_MODEL = "table"          # Valori di config["dome_model"]
+ANALYTIC_MODEL = "analytic"
+
+SIDEREAL_RATE = TCIV_TO_TSID/3600.  # Velocità angolo orario in inseguimento (ore/sec)
+MAX_HA_DEV = 0.05*SIDEREAL_RATE  # Scarto max da velocità di inseguimento: angolo orario (ore/sec)
+MAX_DE_DEV = 15.*MAX_HA_DEV      # e declinazione (gradi/sec, stessa velocità angolare)
+HA_RESOLUTION = 0.01/3600.       # Risoluzione delle letture: angolo orario (ore, da :GRa)
+DE_RESOLUTION = 1./3600.         # e declinazione (gradi, da :GD)
+                               # oltre il quale il telescopio è considerato in movimento
+RATE_SMOOTH = 0.3              # Peso nuove misure nella media delle velocità
+DOME_SPEED = 2.0               # Velocità cupola di default (gradi/sec)
+SCHED_MARGIN = 0.9             # Tolleranza per pianificazione (frazione di dome_maxerr)
+
+HOMEDIR = os.path.expanduser("~")
+
+# Interpolatori per lato est e ovest: le tabelle vengono caricate al primo
+# uso (vedi get_interpolator), non all'importazione del modulo
+INTERPOLATORS = {}
+
+def get_interpolator(side):
+    "Riporta interpolatore per il lato indicato (E/W), caricando la tabella al primo uso"
+    interp = INTERPOLATORS.get(side)
+    if interp is None:
+        interp = Interpolator(side=side.lower())
+        INTERPOLATORS[side] = interp
+    return interp
+
+# Stato del sistema pubblicato dal thread di controllo
+#
+# tstamp:     tempo della lettura (simclock.now(): time.time() se non simulato)
+# tel:        (ha, de, lato) oppure None
+# dome:       (azimuth, slewing) oppure None
+# target_az:  azimut obiettivo cupola (None se non definito)
+# at_target:  True se cupola in posizione
+# slave:      True se inseguimento attivo
+# logging:    True se logging attivo
+# info:       messaggio di stato
+State = namedtuple("State", ("tstamp", "tel", "dome", "target_az", "at_target",
+                             "slave", "logging", "info"))
+
+def open_dome(ascom_id):
+    "Crea oggetto cupola ASCOM (nel thread che lo utilizza)"
+    if not SIMULATED_ASCOM:
+        pythoncom.CoInitialize()
+    return wcl.Dispatch(ascom_id)
+
+def dome_azimuth(ha_h, de_d, side, models=None):
+    """Calcola azimuth cupola da coordinate telescopio. Riporta (azimuth, errore)
+
+models: dizionario lato -> modello (default: tabelle di interpolazione)"""
+    if side not in (BR_EAST, BR_WEST):
+        return None, "ERR: Pier side (%s)"%side
+    if models is None:
+        az_deg = get_interpolator(side).interpolate(ha_h, de_d)
+    else:
+        az_deg = models[side].interpolate(ha_h, de_d)
+    if math.isnan(az_deg):
+        return None, "ERR: Interpolazione (ha:%.2f, de:%.2f)"%(ha_h, de_d)
+    return az_deg, ""
+
+def dome_command(target, azm, maxerr, critical=None):
+    """Decide il movimento della cupola
+
+target:   azimut obiettivo (gradi)
+azm:      azimut attuale cupola (gradi)
+maxerr:   errore massimo ammesso (gradi)
+critical: ampiezza zona critica (gradi): se la distanza è inferiore il
+          movimento è ridotto a metà (None: nessuna correzione)
+
+Riporta (azimut da comandare o None, True se cupola in posizione)"""
+    dist = target-azm
+    if dist > 180.:
+        dist -= 360.
+    elif dist < -180.:
+        dist += 360.
+    adist = abs(dist)
+    if adist <= maxerr:
+        return None, True
+    if critical is not None and adist < critical:
+        mod_target = (target-adist/2) if dist > 0 else (target+adist/2)
+        return mod_target%360, False
+    return target, False
+
+class Predictor:
+    """
+Stima delle velocità di telescopio e cupola per il puntamento anticipato
+
+La posizione obiettivo della cupola viene calcolata per la posizione
+del telescopio al tempo t+anticipo, dove l'anticipo è il tempo di
+movimento della cupola più un periodo di aggiornamento.
+
+Le velocità del telescopio sono misurate dalle letture successive; se
+il telescopio è in movimento (velocità lontane da quelle di inseguimento)
+si usano le velocità di inseguimento (angolo orario: velocità siderale,
+declinazione: zero). La velocità della cupola è misurata durante i
+movimenti (valore iniziale: dome_speed)
+
+period:     periodo di aggiornamento (sec)
+dome_speed: velocità cupola iniziale (gradi/sec)
+"""
+    def __init__(self, period, dome_speed=DOME_SPEED):
+        self.period = period
+        self.dome_speed = dome_speed
+        self.rate_ha = SIDEREAL_RATE
+        self.rate_de = 0.
+        self.tracking = False
+        self._tel = None
+        self._dome = None
+
+    def reset(self):
+        "Azzera le misure di velocità del telescopio"
+        self.rate_ha = SIDEREAL_RATE
+        self.rate_de = 0.
+        self.tracking = False
+        self._tel = None
+
+    def update_telescope(self, tstamp, ha_h, de_d, side):
+        "Aggiorna velocità telescopio con nuova lettura"
+        prev = self._tel
+        self._tel = (tstamp, ha_h, de_d, side)
+        if prev is None:
+            return
+        dtime = tstamp-prev[0]
+        if dtime <= 0:
+            return
+        if side != prev[3]:
+            self.reset()
+            self._tel = (tstamp, ha_h, de_d, side)
+            return
+        r_ha = ((ha_h-prev[1]+12.)%24.-12.)/dtime
+        r_de = (de_d-prev[2])/dtime
+        if abs(r_ha-SIDEREAL_RATE) > MAX_HA_DEV+HA_RESOLUTION/dtime or \
+           abs(r_de) > MAX_DE_DEV+DE_RESOLUTION/dtime:
+            self.rate_ha = SIDEREAL_RATE
+            self.rate_de = 0.
+            self.tracking = False
+        elif self.tracking:
+            self.rate_ha += RATE_SMOOTH*(r_ha-self.rate_ha)
+            self.rate_de += RATE_SMOOTH*(r_de-self.rate_de)
+        else:
+            self.rate_ha = r_ha
+            self.rate_de = r_de
+            self.tracking = True
+
+    def update_dome(self, tstamp, azm, slewing):
+        "Aggiorna velocità cupola con nuova lettura"
+        prev = self._dome
+        self._dome = (tstamp, azm, slewing)
+        if prev is None or not (slewing and prev[2]):
+            return
+        dtime = tstamp-prev[0]
+        speed = abs(az_delta(prev[1], azm))/dtime if dtime > 0 else 0.
+        if speed > 0:
+            self.dome_speed += RATE_SMOOTH*(speed-self.dome_speed)
+
+    def lead_time(self, azm, target):
+        "Anticipo (sec) per cupola in azm e obiettivo target"
+        return self.period+abs(az_delta(azm, target))/self.dome_speed
+
+    def predict(self, ha_h, de_d, lead):
+        "Posizione telescopio (ha, de) dopo lead secondi"
+        return ha_h+self.rate_ha*lead, de_d+self.rate_de*lead
+
+    def target(self, ha_h, de_d, side, azm, models=None):
+        """Posizione obiettivo cupola anticipata. Riporta (azimut, errore)
+
+azm: azimut attuale della cupola (None: non anticipa)"""
+        target, error = dome_azimuth(ha_h, de_d, side, models)
+        if target is None or azm is None:
+            return target, error
+        pha, pde = self.predict(ha_h, de_d, self.lead_time(azm, target))
+        predicted, _unused = dome_azimuth(pha, pde, side, models)
+        if predicted is None:          # posizione anticipata fuori tabella
+            return target, error
+        return predicted, error
+
+def planned_azimuth(predictor, telrep, azm, target, tolerance,       # pylint: disable=R0913
+                    horizon=HORIZON, models=None, offset=0.):
+    """Posizione cupola pianificata sul percorso previsto del telescopio
+
+predictor: oggetto Predictor (velocità telescopio e cupola)
+telrep:    posizione telescopio (ha, de, lato)
+azm:       azimut attuale della cupola
+target:    azimut obiettivo attuale
+tolerance: errore massimo ammesso lungo il percorso (gradi)
+
+Riporta l'azimut da comandare: quello che mantiene l'obiettivo entro la
+tolleranza per il tempo più lungo a partire dall'arrivo della cupola"""
+    ha_h, de_d, side = telrep
+    def azfunc(elapsed):
+        "Azimut obiettivo previsto dopo elapsed secondi"
+        pha, pde = predictor.predict(ha_h, de_d, elapsed)
+        azd = dome_azimuth(pha, pde, side, models)[0]
+        return None if azd is None else azd+offset
+    path = sample_path(azfunc, predictor.lead_time(azm, target), horizon, STEP)
+    found = segment(path, tolerance)
+    return target if found is None else found[1]%360.
+
+class TrackerCore(Thread):                  # pylint: disable=R0902
+    """
+Acquisizione dati telescopio/cupola e controllo cupola con loop di eventi asyncio
+
+config:       dizionario di configurazione (vedi configdata.py). Chiavi opzionali:
+              dome_model: "table" (default) o "analytic" (vedi domemodel.py)
+              dome_geometry: dizionario con i parametri geometrici di DomeModel
+              dome_predict: True per puntamento anticipato (vedi Predictor)
+              dome_speed: velocità iniziale cupola (gradi/sec)
+              dome_schedule: True per pianificazione dei movimenti
+                             (vedi planned_azimuth)
+dome_factory: funzione senza argomenti che riporta l'oggetto cupola
+              (default: open_dome con l'identificatore ASCOM in configurazione)
+keepalive:    mantiene aperta la connessione con il telescopio
+"""
+    def __init__(self, config, dome_factory=None, keepalive=False):
+        Thread.__init__(self, daemon=True)
+        self.tel = AsyncTeleCommunicator(config["tel_ip"], config["tel_port"],
+                                         keepalive=keepalive)
+        self.period = config["repeat"]
+        self.dome_maxerr = config["dome_maxerr"]
+        self.dome_crit = config["dome_critical"]
+        self.park_position = config["park_position"]
+        self.dome_model = config.get("dome_model", TABLE_MODEL)
+        if self.dome_model == ANALYTIC_MODEL:
+            geometry = config.get("dome_geometry", {})
+            self._models = {BR_EAST: DomeModel("e", **geometry),
+                            BR_WEST: DomeModel("w", **geometry)}
+        else:
+            self._models = None
+        self._schedule = config.get("dome_schedule", False)
+        if config.get("dome_predict", False) or self._schedule:
+            self._predictor = Predictor(self.period, config.get("dome_speed", DOME_SPEED))
+        else:
+            self._predictor = None
+        self.slew_count = 0
+        self.track_time = 0.
+        self.out_time = 0.
+        self._last_step = None
+        self.logname = os.path.join(HOMEDIR, time.strftime("%Y-%m-%d-dtracker.log"))
+        self.states = queue.Queue()
+        self._commands = queue.Queue()
+        if dome_factory is None:
+            dome_factory = lambda: open_dome(config["dome_ascom"])
+        self._dome_factory = dome_factory
+        self._dome = None
+        self._dome_exec = ThreadPoolExecutor(max_workers=1)
+        self._loop = None
+        self._wake = None
+        self._goon = True
+        self._slave = False
+        self._offset = 0.0
+        self._target_az = None
+        self._at_target = False
+        self._info = ""
+        self._logfile = None
+
+    def _dome_do(self, name, args):
+        "Accesso a cupola (eseguito nel thread della cupola)"
+        if self._dome is None:
+            self._dome = self._dome_factory()
+        value = getattr(self._dome, name)
+        if callable(value):
+            return value(*args)
+        return value
+
+    def dome_call(self, name, *args):
+        """Esegue metodo o legge attributo della cupola
+
+Non blocca: riporta un oggetto concurrent.futures.Future"""
+        return self._dome_exec.submit(self._dome_do, name, args)
+
+    async def _dome_cmd(self, name, *args):
+        "Invia comando alla cupola dal thread di controllo"
+        if args:
+            self.log_mark("CMD %s(%s)"%(name, ", ".join("%.2f"%x for x in args)))
+        else:
+            self.log_mark("CMD "+name)
+        try:
+            await self._loop.run_in_executor(self._dome_exec, self._dome_do, name, args)
+        except Exception as excp:              # pylint: disable=W0703
+            self._info = "ERR: comando cupola %s - %s"%(name, str(excp))
+            self.log_mark(self._info)
+
+    def _read_dome(self):
+        "Legge stato cupola (eseguito nel thread della cupola)"
+        try:
+            azm = self._dome_do("Azimuth", ())
+            slw = self._dome_do("Slewing", ())
+        except Exception as excp:              # pylint: disable=W0703
+            return None, str(excp)
+        return (azm, slw), ""
+
+    async def _read_tel(self):
+        "Legge posizione telescopio"
+        reply = await self.tel.query_many(TEL_QUERY)
+        if any(value is None for value, _unused in reply):
+            await asyncio.sleep(TEL_RETRY)
+            reply = await self.tel.query_many(TEL_QUERY)
+        (ha_h, _unused), (de_d, _unused), (side, _unused) = reply
+        if ha_h is None or de_d is None or not side:
+            return None
+        return ha_h, de_d, side[0]
+
+    async def poll(self):
+        "Interroga contemporaneamente telescopio e cupola"
+        telrep, (domerep, error) = await asyncio.gather(
+            self._read_tel(),
+            self._loop.run_in_executor(self._dome_exec, self._read_dome))
+        return telrep, domerep, error
+
+######################################################## Logging
+
+    def log_mark(self, text):
+        "Inserisce un commento nel logfile"
+        if self._logfile is None:
+            return
+        print("# %.2f -"%time.time(), text, file=self._logfile)
+
+    def _start_logger(self):
+        "Abilita logging dei dati"
+        if self._logfile is not None:
+            return
+        self._logfile = open(self.logname, "a")
+        self.log_mark("Log attivato - "+time.strftime("%Y-%m-%d %H:%M:%S"))
+        self.log_mark("Periodo aggiornamento: %d (ms)"%int(self.period*1000))
+        self.log_mark("Max errore di tracking: %.2f (gradi)"%self.dome_maxerr)
+        self.log_mark("Zona critica tracking %.2f (gradi)"%self.dome_crit)
+        self.log_mark("Modello posizione cupola: "+self.dome_model)
+        self.log_mark("Puntamento anticipato: "+("SI" if self._predictor else "NO"))
+        self.log_mark("Pianificazione movimenti: "+("SI" if self._schedule else "NO"))
+        self.log_mark("tempo slewing posizione obiettivo   HA    DEC   lato")
+
+    def _stop_logger(self):
+        "Disabilita logging dei dati"
+        if self._logfile is not None:
+            self.log_mark("Log disattivato - "+time.strftime("%Y-%m-%d %H:%M:%S"))
+            self._logfile.close()
+        self._logfile = None
+
+    def _log(self, tstamp, slw, azm, tgtz, telrep):
+        "data logger"
+        if self._logfile is None:
+            return
+        sslw = 1 if slw else 0
+        if telrep is None:
+            telrep = (FLOAT_NAN, FLOAT_NAN, "_")
+        hang, dec, side = telrep
+        try:
+            print("%.2f %d %.2f %.2f %f %f %s"%(tstamp, sslw, azm,
+                                                tgtz, hang, dec, side), file=self._logfile)
+        except TypeError as excp:
+            self.log_mark("ERROR: "+str(excp))
+
+######################################################## Comandi (eseguiti nel thread di controllo)
+
+    async def _cmd_slave(self, enable):
+        "Attiva/disattiva inseguimento telescopio"
+        self._target_az = None
+        if enable:
+            self.log_mark("START inseguimento")
+            self.slew_count = 0
+            self.track_time = 0.
+            self.out_time = 0.
+            self._slave = True
+            self._info = "Inseguimento attivo"
+        else:
+            self.log_mark("STOP inseguimento")
+            self.log_mark(self.tracking_stats())
+            self._slave = False
+            await self._dome_cmd("AbortSlew")
+            self._info = "Inseguimento sospeso"
+
+    async def _cmd_offset(self, offset):
+        "Imposta offset posizione cupola"
+        self._offset = offset
+
+    async def _cmd_goto(self, azimuth):
+        "Imposta posizione obiettivo (None: annulla)"
+        if self._slave:
+            return
+        if azimuth is None:
+            self.log_mark("Annulla goto")
+        else:
+            self.log_mark("GOTO %.2f"%azimuth)
+        self._target_az = azimuth
+
+    async def _cmd_park(self):
+        "Ritorna in posizione park"
+        if self._slave:
+            return
+        self._target_az = None
+        await self._dome_cmd("AbortSlew")
+        self._target_az = self.park_position
+        self.log_mark("CMD Park at %d"%self._target_az)
+
+    async def _cmd_sync(self, azimuth):
+        "Sincronizza posizione cupola"
+        if self._slave:
+            return
+        self._target_az = None
+        await self._dome_cmd("AbortSlew")
+        await self._dome_cmd("SyncToAzimuth", azimuth)
+
+    async def _cmd_logger(self, enable):
+        "Abilita/disabilita logging"
+        if enable:
+            self._start_logger()
+        else:
+            self._stop_logger()
+
+    async def _cmd_terminate(self, dispose):
+        "Termina controllo"
+        await self._dome_cmd("AbortSlew")
+        if dispose:
+            await self._dome_cmd("Dispose")
+        self._info = "Termina applicazione"
+        self._stop_logger()
+        self._goon = False
+
+    def tracking_stats(self):
+        "Riporta statistiche dell'inseguimento in corso (o dell'ultimo)"
+        if self.track_time > 0:
+            outp = 100.*self.out_time/self.track_time
+        else:
+            outp = 0.
+        return "Comandi SlewToAzimuth: %d in %.0f sec - fuori tolleranza: %.1f%%"%(
+            self.slew_count, self.track_time, outp)
+
+    def _post(self, name, *args):
+        "Accoda comando per il thread di controllo"
+        self._commands.put((name, args))
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def set_slave(self, enable):
+        "Attiva/disattiva inseguimento telescopio"
+        self._post("_cmd_slave", enable)
+
+    def set_offset(self, offset):
+        "Imposta offset posizione cupola (gradi)"
+        self._post("_cmd_offset", offset)
+
+    def goto(self, azimuth):
+        "Imposta posizione obiettivo cupola (gradi, None: annulla)"
+        self._post("_cmd_goto", azimuth)
+
+    def park(self):
+        "Muove cupola in posizione park"
+        self._post("_cmd_park")
+
+    def sync(self, azimuth):
+        "Sincronizza posizione cupola (gradi)"
+        self._post("_cmd_sync", azimuth)
+
+    def set_logger(self, enable):
+        "Abilita/disabilita logging"
+        self._post("_cmd_logger", enable)
+
+    def terminate(self, dispose=False):
+        "Termina controllo (dispose: rilascia oggetto cupola)"
+        self._post("_cmd_terminate", dispose)
+
+    async def _do_commands(self):
+        "Esegue i comandi accodati"
+        while True:
+            try:
+                name, args = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            await getattr(self, name)(*args)
+
+######################################################## Ciclo di controllo
+
+    async def move_dome(self, target, azm, slw, telrep=None):
+        "Movimento cupola (telrep: posizione telescopio, per la pianificazione)"
+        if (target is None) or slw:
+            return
+        if self._schedule and telrep is not None:
+            mod_target, self._at_target = dome_command(target, azm, self.dome_maxerr)
+            if mod_target is not None:
+                mod_target = planned_azimuth(self._predictor, telrep, azm, target,
+                                             self.dome_maxerr*SCHED_MARGIN,
+                                             models=self._models, offset=self._offset)
+        else:
+            # Con puntamento anticipato la correzione in zona critica non serve
+            critical = self.dome_crit if self._predictor is None else None
+            mod_target, self._at_target = dome_command(target, azm, self.dome_maxerr, critical)
+        if mod_target is not None:
+            self.slew_count += 1
+            await self._dome_cmd("SlewToAzimuth", mod_target)
+
+    def _dome_target(self, telrep, domerep):
+        "Calcola posizione obiettivo cupola. Riporta (azimut, errore)"
+        if self._predictor is None:
+            return dome_azimuth(*telrep, models=self._models)
+        azm = None if domerep is None else domerep[0]
+        return self._predictor.target(*telrep, azm, models=self._models)
+
+    def _count(self, tstamp, valid):
+        "Aggiorna statistiche di inseguimento"
+        if self._last_step is not None and self._slave and valid:
+            dtime = tstamp-self._last_step
+            self.track_time += dtime
+            if not self._at_target:
+                self.out_time += dtime
+        self._last_step = tstamp
+
+    async def step(self):
+        "Esegue un ciclo di acquisizione e controllo. Riporta lo stato"
+        await self._do_commands()
+        tstamp = simclock.now()
+        if not self._goon:
+            return State(tstamp, None, None, None, False, False, False, self._info)
+        telrep, domerep, dome_error = await self.poll()
+        if self._predictor is not None:
+            if telrep is not None:
+                self._predictor.update_telescope(tstamp, *telrep)
+            if domerep is not None:
+                self._predictor.update_dome(tstamp, *domerep)
+        if telrep is None:
+            self._info = "Attesa comunicazione con telescopio"
+        elif self._slave:
+            self._target_az, error = self._dome_target(telrep, domerep)
+            if self._target_az is None:
+                self._info = error
+                self.log_mark(error)
+            else:
+                self._target_az += self._offset
+                self._info = ""
+        if domerep is None:
+            azm, slw = FLOAT_NAN, False
+            self._info = "ERR: comunicazione con cupola interrotta"
+            self.log_mark(self._info+" - "+dome_error)
+            self._at_target = False
+        else:
+            azm, slw = domerep
+            await self.move_dome(self._target_az, azm, slw,
+                                 telrep if self._slave else None)
+        if self._target_az is not None:
+            self._log(tstamp, slw, azm, self._target_az, telrep)
+        self._count(tstamp, telrep is not None and domerep is not None)
+        return State(tstamp, telrep, domerep, self._target_az, self._at_target,
+                     self._slave, self._logfile is not None, self._info)
+
+    async def _abort(self, excp):
+        """Terminazione per errore: ferma (e nel caso simulato rilascia) la cupola e
+pubblica lo stato finale con il messaggio di errore"""
+        traceback.print_exc()
+        error = "ERR: controllo terminato - %s: %s"%(type(excp).__name__, str(excp))
+        self.log_mark(error)
+        await self._cmd_terminate(SIMULATED_ASCOM)
+        self._info = error
+        self.states.put(State(simclock.now(), None, None, None, False, False, False, error))
+
+    async def _run(self):
+        "Ciclo di acquisizione e controllo"
+        try:
+            while self._goon:
+                tm0 = self._loop.time()
+                self._wake.clear()
+                self.states.put(await self.step())
+                if not self._goon:
+                    break
+                delay = max(0., self.period-(self._loop.time()-tm0))
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as excp:              # pylint: disable=W0703
+            await self._abort(excp)
+        finally:
+            try:
+                await self.tel.close()
+            finally:
+                self._dome_exec.shutdown(wait=True)
+
+    def latest(self):
+        "Riporta lo stato più recente disponibile (None se non ci sono nuovi stati)"
+        state = None
+        while True:
+            try:
+                state = self.states.get_nowait()
+            except queue.Empty:
+                return state
+
+    def run(self):
+        "Lancia loop di eventi"
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        if self._models is None:             # Caricamento tabelle nel thread di controllo
+            get_interpolator(BR_EAST)
+            get_interpolator(BR_WEST)
+        self._wake = asyncio.Event()
+        self._loop = loop
+        loop.run_until_complete(self._run())
+        loop.close()
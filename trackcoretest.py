@@ -0,0 +1,141 @@
+"""
+Test del ciclo di controllo di trackcore.TrackerCore
+
+Esegue il thread di controllo con inseguimento attivo (set_slave(True))
+per alcuni cicli, con telescopio e cupola simulati internamente (senza
+simulatore né server ASCOM), per ciascuna configurazione del calcolo
+della posizione cupola (tabelle, modello analitico, puntamento anticipato,
+pianificazione dei movimenti), e verifica che:
+
+  - ogni ciclo (TrackerCore.step()) calcoli la posizione obiettivo della
+    cupola e invii i comandi di movimento
+  - il thread termini regolarmente dopo terminate()
+  - in caso di errore nel ciclo il thread termini chiudendo telescopio e
+    cupola e pubblichi uno stato finale con il messaggio di errore
+
+Uso:
+      python trackcoretest.py
+"""
+
+import sys
+import queue
+
+from trackcore import TrackerCore, BR_EAST
+
+PERIOD = 0.05
+NSTEPS = 10
+TIMEOUT = 5.
+
+CONFIGS = (("tabelle", {}),
+           ("modello analitico", {"dome_model": "analytic"}),
+           ("puntamento anticipato", {"dome_predict": True}),
+           ("pianificazione", {"dome_schedule": True}))
+
+BASE_CONFIG = {"tel_ip": "127.0.0.1", "tel_port": 0, "repeat": PERIOD, "dome_maxerr": 2.,
+               "dome_critical": 5., "park_position": 0., "dome_ascom": ""}
+
+class FakeTel:
+    "Telescopio simulato in tracking (sostituisce AsyncTeleCommunicator)"
+    def __init__(self):
+        self.ha_h = 2.
+        self.closed = False
+
+    async def query_many(self, _names):
+        "Riporta angolo orario, declinazione e lato"
+        self.ha_h += 0.001
+        return [(self.ha_h, ""), (30., ""), (BR_EAST, "")]
+
+    async def close(self):
+        "Chiusura"
+        self.closed = True
+
+class BrokenTel(FakeTel):
+    "Telescopio simulato che genera un errore alla terza interrogazione"
+    async def query_many(self, names):
+        "Errore alla terza interrogazione"
+        if self.ha_h > 2.0025:
+            raise RuntimeError("errore simulato")
+        return await FakeTel.query_many(self, names)
+
+class FakeDome:                          # pylint: disable=C0103
+    "Cupola simulata (sostituisce l'oggetto ASCOM)"
+    def __init__(self):
+        self.Azimuth = 0.
+        self.Slewing = False
+        self.commands = []
+
+    def SlewToAzimuth(self, azimuth):    # pylint: disable=C0103
+        "Movimento (istantaneo)"
+        self.commands.append("SlewToAzimuth")
+        self.Azimuth = azimuth
+
+    def AbortSlew(self):                 # pylint: disable=C0103
+        "Interrompe movimento"
+        self.commands.append("AbortSlew")
+
+def run_core(name, extra):
+    "Esegue il ciclo di controllo con la configurazione data. Riporta numero di errori"
+    dome = FakeDome()
+    core = TrackerCore(dict(BASE_CONFIG, **extra), lambda: dome)
+    core.tel = FakeTel()
+    core.start()
+    core.set_slave(True)
+    nerr = 0
+    states = []
+    try:
+        while len(states) < NSTEPS:
+            states.append(core.states.get(timeout=TIMEOUT))
+    except queue.Empty:
+        print("ERRORE (%s): %d stati ricevuti su %d"%(name, len(states), NSTEPS))
+        nerr += 1
+    core.terminate()
+    core.join(TIMEOUT)
+    tracking = [state for state in states if state.slave]
+    if not tracking or any(state.target_az is None for state in tracking):
+        print("ERRORE (%s): posizione obiettivo non calcolata: %s"%(name, states[-1:]))
+        nerr += 1
+    if "SlewToAzimuth" not in dome.commands:
+        print("ERRORE (%s): nessun comando di movimento alla cupola"%name)
+        nerr += 1
+    if core.is_alive() or not core.tel.closed:
+        print("ERRORE (%s): thread di controllo non terminato correttamente"%name)
+        nerr += 1
+    print("%-22s %s"%(name+":", "OK" if not nerr else "%d errori"%nerr))
+    return nerr
+
+def run_broken():
+    "Esegue il ciclo di controllo con errore del telescopio. Riporta numero di errori"
+    name = "errore nel ciclo"
+    dome = FakeDome()
+    core = TrackerCore(BASE_CONFIG, lambda: dome)
+    core.tel = BrokenTel()
+    core.start()
+    core.set_slave(True)
+    core.join(TIMEOUT)
+    nerr = 0
+    state = core.latest()
+    if core.is_alive() or not core.tel.closed:
+        print("ERRORE (%s): thread di controllo non terminato correttamente"%name)
+        nerr += 1
+    if state is None or not state.info.startswith("ERR: controllo terminato"):
+        print("ERRORE (%s): stato finale errato: %s"%(name, state))
+        nerr += 1
+    if "AbortSlew" not in dome.commands:
+        print("ERRORE (%s): cupola non fermata"%name)
+        nerr += 1
+    print("%-22s %s"%(name+":", "OK" if not nerr else "%d errori"%nerr))
+    return nerr
+
+def main():
+    "Procedura di test"
+    if "-h" in sys.argv:
+        print(__doc__)
+        sys.exit()
+    nerr = 0
+    for name, extra in CONFIGS:
+        nerr += run_core(name, extra)
+    nerr += run_broken()
+    sys.exit(1 if nerr else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Simulazione dell'inseguimento della cupola (senza telescopio e cupola)
+
+Simula l'inseguimento di un oggetto a declinazione costante per la durata
+specificata e confronta le strategie di controllo della cupola:
+
+  current:  obiettivo = posizione attuale del telescopio, con correzione
+            in zona critica (modo standard di dtracker)
+  predict:  obiettivo = posizione anticipata (vedi trackcore.Predictor)
+  schedule: movimenti pianificati sul percorso previsto del telescopio
+            (vedi trackcore.planned_azimuth)
+
+Per ciascuna strategia riporta il numero di comandi SlewToAzimuth,
+la frazione del tempo con errore di posizione superiore alla tolleranza
+e la frazione del tempo con cupola in movimento (duty cycle).
+
+Con l'opzione -r riporta invece il piano dei movimenti calcolato sul
+percorso completo (senza simulazione del ciclo di controllo).
+
+Uso:
+      python tracksim.py [-a ha] [-d de] [-t ore] [-s vel] [-p per] [-e err] [-c crit] [-m] [-r]
+
+dove:
+      -a  Angolo orario iniziale (ore, default: -3)
+      -d  Declinazione (gradi, default: 30)
+      -t  Durata (ore, default: 6)
+      -s  Velocità cupola (gradi/sec, default: 2)
+      -p  Periodo di aggiornamento (sec, default: da configurazione)
+      -e  Errore massimo (gradi, default: da configurazione)
+      -c  Ampiezza zona critica (gradi, default: da configurazione)
+      -m  Usa il modello geometrico invece delle tabelle
+      -r  Rapporto del piano dei movimenti (dry-run)
+
+Il lato del telescopio è E per angolo orario positivo, W altrimenti
+(il cambio di lato al meridiano non viene simulato)
+"""
+
+import sys
+import math
+
+import configdata
+from interpolator import az_delta
+from domemodel import DomeModel
+from domesched import plan_moves, sample_path, duty_cycle, STEP
+from trackcore import dome_azimuth, dome_command, Predictor, SIDEREAL_RATE, DOME_SPEED
+from trackcore import planned_azimuth, BR_EAST, BR_WEST, SCHED_MARGIN
+
+SIM_STEP = 0.1             # Passo di integrazione (sec)
+HA_RESOLUTION = 1./3600.   # Risoluzione lettura angolo orario (ore)
+DOME_RESOLUTION = 0.1      # Precisione posizionamento cupola (gradi)
+
+CURRENT = "current"
+PREDICT = "predict"
+SCHEDULE = "schedule"
+
+class SimDome:                    # pylint: disable=R0903
+    "Cupola simulata a velocità costante"
+    def __init__(self, azimuth, speed):
+        self.azimuth = azimuth
+        self.target = azimuth
+        self.speed = speed
+        self.slewing = False
+
+    def step(self, dtime):
+        "Avanza di dtime secondi"
+        delta = az_delta(self.azimuth, self.target)
+        move = self.speed*dtime
+        if abs(delta) <= max(move, DOME_RESOLUTION):
+            if self.slewing:
+                self.azimuth = self.target
+            self.slewing = False
+            return
+        self.slewing = True
+        self.azimuth = (self.azimuth+math.copysign(move, delta))%360.
+
+class Simulation:                 # pylint: disable=R0902
+    """
+Simulazione di una notte di inseguimento
+
+pars: dizionario con i parametri (chiavi: ha, de, hours, speed, period,
+      maxerr, critical, models)
+"""
+    def __init__(self, pars):
+        self.pars = pars
+        self.side = BR_EAST if pars["ha"] >= 0 else BR_WEST
+
+    def telescope(self, elapsed):
+        "Posizione telescopio dopo elapsed secondi"
+        return self.pars["ha"]+SIDEREAL_RATE*elapsed, self.pars["de"]
+
+    def true_target(self, elapsed):
+        "Posizione obiettivo esatta"
+        ha_h, de_d = self.telescope(elapsed)
+        return dome_azimuth(ha_h, de_d, self.side, self.pars["models"])[0]
+
+    def controller(self, mode):
+        "Riporta funzione di controllo (elapsed, cupola) -> comando o None"
+        pars = self.pars
+        if mode in (PREDICT, SCHEDULE):
+            predictor = Predictor(pars["period"], DOME_SPEED)
+        else:
+            predictor = None
+        def control(elapsed, dome):
+            "Funzione di controllo"
+            ha_h, de_d = self.telescope(elapsed)
+            ha_h = round(ha_h/HA_RESOLUTION)*HA_RESOLUTION
+            if predictor is None:
+                target = dome_azimuth(ha_h, de_d, self.side, pars["models"])[0]
+                critical = pars["critical"]
+            elif mode == SCHEDULE:
+                predictor.update_telescope(elapsed, ha_h, de_d, self.side)
+                predictor.update_dome(elapsed, dome.azimuth, dome.slewing)
+                target = predictor.target(ha_h, de_d, self.side, dome.azimuth,
+                                          pars["models"])[0]
+                if target is None or dome.slewing:
+                    return None
+                command = dome_command(target, dome.azimuth, pars["maxerr"])[0]
+                if command is None:
+                    return None
+                return planned_azimuth(predictor, (ha_h, de_d, self.side), dome.azimuth,
+                                       target, pars["maxerr"]*SCHED_MARGIN,
+                                       models=pars["models"])
+            else:
+                predictor.update_telescope(elapsed, ha_h, de_d, self.side)
+                predictor.update_dome(elapsed, dome.azimuth, dome.slewing)
+                target = predictor.target(ha_h, de_d, self.side, dome.azimuth,
+                                          pars["models"])[0]
+                critical = None
+            if target is None or dome.slewing:
+                return None
+            return dome_command(target, dome.azimuth, pars["maxerr"], critical)[0]
+        return control
+
+    def run(self, control):
+        "Esegue simulazione. Riporta (n. comandi, frazione fuori tolleranza, duty cycle)"
+        pars = self.pars
+        duration = pars["hours"]*3600.
+        start = self.true_target(0.)
+        if start is None:
+            return None
+        dome = SimDome(start, pars["speed"])
+        ncmds = 0
+        out_time = 0.
+        slew_time = 0.
+        valid_time = 0.
+        next_cycle = 0.
+        nstep = int(duration/SIM_STEP)
+        for istep in range(nstep):
+            elapsed = istep*SIM_STEP
+            if elapsed >= next_cycle:
+                next_cycle += pars["period"]
+                command = control(elapsed, dome)
+                if command is not None:
+                    dome.target = command
+                    ncmds += 1
+            dome.step(SIM_STEP)
+            target = self.true_target(elapsed+SIM_STEP)
+            if target is None:
+                continue
+            valid_time += SIM_STEP
+            if dome.slewing:
+                slew_time += SIM_STEP
+            if abs(az_delta(dome.azimuth, target)) > pars["maxerr"]:
+                out_time += SIM_STEP
+        if valid_time == 0:
+            return None
+        return ncmds, out_time/valid_time, slew_time/valid_time
+
+    def report(self):
+        "Stampa il piano dei movimenti sul percorso completo"
+        pars = self.pars
+        duration = pars["hours"]*3600.
+        path = sample_path(self.true_target, 0., duration, STEP)
+        moves = plan_moves(path, pars["maxerr"]*SCHED_MARGIN)
+        if not moves:
+            print("Oggetto sotto l'orizzonte")
+            return
+        print("Inizio(min)  Fine(min)  Azimut(gradi)  Durata(min)")
+        for tstart, tend, azm in moves:
+            print("%11.1f  %9.1f  %13.2f  %11.1f"%(tstart/60., tend/60., azm,
+                                                   (tend-tstart)/60.))
+        print()
+        print("Movimenti previsti: %d - durata media posizione: %.1f min - "
+              "duty cycle: %.2f%%"%(len(moves), duration/len(moves)/60.,
+                                    duty_cycle(moves, path[0][1] or moves[0][2],
+                                               pars["speed"], duration)*100.))
+
+def get_arg(flag, default):
+    "Legge valore numerico di un'opzione"
+    if flag in sys.argv:
+        return float(sys.argv[sys.argv.index(flag)+1])
+    return default
+
+def get_pars():
+    "Parametri della simulazione da linea di comando e configurazione"
+    config = configdata.get_config() or configdata.DEFAULT_CONFIG
+    pars = {"ha": get_arg("-a", -3.), "de": get_arg("-d", 30.),
+            "hours": get_arg("-t", 6.), "speed": get_arg("-s", DOME_SPEED),
+            "period": get_arg("-p", config["repeat"]),
+            "maxerr": get_arg("-e", config["dome_maxerr"]),
+            "critical": get_arg("-c", config["dome_critical"]),
+            "models": None}
+    if "-m" in sys.argv:
+        pars["models"] = {BR_EAST: DomeModel("e"), BR_WEST: DomeModel("w")}
+    return pars
+
+def main():
+    "Procedura di simulazione"
+    if "-h" in sys.argv:
+        print(__doc__)
+        sys.exit()
+    pars = get_pars()
+    sim = Simulation(pars)
+    print("HA iniziale: %.2f ore, DEC: %.2f gradi, durata: %.1f ore, lato: %s"%(
+        pars["ha"], pars["de"], pars["hours"], sim.side))
+    print("Velocità cupola: %.2f gradi/sec, periodo: %.1f sec, errore max: %.2f gradi, "
+          "zona critica: %.2f gradi"%(pars["speed"], pars["period"], pars["maxerr"],
+                                      pars["critical"]))
+    print()
+    if "-r" in sys.argv:
+        sim.report()
+        return
+    print("Modo       Comandi  Fuori tolleranza  Duty cycle")
+    for mode in (CURRENT, PREDICT, SCHEDULE):
+        result = sim.run(sim.controller(mode))
+        if result is None:
+            print("%-9s  oggetto sotto l'orizzonte"%mode)
+            break
+        print("%-9s  %7d  %15.1f%%  %9.1f%%"%(mode, result[0], result[1]*100., result[2]*100.))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Confronto fra le versioni scalari e vettoriali delle funzioni di astro.py
+
+Per ciascuna funzione (az_coords, eq_coords, jul_date, loc_st) misura il tempo
+di calcolo su N punti casuali con il ciclo di chiamate alla versione scalare
+e con la versione vettoriale (numpy), e riporta il fattore di accelerazione e
+la differenza massima fra i risultati.
+
+Uso:
+      python vectortest.py [-n num]
+
+dove:
+      -n  Numero di punti (default: 1000000)
+"""
+
+import sys
+import time
+import random
+
+import astro
+
+NPOINTS = 1000000
+
+def get_arg(flag, default):
+    "Legge valore numerico di un'opzione"
+    if flag in sys.argv:
+        return float(sys.argv[sys.argv.index(flag)+1])
+    return default
+
+def compare(name, scalar, vector, args):
+    """
+Confronta funzione scalare e vettoriale
+
+args: liste di argomenti (una per argomento posizionale)
+Riporta (tempo scalare, tempo vettoriale, differenza massima)"""
+    import numpy as np                           # pylint: disable=C0415
+    tm0 = time.perf_counter()
+    sres = [scalar(*arg) for arg in zip(*args)]
+    tscal = time.perf_counter()-tm0
+    arrays = [np.array(arg) for arg in args]
+    tm0 = time.perf_counter()
+    vres = vector(*arrays)
+    tvect = time.perf_counter()-tm0
+    if isinstance(vres, tuple):
+        sres = list(zip(*sres))
+    else:
+        sres, vres = (sres,), (vres,)
+    maxdiff = max(float(np.max(np.abs(np.array(sval)-vval))) for sval, vval in zip(sres, vres))
+    print("%-10s %12.3f %12.3f %10.1f %14.3g"%(name, tscal*1.E6/len(args[0]),
+                                               tvect*1.E6/len(args[0]), tscal/tvect, maxdiff))
+
+def main():
+    "Procedura di confronto"
+    if "-h" in sys.argv:
+        print(__doc__)
+        sys.exit()
+    if not astro.HAS_NUMPY:
+        print("Il confronto richiede numpy")
+        sys.exit(1)
+    npoints = int(get_arg("-n", NPOINTS))
+    print("Punti: %d"%npoints)
+    print()
+    print("Funzione   scal.(us/p.) vett.(us/p.)  accelerazione  differenza max")
+    ha_rad = [random.uniform(-astro.pi, astro.pi) for _ in range(npoints)]
+    de_rad = [random.uniform(-0.7, 1.55) for _ in range(npoints)]
+    compare("az_coords", astro.az_coords, astro.az_coords_many, (ha_rad, de_rad))
+    az_rad, el_rad = zip(*[astro.az_coords(ha, de) for ha, de in zip(ha_rad, de_rad)])
+    compare("eq_coords", astro.eq_coords, astro.eq_coords_many, (az_rad, el_rad))
+    tm0 = time.time()
+    tstamps = [tm0+random.uniform(0., 3.E8) for _ in range(npoints)]
+    fields = [list(time.localtime(tstamp)[:6]) for tstamp in tstamps]
+    times = list(zip(*fields))
+    offsets = [random.choice((0, 1, 2)) for _ in range(npoints)]
+    compare("jul_date", astro.jul_date, astro.jul_date_many, times+[offsets])
+    lons = [astro.OPC.lon_rad]*npoints
+    compare("loc_st", astro.loc_st, astro.loc_st_many, times+[offsets, lons])
+
+if __name__ == "__main__":
+    main()